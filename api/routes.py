@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 import json
 from datetime import datetime
@@ -9,9 +10,10 @@ from fastapi.responses import StreamingResponse
 
 from model.models import (
     DocumentResponse, DocumentListResponse, ChatRequest, ChatResponse, ChatStreamResponse,
-    AuditLogResponse, UploadResponse, ErrorResponse, BatchDeleteResponse, BatchUploadResponse
+    AuditLogResponse, UploadResponse, ErrorResponse, BatchDeleteResponse, BatchUploadResponse, CacheSource
 )
-from service.knowledge_base_service import KnowledgeBaseService
+from service.knowledge_base_service import KnowledgeBaseService, DocumentStateError
+from utils.file_utils import FileTooLargeError
 
 logger = logging.getLogger(__name__)
 
@@ -20,70 +22,99 @@ class APIRoutes:
     def __init__(self, knowledge_base_service: KnowledgeBaseService):
         self.knowledge_base_service = knowledge_base_service
 
-    async def upload_file(self, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    async def upload_file(self, background_tasks: BackgroundTasks, file: UploadFile = File(...), dedup: str = None):
         """
         Upload file text và process thành embeddings
         
         - **file**: File text (.txt, .md, .csv, .json, .pdf) để upload
         - **max_size**: 10MB
+        - **dedup**: off | reuse | link (default: settings.upload_dedup_mode)
         """
         try:
             # Validate file
             if not file.filename:
                 raise HTTPException(status_code=400, detail="No file provided")
             
-            # Get file size
-            file_size = 0
-            content = await file.read()
-            file_size = len(content)
-            
-            from config.settings import settings
-            from utils.file_utils import create_upload_directory, generate_safe_filename, get_file_path
-            
-            # Create file in uploads directory
-            create_upload_directory(settings.upload_dir)
-            
-            # Generate unique filename
-            safe_filename = generate_safe_filename(file.filename)
-            file_path = get_file_path(settings.upload_dir, safe_filename)
-            
-            # Write file
-            with open(file_path, "wb") as f:
-                f.write(content)
-            
-            try:
-                # Process file
-                document = await self.knowledge_base_service.upload_file(
-                    file_path, file.filename, file_size
-                )
-                
-                return UploadResponse(
-                    file_id=document.id,
-                    filename=document.filename,
-                    status=document.status,
-                    message="File uploaded successfully and processing started",
-                    file_size=document.file_size
-                )
-                
-            finally:
-                pass
-                # Clean up temporary file (optional - comment out to keep files)
-                # if os.path.exists(temp_file_path):
-                #     os.unlink(temp_file_path)
+            return await self._store_upload(file, dedup)
                     
+        except HTTPException:
+            raise
+        except FileTooLargeError as e:
+            # Same status as the Content-Length check in main.py
+            raise HTTPException(status_code=413, detail=str(e))
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error uploading file: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
-    async def upload_multiple_files(self, background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
+    async def _store_upload(self, file: UploadFile, dedup: str = None) -> UploadResponse:
+        """Validate, stream file xuống disk và đăng ký document - ValueError nếu file không hợp lệ"""
+        from config.settings import settings
+        from utils.file_utils import (
+            create_upload_directory, generate_safe_filename, get_file_path, save_upload_file, delete_file_safely
+        )
+        
+        if not file.filename:
+            raise ValueError("No filename provided")
+        
+        # Reject unsupported types before touching the disk
+        is_valid, validation_message = await self.knowledge_base_service.file_processor.validate_file(
+            file.filename, 0
+        )
+        if not is_valid:
+            raise ValueError(validation_message)
+        
+        # Create file in uploads directory
+        create_upload_directory(settings.upload_dir)
+        
+        # Generate unique filename
+        safe_filename = generate_safe_filename(file.filename)
+        file_path = get_file_path(settings.upload_dir, safe_filename)
+        
+        # Stream file to disk, enforcing size limit and hashing in the same pass
+        file_size, content_hash = await save_upload_file(
+            file, file_path, settings.max_file_size, settings.upload_chunk_size
+        )
+        
+        try:
+            # Process file
+            document, duplicate_of = await self.knowledge_base_service.upload_file(
+                file_path, file.filename, file_size, content_hash, dedup
+            )
+            return self._upload_response(document, duplicate_of)
+        except Exception:
+            delete_file_safely(file_path)
+            raise
+
+    @staticmethod
+    def _upload_response(document, duplicate_of: UUID = None) -> UploadResponse:
+        if duplicate_of is None:
+            message = "File uploaded successfully and queued for processing"
+        elif document.id == duplicate_of:
+            message = "File already indexed, returning existing document"
+        else:
+            message = "File already indexed, linked to existing document"
+        
+        return UploadResponse(
+            file_id=document.id,
+            filename=document.filename,
+            status=document.status,
+            message=message,
+            file_size=document.file_size,
+            duplicate_of=duplicate_of
+        )
+
+    async def upload_multiple_files(self, background_tasks: BackgroundTasks, files: List[UploadFile] = File(...),
+                                    dedup: str = None, stream: bool = False):
         """
-        Upload nhiều file text và process thành embeddings
+        Upload nhiều file text và process thành embeddings (song song)
         
         - **files**: List các file text (.txt, .md, .csv, .json, .pdf) để upload
         - **max_size**: 10MB per file
         - **max_files**: 50 files per request
+        - **dedup**: off | reuse | link (default: settings.upload_dedup_mode)
+        - **stream**: trả kết quả từng file dạng NDJSON ngay khi xong (Accept: application/x-ndjson)
         """
         try:
             # Validate input
@@ -94,90 +125,38 @@ class APIRoutes:
             if len(files) > 50:
                 raise HTTPException(status_code=400, detail="Too many files. Maximum 50 files allowed per request.")
             
-            uploads = []
-            errors = []
-            successful_count = 0
-            failed_count = 0
-            
             from config.settings import settings
-            from utils.file_utils import create_upload_directory, generate_safe_filename, get_file_path
-            
-            # Create upload directory
-            create_upload_directory(settings.upload_dir)
+            semaphore = asyncio.Semaphore(settings.upload_concurrency)
             
-            for file in files:
-                try:
-                    # Validate file
-                    if not file.filename:
-                        errors.append({
-                            "filename": "unknown",
-                            "error": "No filename provided"
-                        })
-                        failed_count += 1
-                        continue
-                    
-                    # Get file size
-                    file_size = 0
-                    content = await file.read()
-                    file_size = len(content)
-                    
-                    # Validate file using FileProcessingService
-                    from service.file_processor import FileProcessingService
-                    file_processor = FileProcessingService()
-                    is_valid, validation_message = await file_processor.validate_file(file.filename, file_size)
-                    
-                    if not is_valid:
-                        errors.append({
-                            "filename": file.filename,
-                            "error": validation_message
-                        })
-                        failed_count += 1
-                        continue
-                    
-                    # Generate unique filename
-                    safe_filename = generate_safe_filename(file.filename)
-                    file_path = get_file_path(settings.upload_dir, safe_filename)
-                    
-                    # Write file
-                    with open(file_path, "wb") as f:
-                        f.write(content)
-                    
+            async def process(file: UploadFile):
+                async with semaphore:
                     try:
-                        # Process file
-                        document = await self.knowledge_base_service.upload_file(
-                            file_path, file.filename, file_size
-                        )
-                        
-                        upload_response = UploadResponse(
-                            file_id=document.id,
-                            filename=document.filename,
-                            status=document.status,
-                            message="File uploaded successfully and processing started",
-                            file_size=document.file_size
-                        )
-                        
-                        uploads.append(upload_response)
-                        successful_count += 1
-                        
+                        return file.filename, await self._store_upload(file, dedup), None
                     except Exception as e:
-                        errors.append({
-                            "filename": file.filename,
-                            "error": str(e)
-                        })
-                        failed_count += 1
-                        
-                except Exception as e:
-                    errors.append({
-                        "filename": file.filename if file.filename else "unknown",
-                        "error": str(e)
-                    })
-                    failed_count += 1
+                        return file.filename or "unknown", None, str(e)
+            
+            # Start all uploads now so they progress independently of the response consumer
+            tasks = [asyncio.create_task(process(file)) for file in files]
+            
+            if stream:
+                return StreamingResponse(
+                    self._stream_upload_results(tasks),
+                    media_type="application/x-ndjson"
+                )
+            
+            uploads = []
+            errors = []
+            for filename, upload, error in await asyncio.gather(*tasks):
+                if upload:
+                    uploads.append(upload)
+                else:
+                    errors.append({"filename": filename, "error": error})
             
             return BatchUploadResponse(
-                message=f"Batch upload completed. {successful_count} successful, {failed_count} failed",
+                message=f"Batch upload completed. {len(uploads)} successful, {len(errors)} failed",
                 total_files=len(files),
-                successful_uploads=successful_count,
-                failed_uploads=failed_count,
+                successful_uploads=len(uploads),
+                failed_uploads=len(errors),
                 uploads=uploads,
                 errors=errors
             )
@@ -188,35 +167,53 @@ class APIRoutes:
             logger.error(f"Error in batch upload: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
-    async def get_documents(self, page: int = 1, size: int = 10):
+    @staticmethod
+    async def _stream_upload_results(tasks):
+        """Yield một NDJSON line cho mỗi file theo thứ tự hoàn thành, cuối cùng là summary"""
+        successful_count = 0
+        failed_count = 0
+        for next_result in asyncio.as_completed(tasks):
+            filename, upload, error = await next_result
+            if upload:
+                successful_count += 1
+                line = {"filename": filename, "success": True, "upload": upload.model_dump(mode="json")}
+            else:
+                failed_count += 1
+                line = {"filename": filename, "success": False, "error": error}
+            yield json.dumps(line) + "\n"
+        
+        yield json.dumps({
+            "message": f"Batch upload completed. {successful_count} successful, {failed_count} failed",
+            "total_files": len(tasks),
+            "successful_uploads": successful_count,
+            "failed_uploads": failed_count
+        }) + "\n"
+
+    async def get_documents(self, size: int = 10, cursor: str = None, fields: str = None,
+                            count: str = None, page: int = None):
         """
-        Lấy danh sách documents với pagination
+        Lấy danh sách documents với cursor pagination
         
-        - **page**: Page number (default: 1)
-        - **size**: Page size (default: 10)
+        - **size**: Page size (default: 10, max: 100)
+        - **cursor**: next_cursor từ response trước
+        - **fields**: Danh sách trường, phân tách bằng dấu phẩy (default: tất cả trừ content)
+        - **count**: none | estimate | exact (default: estimate)
+        - **page**: Legacy offset pagination, chỉ dùng khi không có cursor
         """
         try:
-            documents, total = await self.knowledge_base_service.get_documents(page, size)
+            result = await self.knowledge_base_service.get_documents(size, cursor, fields, count, page)
             
             return DocumentListResponse(
-                documents=[
-                    DocumentResponse(
-                        id=doc.id,
-                        filename=doc.filename,
-                        content=doc.content,
-                        file_size=doc.file_size,
-                        metadata=doc.metadata,
-                        created_at=doc.created_at,
-                        updated_at=doc.updated_at,
-                        status=doc.status
-                    )
-                    for doc in documents
-                ],
-                total=total,
-                page=page,
-                size=size
+                documents=result["documents"],
+                total=result["total"],
+                total_is_estimate=result["total_is_estimate"],
+                size=size,
+                page=page if not cursor else None,
+                next_cursor=result["next_cursor"]
             )
             
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error getting documents: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
@@ -312,6 +309,8 @@ class APIRoutes:
             
         except HTTPException:
             raise
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid document ID")
         except Exception as e:
             logger.error(f"Error deleting document {doc_id}: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
@@ -355,22 +354,21 @@ class APIRoutes:
         - **doc_id**: Document ID
         """
         try:
-            document = await self.knowledge_base_service.get_document(doc_id)
+            document = await self.knowledge_base_service.retry_document_processing(doc_id)
             if not document:
                 raise HTTPException(status_code=404, detail="Document not found")
             
-            # Retry processing
-            await self.knowledge_base_service.file_processor._process_document_async(document)
-            
-            return {"message": "Document processing retry started"}
+            return {"message": "Document processing retry queued"}
             
         except HTTPException:
             raise
+        except DocumentStateError as e:
+            raise HTTPException(status_code=409, detail=str(e))
         except Exception as e:
             logger.error(f"Error retrying document processing {doc_id}: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
-    async def chat(self, request: ChatRequest):
+    async def chat(self, request: ChatRequest, background_tasks: BackgroundTasks):
         """
         Chat với knowledge base với performance monitoring
         """
@@ -380,28 +378,48 @@ class APIRoutes:
         start_time = time.time()
         
         try:
-            # Search relevant documents
-            relevant_docs = await self.knowledge_base_service.ai_service.search_relevant_documents(request.question)
+            ai_service = self.knowledge_base_service.ai_service
+            cache_source = None
+            
+            retrieval = {
+                "ef_search": request.ef_search, "search_mode": request.search_mode,
+                "vector_weight": request.vector_weight, "text_weight": request.text_weight
+            }
             
-            # Generate response
-            response = await self.knowledge_base_service.ai_service.generate_response(request.question, relevant_docs)
+            # Near-duplicate question already answered for the current corpus and retrieval settings
+            cached = await ai_service.find_cached_answer(request.question, **retrieval)
+            if cached:
+                response, retrieved_docs = cached["answer"], cached["retrieved_docs"]
+                cache_source = CacheSource.SEMANTIC.value
+            else:
+                # Search relevant documents
+                relevant_docs = await ai_service.search_relevant_documents(request.question, **retrieval)
+                
+                # Generate response
+                response = await ai_service.generate_response(request.question, relevant_docs)
+                # Embedding lookup + Redis writes run after the response is sent
+                background_tasks.add_task(
+                    ai_service.cache_answer, request.question, response, relevant_docs, **retrieval
+                )
+                retrieved_docs = [{"id": str(doc.id), "filename": doc.filename} for doc in relevant_docs]
             
             # Calculate latency
             latency_ms = int((time.time() - start_time) * 1000)
             chat_id = uuid4()
             
             # Log performance metrics
-            logger.info(f"Chat completed in {latency_ms}ms with {len(relevant_docs)} documents")
+            logger.info(f"Chat completed in {latency_ms}ms with {len(retrieved_docs)} documents"
+                        + (f" ({cache_source} cache hit)" if cache_source else ""))
             
             # Store audit log
             await self.knowledge_base_service.store_audit_log(
-                chat_id, request.question, response, relevant_docs, latency_ms
+                chat_id, request.question, response, retrieved_docs, latency_ms, cache_source
             )
             
             return ChatResponse(
                 chat_id=chat_id,
                 response=response,
-                retrieved_docs=[{"id": str(doc.id), "filename": doc.filename} for doc in relevant_docs]
+                retrieved_docs=retrieved_docs
             )
             
         except Exception as e:
@@ -409,7 +427,7 @@ class APIRoutes:
             logger.error(f"Error in chat after {latency_ms}ms: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
-    async def chat_stream(self, request: ChatRequest):
+    async def chat_stream(self, request: ChatRequest, background_tasks: BackgroundTasks):
         """
         Chat streaming với knowledge base
         """
@@ -421,15 +439,37 @@ class APIRoutes:
         full_response = ""
         
         try:
-            # Search relevant documents
-            relevant_docs = await self.knowledge_base_service.ai_service.search_relevant_documents(request.question)
+            ai_service = self.knowledge_base_service.ai_service
+            cache_source = None
+            relevant_docs = []
+            
+            retrieval = {
+                "ef_search": request.ef_search, "search_mode": request.search_mode,
+                "vector_weight": request.vector_weight, "text_weight": request.text_weight
+            }
+            
+            cached = await ai_service.find_cached_answer(request.question, **retrieval)
+            if cached:
+                retrieved_docs = cached["retrieved_docs"]
+                cache_source = CacheSource.SEMANTIC.value
+            else:
+                # Search relevant documents
+                relevant_docs = await ai_service.search_relevant_documents(request.question, **retrieval)
+                retrieved_docs = [{"id": str(doc.id), "filename": doc.filename} for doc in relevant_docs]
+            
+            async def cached_answer():
+                yield cached["answer"]
             
             async def generate_stream():
                 nonlocal full_response
                 
                 try:
+                    chunks = (
+                        cached_answer() if cached
+                        else ai_service.generate_streaming_response(request.question, relevant_docs)
+                    )
                     # Generate streaming response
-                    async for chunk in self.knowledge_base_service.ai_service.generate_streaming_response(request.question, relevant_docs):
+                    async for chunk in chunks:
                         full_response += chunk
                         
                         # Create streaming response
@@ -437,7 +477,7 @@ class APIRoutes:
                             chat_id=chat_id,
                             chunk=chunk,
                             is_final=False,
-                            retrieved_docs=[{"id": str(doc.id), "filename": doc.filename} for doc in relevant_docs]
+                            retrieved_docs=retrieved_docs
                         )
                         
                         yield f"data: {stream_response.model_dump_json()}\n\n"
@@ -447,17 +487,23 @@ class APIRoutes:
                         chat_id=chat_id,
                         chunk="",
                         is_final=True,
-                        retrieved_docs=[{"id": str(doc.id), "filename": doc.filename} for doc in relevant_docs]
+                        retrieved_docs=retrieved_docs
                     )
                     
                     yield f"data: {final_response.model_dump_json()}\n\n"
                     
                     # Calculate latency and store audit log
                     latency_ms = int((time.time() - start_time) * 1000)
-                    logger.info(f"Streaming chat completed in {latency_ms}ms with {len(relevant_docs)} documents")
+                    logger.info(f"Streaming chat completed in {latency_ms}ms with {len(retrieved_docs)} documents"
+                                + (f" ({cache_source} cache hit)" if cache_source else ""))
                     
+                    if not cached:
+                        # Runs after the stream closes (StreamingResponse background)
+                        background_tasks.add_task(
+                            ai_service.cache_answer, request.question, full_response, relevant_docs, **retrieval
+                        )
                     await self.knowledge_base_service.store_audit_log(
-                        chat_id, request.question, full_response, relevant_docs, latency_ms
+                        chat_id, request.question, full_response, retrieved_docs, latency_ms, cache_source
                     )
                     
                 except Exception as e:
@@ -474,6 +520,7 @@ class APIRoutes:
             
             return StreamingResponse(
                 generate_stream(),
+                background=background_tasks,
                 media_type="text/plain",
                 headers={
                     "Cache-Control": "no-cache",
@@ -487,6 +534,22 @@ class APIRoutes:
             logger.error(f"Error in streaming chat after {latency_ms}ms: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
+    async def get_audit_rollups(self, start: datetime = None, end: datetime = None):
+        """
+        Lấy hourly rollups của audit logs (số requests, latency percentiles)
+        
+        - **start**: Từ thời điểm (UTC, default: 24 giờ trước)
+        - **end**: Tới thời điểm (UTC, default: hiện tại)
+        """
+        try:
+            rollups = await self.knowledge_base_service.get_audit_rollups(start, end)
+            return {"rollups": rollups}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error getting audit rollups: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+
     async def get_audit_log(self, chat_id: UUID):
         """
         Lấy audit log cho chat session
@@ -506,11 +569,22 @@ class APIRoutes:
                 latency_ms=audit_log.latency_ms,
                 timestamp=audit_log.timestamp,
                 feedback=audit_log.feedback,
-                model_confidence=audit_log.model_confidence
+                model_confidence=audit_log.model_confidence,
+                cache_source=audit_log.cache_source
             )
             
         except HTTPException:
             raise
         except Exception as e:
             logger.error(f"Error getting audit log {chat_id}: {e}")
-            raise HTTPException(status_code=500, detail="Internal server error") 
\ No newline at end of file
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+    async def get_metrics(self):
+        """
+        Lấy performance metrics (embedding throughput, ...)
+        """
+        try:
+            return await self.knowledge_base_service.get_metrics()
+        except Exception as e:
+            logger.error(f"Error getting metrics: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error")
@@ -0,0 +1,203 @@
+"""
+Đo latency của /chat trong lúc một PDF 300 trang đang được ingest.
+
+Hai chế độ:
+
+    # In-process: probe mô phỏng /chat trên cùng event loop, so sánh
+    # pypdf chạy inline (cách cũ) với process pool (service.pdf_extractor)
+    python benchmarks/bench_chat_during_ingest.py loop --pages 300
+
+    # HTTP: upload PDF lên server đang chạy và gọi /chat song song
+    python benchmarks/bench_chat_during_ingest.py http --base-url http://localhost:8000 --pages 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGE_TEXT = "Benchmark page {page} line {line}: PostgreSQL pgvector retrieval augmented generation."
+
+
+def write_test_pdf(path: str, pages: int, lines_per_page: int = 40):
+    """Tạo PDF text-only tối giản với `pages` trang"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = "".join(
+            f"({PAGE_TEXT.format(page=page + 1, line=line + 1)}) Tj 0 -16 Td " for line in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 40 780 Td {lines}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def summarize(label: str, latencies_ms):
+    if not latencies_ms:
+        print(f"{label:<24} no samples")
+        return
+    ordered = sorted(latencies_ms)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<24} n={len(ordered):<5} p50={statistics.median(ordered):8.1f}ms "
+          f"p95={p95:8.1f}ms max={ordered[-1]:8.1f}ms")
+
+
+# ---------------------------------------------------------------- loop mode
+
+async def _probe(stop: asyncio.Event, latencies, service_ms: float):
+    """Mô phỏng một /chat request: chủ yếu chờ I/O, đo thời gian hoàn thành thực tế"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(service_ms / 1000)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def _extract_inline(path: str) -> str:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return "\n\n".join(page.extract_text() for page in reader.pages)
+
+
+async def run_loop_mode(args, pdf_path: str):
+    from service.pdf_extractor import extract_pdf_text, shutdown_pdf_executor
+
+    async def measure(extract):
+        stop = asyncio.Event()
+        latencies = []
+        probes = [asyncio.create_task(_probe(stop, latencies, args.chat_ms)) for _ in range(args.concurrency)]
+        await asyncio.sleep(0.2)
+        start = time.perf_counter()
+        await extract()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*probes)
+        return latencies, elapsed
+
+    async def inline():
+        # Cách cũ: pypdf chạy trực tiếp trong async def
+        _extract_inline(pdf_path)
+
+    baseline, _ = await measure(lambda: asyncio.sleep(2))
+    blocked, inline_elapsed = await measure(inline)
+    # Warm up pool để không tính thời gian spawn processes
+    await extract_pdf_text(pdf_path)
+    pooled, pool_elapsed = await measure(lambda: extract_pdf_text(pdf_path))
+    shutdown_pdf_executor()
+
+    print(f"\nSimulated /chat ({args.chat_ms}ms of I/O, {args.concurrency} concurrent)")
+    summarize("idle", baseline)
+    summarize(f"inline ({inline_elapsed:.1f}s)", blocked)
+    summarize(f"process pool ({pool_elapsed:.1f}s)", pooled)
+
+
+# ---------------------------------------------------------------- http mode
+
+def _post_json(url: str, payload: dict, timeout: float):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def _upload(base_url: str, pdf_path: str):
+    boundary = uuid.uuid4().hex
+    with open(pdf_path, "rb") as f:
+        content = f.read()
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench-{boundary[:8]}.pdf\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        f"{base_url}/knowledge/upload?dedup=off", data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def _document_status(base_url: str, doc_id: str) -> str:
+    with urllib.request.urlopen(f"{base_url}/knowledge/{doc_id}", timeout=30) as response:
+        return json.loads(response.read())["status"]
+
+
+def run_http_mode(args, pdf_path: str):
+    def chat_latencies(duration: float, until=None):
+        latencies = []
+        deadline = time.time() + duration
+
+        def one():
+            start = time.perf_counter()
+            _post_json(f"{args.base_url}/chat", {"question": "What is pgvector?"}, timeout=120)
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            while time.time() < deadline and (until is None or not until()):
+                latencies.extend(pool.map(lambda _: one(), range(args.concurrency)))
+        return latencies
+
+    baseline = chat_latencies(args.duration)
+    document = _upload(args.base_url, pdf_path)
+    doc_id = str(document["file_id"])
+    print(f"Uploaded {doc_id}, measuring /chat until ingestion finishes")
+    during = chat_latencies(
+        args.max_duration,
+        until=lambda: _document_status(args.base_url, doc_id) in ("completed", "failed")
+    )
+    print(f"Final document status: {_document_status(args.base_url, doc_id)}")
+
+    print(f"\n/chat latency ({args.concurrency} concurrent)")
+    summarize("idle", baseline)
+    summarize("during ingestion", during)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["loop", "http"])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chat-ms", type=float, default=20, help="loop mode: simulated /chat I/O time")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=10, help="http mode: idle baseline seconds")
+    parser.add_argument("--max-duration", type=float, default=300, help="http mode: max seconds during ingestion")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "bench.pdf")
+        write_test_pdf(pdf_path, args.pages)
+        print(f"Generated {args.pages}-page PDF ({os.path.getsize(pdf_path) / 1024:.0f} KB)")
+        if args.mode == "loop":
+            asyncio.run(run_loop_mode(args, pdf_path))
+        else:
+            run_http_mode(args, pdf_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Chạy EmbeddingScheduler với fake provider local (không gọi Google API).
+
+Fake provider mô phỏng latency mỗi call, giới hạn batch size và lỗi 429/503
+ngẫu nhiên, để kiểm tra batching, concurrency và retry/backoff.
+
+    python benchmarks/bench_embedding_scheduler.py --documents 8 --chunks 400 --error-rate 0.1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service.embedding_scheduler import EmbeddingScheduler, EmbeddingStats  # noqa: E402
+
+
+class FakeProviderError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"fake provider error {code}")
+        self.code = code
+
+
+class FakeEmbeddings:
+    def __init__(self, dim: int, latency: float, error_rate: float, max_batch: int):
+        self.dim = dim
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_batch = max_batch
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        if len(texts) > self.max_batch:
+            raise FakeProviderError(400)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if random.random() < self.error_rate:
+                raise FakeProviderError(random.choice([429, 503]))
+            return [[float(len(text))] * self.dim for text in texts]
+        finally:
+            self.in_flight -= 1
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+async def run(args):
+    provider = FakeEmbeddings(args.dim, args.latency, args.error_rate, args.max_batch)
+    stats = EmbeddingStats()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def ingest(doc_index):
+        scheduler = EmbeddingScheduler(
+            provider,
+            batch_size=args.batch_size,
+            retry_base_delay=0.05,
+            retry_max_delay=1.0,
+            semaphore=semaphore,
+            stats=stats
+        )
+        texts = [f"document {doc_index} chunk {i}" for i in range(args.chunks)]
+        embeddings = await scheduler.embed_documents(texts)
+        assert len(embeddings) == len(texts)
+        assert all(embedding[0] == float(len(text)) for text, embedding in zip(texts, embeddings))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(ingest(i) for i in range(args.documents)))
+    wall = time.perf_counter() - start
+
+    total = args.documents * args.chunks
+    print(f"documents={args.documents} chunks/doc={args.chunks} batch_size={args.batch_size} "
+          f"concurrency={args.concurrency} latency={args.latency}s error_rate={args.error_rate}")
+    print(f"provider calls:     {provider.calls}")
+    print(f"peak in-flight:     {provider.peak_in_flight}")
+    print(f"retries:            {stats.retries}")
+    print(f"wall time:          {wall:.2f}s")
+    print(f"throughput:         {total / wall:.1f} embeddings/s")
+    print(f"stats throughput:   {stats.snapshot()['embeddings_per_second']:.1f} embeddings/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-batch", type=int, default=100, help="Provider-side batch limit")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
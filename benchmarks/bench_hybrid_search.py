@@ -0,0 +1,107 @@
+"""
+Latency của hybrid search (vector + full-text, RRF) so với vector search thuần.
+
+Queries được lấy từ chính document_chunks: embedding của chunk làm query vector và
+vài từ hiếm trong nội dung chunk làm query text (mô phỏng câu hỏi chứa identifier /
+mã lỗi), nên không cần gọi embedding API.
+
+    python benchmarks/bench_hybrid_search.py --queries 200 --k 5
+    python benchmarks/bench_hybrid_search.py --vector-weight 1 --text-weight 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORD = re.compile(r"[A-Za-z][A-Za-z0-9_\-]{5,}")
+
+
+def summarize(label: str, latencies_ms):
+    ordered = sorted(latencies_ms)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<8} n={len(ordered):<5} p50={statistics.median(ordered):7.1f}ms "
+          f"p95={p95:7.1f}ms mean={statistics.mean(ordered):7.1f}ms")
+
+
+def query_text(content: str, words: int, rng: random.Random) -> str:
+    candidates = sorted(set(WORD.findall(content)), key=len, reverse=True)[:20]
+    return " ".join(rng.sample(candidates, min(words, len(candidates))))
+
+
+async def run(args):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from config.settings import settings
+    from dbconnection.connection import DatabaseConnection
+    from dbconnection.document_repository import DocumentRepository
+    from model.models import VectorStorageMode
+
+    rng = random.Random(args.seed)
+    connection = DatabaseConnection()
+    await connection.connect()
+    try:
+        repo = DocumentRepository(await connection.get_pool())
+        async with repo.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT id, content, embedding FROM document_chunks
+                WHERE embedding IS NOT NULL AND status = 'completed'
+                ORDER BY random() LIMIT $1
+            """, args.queries)
+        samples = [(row['id'], row['embedding'], query_text(row['content'], args.words, rng)) for row in rows]
+        samples = [sample for sample in samples if sample[2]]
+        if not samples:
+            print("document_chunks has no searchable chunks")
+            return
+
+        mode = VectorStorageMode(settings.vector_storage_mode)
+        common = dict(mode=mode, oversample=settings.vector_rerank_oversample, ef_search=settings.hnsw_ef_search)
+
+        async def vector(embedding, text):
+            return await repo.search_similar_documents(embedding, args.k, **common)
+
+        async def hybrid(embedding, text):
+            return await repo.hybrid_search_documents(
+                embedding, text, args.k, candidates=settings.hybrid_candidates,
+                vector_weight=args.vector_weight, text_weight=args.text_weight, rrf_k=settings.hybrid_rrf_k,
+                **common
+            )
+
+        print(f"queries={len(samples)} k={args.k} storage={mode.value} candidates={settings.hybrid_candidates} "
+              f"weights=vector:{args.vector_weight}/text:{args.text_weight}")
+        # Warm up caches / connections
+        for search in (vector, hybrid):
+            await search(samples[0][1], samples[0][2])
+
+        for label, search in (("vector", vector), ("hybrid", hybrid)):
+            latencies, hits = [], 0
+            for chunk_id, embedding, text in samples:
+                start = time.perf_counter()
+                found = await search(embedding, text)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += any(doc.id == chunk_id for doc in found)
+            summarize(label, latencies)
+            print(f"{'':<8} source chunk in top-{args.k}: {hits / len(samples):.1%}")
+    finally:
+        await connection.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--words", type=int, default=2, help="Rare words per text query")
+    parser.add_argument("--vector-weight", type=float, default=1.0)
+    parser.add_argument("--text-weight", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Latency của LocalVectorIndex (NumPy, in-process) so với search qua database.
+
+    # Offline: snapshot tổng hợp trong thư mục tạm, chỉ đo local search
+    python benchmarks/bench_local_index.py sim --corpus 100000 --queries 200 --k 5
+
+    # Database: build index từ document_chunks, queries là embeddings thật,
+    # so sánh với db_manager.search_similar_documents (HNSW) và đo recall của HNSW
+    python benchmarks/bench_local_index.py db --queries 200 --k 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def summarize(label: str, latencies_ms):
+    ordered = sorted(latencies_ms)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<8} n={len(ordered):<5} p50={statistics.median(ordered):7.2f}ms "
+          f"p95={p95:7.2f}ms mean={statistics.mean(ordered):7.2f}ms")
+
+
+async def timed(search, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(await search(query, k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+async def run_sim(args):
+    from service.local_vector_index import LocalVectorIndex, _IndexState, _normalize
+
+    rng = np.random.default_rng(args.seed)
+    vectors = _normalize(rng.normal(size=(args.corpus, args.dim)))
+    chunks = [
+        {"id": uuid.uuid4(), "document_id": uuid.uuid4(), "chunk_index": i, "content": "", "metadata": "{}",
+         "status": "completed", "filename": "bench"}
+        for i in range(args.corpus)
+    ]
+    queries = list(_normalize(rng.normal(size=(args.queries, args.dim))))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(directory=tmp)
+        start = time.perf_counter()
+        state = await index._write_snapshot("0", vectors, chunks)
+        print(f"corpus={args.corpus} dim={args.dim} snapshot written + mapped in {time.perf_counter() - start:.2f}s "
+              f"({vectors.nbytes / 2**20:.0f} MiB)")
+        index._state = state or _IndexState("0", vectors, chunks)
+        latencies, _ = await timed(index.search_similar_documents, queries, args.k)
+        summarize("local", latencies)
+
+
+async def run_db(args):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from dbconnection.database import db_manager
+    from service.local_vector_index import LocalVectorIndex
+
+    await db_manager.connect()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = LocalVectorIndex(directory=tmp)
+            start = time.perf_counter()
+            await index._load()
+            print(f"index built in {time.perf_counter() - start:.2f}s: {index.stats()['chunks']} chunks")
+            async with db_manager.document_repo.pool.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT embedding FROM document_chunks WHERE embedding IS NOT NULL ORDER BY random() LIMIT $1",
+                    args.queries
+                )
+            queries = [row['embedding'] for row in rows]
+            if not queries:
+                print("document_chunks has no embeddings")
+                return
+
+            # Warm up pool / page cache
+            await db_manager.search_similar_documents(queries[0], args.k)
+            await index.search_similar_documents(queries[0], args.k)
+
+            db_latencies, db_results = await timed(db_manager.search_similar_documents, queries, args.k)
+            local_latencies, local_results = await timed(index.search_similar_documents, queries, args.k)
+            summarize("database", db_latencies)
+            summarize("local", local_latencies)
+            # Local search là exact - dùng làm ground truth cho HNSW
+            recalls = [
+                len({doc.id for doc in db} & {doc.id for doc in local}) / max(len(local), 1)
+                for db, local in zip(db_results, local_results)
+            ]
+            print(f"database recall@{args.k} vs exact local: {statistics.mean(recalls):.4f}")
+    finally:
+        await db_manager.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", choices=["sim", "db"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--corpus", type=int, default=100000, help="sim mode: corpus size")
+    parser.add_argument("--dim", type=int, default=768, help="sim mode: dimensions")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(run_sim(args) if args.target == "sim" else run_db(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Microbenchmark: text vs binary encoding của pgvector embeddings phía client.
+
+Text path là cách cũ (`"[0.1,0.2,...]"` literal, Postgres phải parse lại),
+binary path là `pgvector.utils.to_db_binary` / `from_db_binary` - codec mà
+`pgvector.asyncpg.register_vector` đăng ký trên pool.
+
+    python benchmarks/bench_vector_codec.py --dim 768 --iterations 20000
+"""
+import argparse
+import time
+
+import numpy as np
+from pgvector.utils import from_db, from_db_binary, to_db_binary
+
+
+def text_encode(embedding):
+    # Literal dựng tay như code cũ trong document_repository
+    return f"[{','.join(map(str, embedding))}]"
+
+
+def measure(label, func, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        func(payload)
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / len(payloads) * 1e6
+    print(f"{label:<28} {per_call_us:>10.2f} us/op")
+    return per_call_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Embeddings từ provider là list[float], giống input của insert/search
+    embeddings = [rng.standard_normal(args.dim).astype(np.float32).tolist() for _ in range(256)]
+    payloads = [embeddings[i % len(embeddings)] for i in range(args.iterations)]
+
+    print(f"dim={args.dim} iterations={args.iterations}\n")
+    print("Insert / search parameter encoding")
+    text_enc = measure("text literal", text_encode, payloads)
+    binary_enc = measure("binary float32", to_db_binary, payloads)
+
+    text_values = [text_encode(e) for e in embeddings]
+    binary_values = [to_db_binary(e) for e in embeddings]
+    print("\nResult decoding (get_document)")
+    text_dec = measure("text literal", from_db, [text_values[i % 256] for i in range(args.iterations)])
+    binary_dec = measure("binary float32", from_db_binary, [binary_values[i % 256] for i in range(args.iterations)])
+
+    print("\nWire size per vector")
+    print(f"{'text literal':<28} {sum(map(len, text_values)) / 256:>10.0f} bytes")
+    print(f"{'binary float32':<28} {len(binary_values[0]):>10} bytes")
+
+    print("\nCPU saved per op")
+    print(f"{'insert/search encode':<28} {text_enc - binary_enc:>10.2f} us ({text_enc / binary_enc:.1f}x)")
+    print(f"{'decode':<28} {text_dec - binary_dec:>10.2f} us ({text_dec / binary_dec:.1f}x)")
+    print("\nGhi chú: binary path còn bỏ được bước parse text phía Postgres (vector_in), không đo ở đây.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Recall@k của các vector storage modes so với exact cosine search.
+
+Hai chế độ:
+
+    # Offline: brute-force trên vectors tổng hợp, không cần database.
+    # Chỉ đo sai số do quantization, không tính sai số của HNSW
+    python benchmarks/bench_vector_recall.py sim --corpus 20000 --queries 200 --k 5
+
+    # Database: lấy embeddings thật trong document_chunks làm queries,
+    # baseline exact bằng sequential scan, so với search qua HNSW của từng mode
+    python benchmarks/bench_vector_recall.py db --queries 100 --k 5 --modes full,halfvec,binary
+
+Mode db cần index của các mode được build sẵn (`python migrate.py --keep-vector-indexes`
+với từng VECTOR_STORAGE_MODE).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("full", "halfvec", "binary")
+
+
+def recall(expected, actual) -> float:
+    return len(set(expected) & set(actual)) / len(expected)
+
+
+def report(mode: str, oversample: int, recalls, latencies_ms=None):
+    line = f"{mode:<8} oversample={oversample:<3} recall@k mean={statistics.mean(recalls):.4f} min={min(recalls):.2f}"
+    if latencies_ms:
+        ordered = sorted(latencies_ms)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        line += f"  p50={statistics.median(ordered):.1f}ms p95={p95:.1f}ms"
+    print(line)
+
+
+# ---------------------------------------------------------------- sim mode
+
+def make_vectors(basis: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    """Vectors có intrinsic dimension thấp (latent @ basis + noise) - gần với text embeddings hơn Gaussian thuần"""
+    latent = rng.normal(size=(size, basis.shape[0])).astype(np.float32)
+    vectors = latent @ basis + 0.5 * rng.normal(size=(size, basis.shape[1])).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes của k scores nhỏ nhất (distance), theo thứ tự tăng dần"""
+    candidates = np.argpartition(scores, k)[:k]
+    return candidates[np.argsort(scores[candidates])]
+
+
+def run_sim(args):
+    rng = np.random.default_rng(args.seed)
+    basis = rng.normal(size=(args.latent_dim, args.dim)).astype(np.float32)
+    corpus = make_vectors(basis, args.corpus, rng)
+    queries = make_vectors(basis, args.queries, rng)
+    half = corpus.astype(np.float16).astype(np.float32)
+    bits = np.packbits(corpus > 0, axis=1)
+
+    print(f"corpus={args.corpus} dim={args.dim} queries={args.queries} k={args.k}")
+    for mode in args.modes:
+        oversample = 1 if mode == "full" else args.oversample
+        recalls = []
+        for query in queries:
+            exact = top_k(1 - corpus @ query, args.k)
+            if mode == "full":
+                found = exact
+            else:
+                if mode == "halfvec":
+                    approx = 1 - half @ query.astype(np.float16).astype(np.float32)
+                else:
+                    query_bits = np.packbits(query > 0)
+                    approx = np.unpackbits(bits ^ query_bits, axis=1).sum(axis=1)
+                candidates = top_k(approx.astype(np.float32), args.k * oversample)
+                # Re-rank candidates bằng full-precision cosine distance
+                found = candidates[top_k(1 - corpus[candidates] @ query, args.k)]
+            recalls.append(recall(exact, found))
+        report(mode, oversample, recalls)
+
+
+# ---------------------------------------------------------------- db mode
+
+async def run_db(args):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from config.settings import settings
+    from dbconnection.connection import DatabaseConnection
+    from dbconnection.document_repository import DocumentRepository
+    from model.models import VectorStorageMode
+
+    connection = DatabaseConnection()
+    await connection.connect()
+    try:
+        pool = await connection.get_pool()
+        repo = DocumentRepository(pool)
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT embedding FROM document_chunks WHERE embedding IS NOT NULL ORDER BY random() LIMIT $1",
+                args.queries
+            )
+        queries = [row['embedding'] for row in rows]
+        if not queries:
+            print("document_chunks has no embeddings")
+            return
+
+        # Exact baseline: tắt index scans để Postgres sort toàn bộ theo cosine distance
+        expected = []
+        async with pool.acquire() as conn:
+            for query in queries:
+                async with conn.transaction():
+                    await conn.execute("SET LOCAL enable_indexscan = off")
+                    ids = await conn.fetch("""
+                        SELECT id FROM document_chunks
+                        WHERE embedding IS NOT NULL AND status = 'completed'
+                        ORDER BY embedding <=> $1 LIMIT $2
+                    """, query, args.k)
+                expected.append([row['id'] for row in ids])
+
+        print(f"queries={len(queries)} k={args.k} ef_search={args.ef_search or settings.hnsw_ef_search} "
+              f"(configured mode: {settings.vector_storage_mode})")
+        for mode in args.modes:
+            recalls, latencies = [], []
+            for query, exact in zip(queries, expected):
+                start = time.perf_counter()
+                found = await repo.search_similar_documents(
+                    query, args.k, VectorStorageMode(mode), args.oversample, args.ef_search or settings.hnsw_ef_search
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(recall(exact, [doc.id for doc in found]))
+            report(mode, 1 if mode == "full" else args.oversample, recalls, latencies)
+    finally:
+        await connection.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", choices=["sim", "db"])
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--oversample", type=int, default=4)
+    parser.add_argument("--ef-search", type=int, default=None, help="db mode: hnsw.ef_search (default: HNSW_EF_SEARCH)")
+    parser.add_argument("--corpus", type=int, default=20000, help="sim mode: corpus size")
+    parser.add_argument("--dim", type=int, default=768, help="sim mode: dimensions")
+    parser.add_argument("--latent-dim", type=int, default=64, help="sim mode: intrinsic dimension")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    if args.target == "sim":
+        run_sim(args)
+    else:
+        asyncio.run(run_db(args))
+
+
+if __name__ == "__main__":
+    main()
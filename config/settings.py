@@ -7,6 +7,7 @@ from urllib.parse import urlparse
 class Settings(BaseSettings):
     # Database settings
     neon_database_url: str = os.getenv("NEON_DATABASE_URL", "")
+    neon_read_database_url: str = os.getenv("NEON_READ_DATABASE_URL", "")  # Optional read replica
     
     # AI settings
     google_api_key: Optional[str] = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
@@ -16,8 +17,16 @@ class Settings(BaseSettings):
     chunk_size: int = int(os.getenv("CHUNK_SIZE", 1000))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", 200))
     
+    # PDF extraction settings
+    pdf_workers: int = int(os.getenv("PDF_WORKERS", 2))  # Process pool size
+    pdf_parallel_min_pages: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 50))  # Split pages across workers above this
+    pdf_extraction_timeout: float = float(os.getenv("PDF_EXTRACTION_TIMEOUT", 300))  # Per document, seconds
+    
     # Upload settings
     upload_dir: str = "/app/uploads"
+    upload_chunk_size: int = int(os.getenv("UPLOAD_CHUNK_SIZE", 1048576))  # 1MB read/write chunks
+    upload_concurrency: int = int(os.getenv("UPLOAD_CONCURRENCY", 8))  # Files handled at once per batch upload
+    upload_dedup_mode: str = os.getenv("UPLOAD_DEDUP_MODE", "off")  # off | reuse | link (opt in, per request: ?dedup=)
     
     # API settings
     cors_origins: list = ["*"]
@@ -40,10 +49,76 @@ class Settings(BaseSettings):
     cache_ttl_search: int = int(os.getenv("CACHE_TTL_SEARCH", 300))     # 5 minutes
     max_context_tokens: int = int(os.getenv("MAX_CONTEXT_TOKENS", 4000))
     
+    # Semantic answer cache settings (near-duplicate questions reuse a cached answer)
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))  # Min cosine similarity for a hit
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 10000))  # Per corpus version
+    semantic_cache_ttl: int = int(os.getenv("SEMANTIC_CACHE_TTL", 3600))  # Seconds since the last stored answer
+    
+    # Embedding settings
+    embedding_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))  # Texts per provider call
+    embedding_max_concurrency: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))  # Shared by all ingestions
+    embedding_max_retries: int = int(os.getenv("EMBEDDING_MAX_RETRIES", 5))
+    embedding_retry_base_delay: float = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", 0.5))
+    embedding_retry_max_delay: float = float(os.getenv("EMBEDDING_RETRY_MAX_DELAY", 30))
+    
+    # Ingestion worker settings
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY", 2))  # Jobs processed at once per worker process
+    worker_poll_interval: float = float(os.getenv("WORKER_POLL_INTERVAL", 1.0))
+    worker_heartbeat_interval: float = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 10))
+    worker_stall_timeout: float = float(os.getenv("WORKER_STALL_TIMEOUT", 60))  # Requeue jobs without heartbeat
+    ingestion_max_attempts: int = int(os.getenv("INGESTION_MAX_ATTEMPTS", 3))
+    ingestion_retry_delay: float = float(os.getenv("INGESTION_RETRY_DELAY", 30))
+    
+    # Ingestion pipeline settings (split -> embed -> store)
+    pipeline_batch_size: int = int(os.getenv("PIPELINE_BATCH_SIZE", 100))  # Chunks per embed/store batch
+    pipeline_queue_size: int = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))  # Batches buffered between stages
+    pipeline_embed_workers: int = int(os.getenv("PIPELINE_EMBED_WORKERS", 2))
+    pipeline_segment_size: int = int(os.getenv("PIPELINE_SEGMENT_SIZE", 100000))  # Characters split at a time
+    
+    # Embedding cache settings
+    embedding_cache_enabled: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    embedding_cache_max_entries: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 10000))  # In-process LRU size
+    embedding_cache_ttl: int = int(os.getenv("EMBEDDING_CACHE_TTL", 2592000))  # 30 days in Redis
+    
+    # Retrieval settings
+    search_mode: str = os.getenv("SEARCH_MODE", "vector")  # vector | hybrid (vector + full-text, RRF)
+    hybrid_candidates: int = int(os.getenv("HYBRID_CANDIDATES", 20))  # Rows taken from each ranked list before fusion
+    hybrid_rrf_k: int = int(os.getenv("HYBRID_RRF_K", 60))  # Reciprocal rank fusion constant
+    hybrid_vector_weight: float = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+    hybrid_text_weight: float = float(os.getenv("HYBRID_TEXT_WEIGHT", 1.0))
+    
+    # Local vector index settings (in-process NumPy search over a memory-mapped snapshot)
+    local_index_enabled: bool = os.getenv("LOCAL_INDEX_ENABLED", "false").lower() == "true"
+    local_index_dir: str = os.getenv("LOCAL_INDEX_DIR", "/app/vector_index")  # Snapshot files, shared by app processes
+    local_index_poll_interval: float = float(os.getenv("LOCAL_INDEX_POLL_INTERVAL", 2.0))  # Change log polling, seconds
+    local_index_max_staleness: float = float(os.getenv("LOCAL_INDEX_MAX_STALENESS", 30))  # Fall back to the DB after this
+    local_index_compact_ratio: float = float(os.getenv("LOCAL_INDEX_COMPACT_RATIO", 0.1))  # Changed rows / snapshot rows before a new snapshot
+    chunk_change_retention_days: int = int(os.getenv("CHUNK_CHANGE_RETENTION_DAYS", 7))  # Older snapshots are rebuilt from scratch
+    
+    # Audit log writer settings
+    audit_queue_size: int = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))  # Entries buffered in memory
+    audit_batch_size: int = int(os.getenv("AUDIT_BATCH_SIZE", 500))  # Rows per COPY
+    audit_flush_interval: float = float(os.getenv("AUDIT_FLUSH_INTERVAL", 1.0))  # Max seconds an entry waits
+    audit_overflow_policy: str = os.getenv("AUDIT_OVERFLOW_POLICY", "drop")  # drop | block when the queue is full
+    audit_retention_days: int = int(os.getenv("AUDIT_RETENTION_DAYS", 90))  # Raw audit partitions older than this are dropped
+    audit_partitions_ahead: int = int(os.getenv("AUDIT_PARTITIONS_AHEAD", 7))  # Daily partitions created in advance
+    audit_maintenance_interval: float = float(os.getenv("AUDIT_MAINTENANCE_INTERVAL", 300))  # Partitions + rollups, seconds
+    
+    # Vector storage settings
+    vector_storage_mode: str = os.getenv("VECTOR_STORAGE_MODE", "full")  # full | halfvec | binary (HNSW index type)
+    vector_rerank_oversample: int = int(os.getenv("VECTOR_RERANK_OVERSAMPLE", 4))  # Candidates per result in quantized modes
+    hnsw_m: int = int(os.getenv("HNSW_M", 16))  # Graph degree - higher = better recall, bigger index
+    hnsw_ef_construction: int = int(os.getenv("HNSW_EF_CONSTRUCTION", 64))  # Build-time candidate list
+    hnsw_ef_search: int = int(os.getenv("HNSW_EF_SEARCH", 40))  # Default query-time candidate list (per request override)
+    
     # Database pool settings
     db_min_connections: int = int(os.getenv("DB_MIN_CONNECTIONS", 5))
     db_max_connections: int = int(os.getenv("DB_MAX_CONNECTIONS", 20))
     db_command_timeout: int = int(os.getenv("DB_COMMAND_TIMEOUT", 60))
+    db_insert_batch_size: int = int(os.getenv("DB_INSERT_BATCH_SIZE", 500))  # Rows per executemany batch
+    db_replica_retry_after: float = float(os.getenv("DB_REPLICA_RETRY_AFTER", 30))  # Seconds reads stay on primary after a replica failure
+    db_auto_migrate: bool = os.getenv("DB_AUTO_MIGRATE", "false").lower() == "true"  # Otherwise run `python migrate.py`
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
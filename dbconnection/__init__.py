@@ -1,13 +1,16 @@
 from .database import db_manager
 from .connection import DatabaseConnection
-from .schema import DatabaseSchema
+from .schema import DatabaseSchema, SchemaOutOfDateError
 from .document_repository import DocumentRepository
 from .audit_repository import AuditRepository
+from .job_repository import JobRepository
 
 __all__ = [
     'db_manager',
     'DatabaseConnection',
     'DatabaseSchema',
+    'SchemaOutOfDateError',
     'DocumentRepository',
-    'AuditRepository'
+    'AuditRepository',
+    'JobRepository'
 ] 
\ No newline at end of file
@@ -1,13 +1,18 @@
 import json
 import logging
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
-from model.models import AuditLog
+from model.models import AuditLog, AuditRollup
 
 logger = logging.getLogger(__name__)
 
 
+# pg_try_advisory_lock key - một process chạy audit maintenance tại một thời điểm
+AUDIT_MAINTENANCE_LOCK_ID = 7305218392
+
+
 class AuditRepository:
     def __init__(self, pool):
         self.pool = pool
@@ -16,8 +21,8 @@ class AuditRepository:
         """Thêm audit log"""
         async with self.pool.acquire() as conn:
             query = """
-                INSERT INTO audit_logs (chat_id, question, response, retrieved_docs, latency_ms, timestamp, feedback, model_confidence)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                INSERT INTO audit_logs (chat_id, question, response, retrieved_docs, latency_ms, timestamp, feedback, model_confidence, cache_source)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
             """
             await conn.execute(
                 query,
@@ -28,14 +33,53 @@ class AuditRepository:
                 audit_log.latency_ms,
                 audit_log.timestamp,
                 audit_log.feedback,
-                audit_log.model_confidence
+                audit_log.model_confidence,
+                audit_log.cache_source
             )
 
+    AUDIT_COLUMNS = [
+        "chat_id", "question", "response", "retrieved_docs", "latency_ms", "timestamp", "feedback", "model_confidence",
+        "cache_source"
+    ]
+
+    @staticmethod
+    def _audit_record(audit_log: AuditLog) -> tuple:
+        return (
+            audit_log.chat_id,
+            audit_log.question,
+            audit_log.response,
+            json.dumps(audit_log.retrieved_docs),
+            audit_log.latency_ms,
+            audit_log.timestamp,
+            audit_log.feedback,
+            audit_log.model_confidence,
+            audit_log.cache_source
+        )
+
+    async def insert_audit_logs_bulk(self, audit_logs: List[AuditLog]) -> int:
+        """Ghi nhiều audit logs bằng COPY - fallback sang multi-row INSERT nếu COPY lỗi (vd. trùng chat_id)"""
+        if not audit_logs:
+            return 0
+        
+        records = [self._audit_record(audit_log) for audit_log in audit_logs]
+        async with self.pool.acquire() as conn:
+            try:
+                await conn.copy_records_to_table("audit_logs", records=records, columns=self.AUDIT_COLUMNS)
+            except Exception as e:
+                logger.warning(f"COPY of {len(records)} audit logs failed, retrying with INSERT: {e}")
+                await conn.executemany("""
+                    INSERT INTO audit_logs (chat_id, question, response, retrieved_docs, latency_ms, timestamp, feedback, model_confidence, cache_source)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                    ON CONFLICT DO NOTHING
+                """, records)
+        return len(records)
+
     async def get_audit_log(self, chat_id: UUID) -> Optional[AuditLog]:
         """Lấy audit log theo chat_id"""
         async with self.pool.acquire() as conn:
             query = """
-                SELECT chat_id, question, response, retrieved_docs, latency_ms, timestamp, feedback, model_confidence
+                SELECT chat_id, question, response, retrieved_docs, latency_ms, timestamp, feedback, model_confidence,
+                       cache_source
                 FROM audit_logs WHERE chat_id = $1
             """
             row = await conn.fetchrow(query, chat_id)
@@ -48,6 +92,84 @@ class AuditRepository:
                     latency_ms=row['latency_ms'],
                     timestamp=row['timestamp'],
                     feedback=row['feedback'],
-                    model_confidence=row['model_confidence']
+                    model_confidence=row['model_confidence'],
+                    cache_source=row['cache_source']
+                )
+            return None
+
+    async def run_maintenance(self, today: date, partitions_ahead: int, retention_before: date,
+                              chunk_changes_before: datetime) -> Optional[Dict[str, Any]]:
+        """Tạo partitions, refresh rollups, drop partitions và chunk changes hết hạn - None nếu process khác đang chạy"""
+        async with self.pool.acquire() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", AUDIT_MAINTENANCE_LOCK_ID):
+                return None
+            try:
+                created = await conn.fetchval(
+                    "SELECT ensure_audit_log_partitions($1::date, $2::date)",
+                    today, today + timedelta(days=partitions_ahead + 1)
                 )
-            return None 
\ No newline at end of file
+                # Rollups trước khi drop để không mất dữ liệu của giờ cuối cùng
+                rolled_up = await self._refresh_rollups(conn, retention_before)
+                dropped = [
+                    row[0] for row in await conn.fetch("SELECT drop_audit_log_partitions($1::date)", retention_before)
+                ]
+                # Change log of the local vector index
+                result = await conn.execute(
+                    "DELETE FROM document_chunk_changes WHERE changed_at < $1", chunk_changes_before
+                )
+                pruned = int(result.split()[-1])
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", AUDIT_MAINTENANCE_LOCK_ID)
+        
+        return {
+            "partitions_created": created,
+            "buckets_rolled_up": rolled_up,
+            "partitions_dropped": dropped,
+            "chunk_changes_pruned": pruned
+        }
+
+    @staticmethod
+    async def _refresh_rollups(conn, retention_before: date) -> int:
+        """Tính lại hourly buckets từ bucket mới nhất trừ 1 giờ (logs được ghi trễ) - lần đầu backfill toàn bộ"""
+        since = await conn.fetchval("""
+            SELECT COALESCE(MAX(bucket) - INTERVAL '1 hour', $1::date::timestamp) FROM audit_log_rollups
+        """, retention_before)
+        result = await conn.execute("""
+            INSERT INTO audit_log_rollups (
+                bucket, requests, avg_latency_ms, p50_latency_ms, p95_latency_ms, p99_latency_ms, max_latency_ms,
+                cache_hits
+            )
+            SELECT date_trunc('hour', timestamp) AS bucket,
+                   COUNT(*),
+                   AVG(latency_ms),
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms),
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms),
+                   percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms),
+                   MAX(latency_ms),
+                   COUNT(*) FILTER (WHERE cache_source IS NOT NULL)
+            FROM audit_logs
+            WHERE timestamp >= $1
+            GROUP BY 1
+            ON CONFLICT (bucket) DO UPDATE SET
+                requests = EXCLUDED.requests,
+                avg_latency_ms = EXCLUDED.avg_latency_ms,
+                p50_latency_ms = EXCLUDED.p50_latency_ms,
+                p95_latency_ms = EXCLUDED.p95_latency_ms,
+                p99_latency_ms = EXCLUDED.p99_latency_ms,
+                max_latency_ms = EXCLUDED.max_latency_ms,
+                cache_hits = EXCLUDED.cache_hits,
+                updated_at = NOW()
+        """, since)
+        return int(result.split()[-1])
+
+    async def get_rollups(self, start: datetime, end: datetime) -> List[AuditRollup]:
+        """Lấy hourly rollups trong khoảng [start, end)"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT bucket, requests, avg_latency_ms, p50_latency_ms, p95_latency_ms, p99_latency_ms, max_latency_ms,
+                       cache_hits, cache_hits::float / GREATEST(requests, 1) AS cache_hit_ratio
+                FROM audit_log_rollups
+                WHERE bucket >= $1 AND bucket < $2
+                ORDER BY bucket
+            """, start, end)
+            return [AuditRollup(**dict(row)) for row in rows]
@@ -1,14 +1,16 @@
 import asyncpg
 import logging
+from pgvector.asyncpg import register_vector
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
 
 class DatabaseConnection:
-    def __init__(self):
+    def __init__(self, database_url: str = None, name: str = "primary"):
         self.pool = None
-        self.database_url = settings.neon_database_url
+        self.database_url = database_url or settings.neon_database_url
+        self.name = name
         
         # Connection pool configuration from settings
         self.min_size = settings.db_min_connections
@@ -20,18 +22,34 @@ class DatabaseConnection:
             self.pool = await asyncpg.create_pool(
                 self.database_url,
                 min_size=self.min_size,
-                max_size=self.max_size
+                max_size=self.max_size,
+                init=self._init_connection
             )
-            logger.info("Connected to Neon PostgreSQL")
+            logger.info(f"Connected to Neon PostgreSQL ({self.name})")
         except Exception as e:
-            logger.error(f"Failed to connect to database: {e}")
+            logger.error(f"Failed to connect to {self.name} database: {e}")
             raise
 
+    @staticmethod
+    async def _init_connection(conn):
+        """Đăng ký binary codec cho pgvector trên mỗi connection mới"""
+        try:
+            await register_vector(conn)
+        except ValueError:
+            # Extension chưa tồn tại (database mới) - codec sẽ được đăng ký lại sau khi tạo schema
+            logger.warning("pgvector extension not found, vector codec not registered yet")
+
+    async def reset_connections(self):
+        """Đóng các connection hiện có để chúng được tạo lại với codec mới"""
+        if self.pool:
+            await self.pool.expire_connections()
+
     async def disconnect(self):
         """Đóng connection pool"""
         if self.pool:
             await self.pool.close()
-            logger.info("Disconnected from database")
+            self.pool = None
+            logger.info(f"Disconnected from {self.name} database")
 
     async def get_pool(self):
         """Lấy connection pool"""
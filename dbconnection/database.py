@@ -1,45 +1,141 @@
+import asyncio
 import logging
+import time
+
+import asyncpg
+
 from .connection import DatabaseConnection
-from .schema import DatabaseSchema
+from .schema import DatabaseSchema, SchemaOutOfDateError
 from .document_repository import DocumentRepository
 from .audit_repository import AuditRepository
+from .job_repository import JobRepository
+from model.models import VectorStorageMode
 
 logger = logging.getLogger(__name__)
 
 
+# Lỗi cho thấy replica không dùng được - các lỗi khác (SQL, constraint) không fallback
+REPLICA_UNAVAILABLE_ERRORS = (
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.CannotConnectNowError,
+    OSError,
+    asyncio.TimeoutError
+)
+
+REPLICA_CONNECT_TIMEOUT = 5
+
+
 class DatabaseManager:
     def __init__(self):
+        from config.settings import settings
         self.connection = DatabaseConnection()
+        self.read_connection = (
+            DatabaseConnection(settings.neon_read_database_url, name="replica")
+            if settings.neon_read_database_url else None
+        )
+        self.replica_retry_after = settings.db_replica_retry_after
+        self._replica_down_until = 0.0
+        self._replica_lock = asyncio.Lock()
         self.document_repo = None
         self.audit_repo = None
+        self.job_repo = None
+        self.read_document_repo = None
+        self.read_audit_repo = None
 
     async def connect(self):
         """Tạo connection pool và khởi tạo repositories"""
         await self.connection.connect()
         pool = await self.connection.get_pool()
         
-        # Create tables
-        await DatabaseSchema.create_tables(pool)
+        # Schema is migrated by `python migrate.py`; startup only checks the version
+        current, latest = await DatabaseSchema.check_version(pool)
+        if current < latest:
+            from config.settings import settings
+            if not settings.db_auto_migrate:
+                raise SchemaOutOfDateError(
+                    f"Database schema is at version {current}, expected {latest}. Run `python migrate.py`"
+                )
+            await DatabaseSchema.migrate(pool)
+            await DatabaseSchema.ensure_vector_indexes(
+                pool, settings.vector_storage_mode, settings.hnsw_m, settings.hnsw_ef_construction
+            )
+            await self.connection.reset_connections()
         
         # Initialize repositories
         self.document_repo = DocumentRepository(pool)
         self.audit_repo = AuditRepository(pool)
+        self.job_repo = JobRepository(pool)
+        
+        # Replica không sẵn sàng lúc startup thì vẫn chạy trên primary
+        if self.read_connection:
+            await self._connect_replica()
         
         logger.info("Database manager initialized successfully")
 
     async def disconnect(self):
-        """Đóng connection pool"""
+        """Đóng connection pools"""
+        if self.read_connection:
+            self.read_document_repo = None
+            self.read_audit_repo = None
+            await self.read_connection.disconnect()
         await self.connection.disconnect()
 
+    async def _connect_replica(self) -> bool:
+        async with self._replica_lock:
+            if self.read_document_repo is not None:
+                return True
+            if time.monotonic() < self._replica_down_until:
+                # Request khác vừa connect thất bại trong lúc chờ lock
+                return False
+            try:
+                # Không để request chờ hết connect timeout mặc định của asyncpg
+                await asyncio.wait_for(self.read_connection.connect(), timeout=REPLICA_CONNECT_TIMEOUT)
+            except Exception:
+                self._mark_replica_down()
+                return False
+            # Pool được gán trong connect() - replica chỉ dùng được khi repositories đã sẵn sàng
+            read_pool = self.read_connection.pool
+            self.read_audit_repo = AuditRepository(read_pool)
+            self.read_document_repo = DocumentRepository(read_pool)
+        return True
+
+    def _mark_replica_down(self):
+        self._replica_down_until = time.monotonic() + self.replica_retry_after
+        logger.warning(f"Read replica unavailable, routing reads to primary for {self.replica_retry_after}s")
+
+    async def _read(self, repo_name: str, method: str, *args):
+        """Chạy read-only query trên replica nếu có và healthy, fallback về primary"""
+        if self.read_connection and time.monotonic() >= self._replica_down_until:
+            if self.read_document_repo is not None or await self._connect_replica():
+                try:
+                    return await getattr(getattr(self, f"read_{repo_name}"), method)(*args)
+                except REPLICA_UNAVAILABLE_ERRORS as e:
+                    logger.error(f"Replica read {method} failed: {e}")
+                    self._mark_replica_down()
+        return await getattr(getattr(self, repo_name), method)(*args)
+
     # Document operations
     async def insert_document(self, document):
         return await self.document_repo.insert_document(document)
 
+    async def insert_chunks_bulk(self, chunks, batch_size=None):
+        from config.settings import settings
+        return await self.document_repo.insert_chunks_bulk(
+            chunks, batch_size or settings.db_insert_batch_size
+        )
+
     async def get_document(self, doc_id):
         return await self.document_repo.get_document(doc_id)
 
-    async def get_all_documents(self, page=1, size=10):
-        return await self.document_repo.get_all_documents(page, size)
+    async def find_document_by_hash(self, content_hash):
+        return await self.document_repo.find_document_by_hash(content_hash)
+
+    async def get_all_documents(self, limit, fields, after=None, offset=None, count=None):
+        from model.models import CountMode
+        return await self._read(
+            "document_repo", "get_all_documents", limit, fields, after, offset, count or CountMode.ESTIMATE
+        )
 
     async def update_document(self, doc_id, content=None, metadata=None):
         return await self.document_repo.update_document(doc_id, content, metadata)
@@ -50,18 +146,88 @@ class DatabaseManager:
     async def delete_document(self, doc_id):
         return await self.document_repo.delete_document(doc_id)
 
-    async def search_similar_documents(self, embedding, limit=5):
-        return await self.document_repo.search_similar_documents(embedding, limit)
+    async def delete_documents(self, doc_ids):
+        return await self.document_repo.delete_documents(doc_ids)
+
+    async def delete_document_chunks(self, doc_id):
+        return await self.document_repo.delete_document_chunks(doc_id)
+
+    async def get_chunk_hashes(self, doc_id):
+        return await self.document_repo.get_chunk_hashes(doc_id)
+
+    async def has_duplicates(self, doc_id):
+        return await self.document_repo.has_duplicates(doc_id)
+
+    async def apply_chunk_diff(self, doc_id, content, metadata, added, kept, removed):
+        from config.settings import settings
+        return await self.document_repo.apply_chunk_diff(
+            doc_id, content, metadata, added, kept, removed, settings.db_insert_batch_size
+        )
+
+    async def search_similar_documents(self, embedding, limit=5, ef_search=None):
+        from config.settings import settings
+        return await self._read(
+            "document_repo", "search_similar_documents",
+            embedding, limit, VectorStorageMode(settings.vector_storage_mode), settings.vector_rerank_oversample,
+            ef_search or settings.hnsw_ef_search
+        )
+
+    async def hybrid_search_documents(self, embedding, query_text, limit=5, ef_search=None,
+                                      vector_weight=None, text_weight=None):
+        from config.settings import settings
+        return await self._read(
+            "document_repo", "hybrid_search_documents",
+            embedding, query_text, limit, VectorStorageMode(settings.vector_storage_mode),
+            settings.vector_rerank_oversample, ef_search or settings.hnsw_ef_search, settings.hybrid_candidates,
+            settings.hybrid_vector_weight if vector_weight is None else vector_weight,
+            settings.hybrid_text_weight if text_weight is None else text_weight,
+            settings.hybrid_rrf_k
+        )
 
     async def get_document_chunks(self, doc_id):
-        return await self.document_repo.get_document_chunks(doc_id)
+        return await self._read("document_repo", "get_document_chunks", doc_id)
+
+    # Change log reads stay on the primary: the xid watermark comes from its snapshots
+    async def get_searchable_chunks(self):
+        return await self.document_repo.get_searchable_chunks()
+
+    async def get_chunk_changes(self, since_xid):
+        return await self.document_repo.get_chunk_changes(since_xid)
 
     # Audit operations
     async def insert_audit_log(self, audit_log):
         return await self.audit_repo.insert_audit_log(audit_log)
 
+    async def insert_audit_logs_bulk(self, audit_logs):
+        return await self.audit_repo.insert_audit_logs_bulk(audit_logs)
+
+    async def run_audit_maintenance(self, today, partitions_ahead, retention_before, chunk_changes_before):
+        return await self.audit_repo.run_maintenance(today, partitions_ahead, retention_before, chunk_changes_before)
+
+    async def get_audit_rollups(self, start, end):
+        return await self.audit_repo.get_rollups(start, end)
+
     async def get_audit_log(self, chat_id):
-        return await self.audit_repo.get_audit_log(chat_id)
+        return await self._read("audit_repo", "get_audit_log", chat_id)
+
+    # Ingestion job operations
+    async def enqueue_job(self, document_id, max_attempts=3):
+        return await self.job_repo.enqueue_job(document_id, max_attempts)
+
+    async def claim_job(self, worker_id):
+        return await self.job_repo.claim_job(worker_id)
+
+    async def heartbeat_job(self, job_id, worker_id):
+        return await self.job_repo.heartbeat(job_id, worker_id)
+
+    async def complete_job(self, job_id, worker_id):
+        return await self.job_repo.complete_job(job_id, worker_id)
+
+    async def fail_job(self, job_id, worker_id, error, retry_delay):
+        return await self.job_repo.fail_job(job_id, worker_id, error, retry_delay)
+
+    async def requeue_stalled_jobs(self, stall_timeout):
+        return await self.job_repo.requeue_stalled_jobs(stall_timeout)
 
 
 # Global database manager instance
@@ -1,10 +1,10 @@
 import json
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 from uuid import UUID
 from datetime import datetime
 
-from model.models import Document, FileStatus
+from model.models import CountMode, Document, DocumentChunk, FileStatus, VectorStorageMode
 
 logger = logging.getLogger(__name__)
 
@@ -16,14 +16,9 @@ class DocumentRepository:
     async def insert_document(self, document: Document) -> UUID:
         """Thêm document mới vào database"""
         async with self.pool.acquire() as conn:
-            # Handle embedding properly for pgvector
-            embedding_param = None
-            if document.embedding:
-                embedding_param = f"[{','.join(map(str, document.embedding))}]"
-            
             query = """
-                INSERT INTO documents (id, filename, content, file_size, embedding, metadata, status)
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                INSERT INTO documents (id, filename, content, file_size, metadata, status, content_hash, duplicate_of)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
                 RETURNING id
             """
             result = await conn.fetchval(
@@ -32,17 +27,51 @@ class DocumentRepository:
                 document.filename,
                 document.content,
                 document.file_size,
-                embedding_param,
                 json.dumps(document.metadata),
-                document.status.value
+                document.status.value,
+                document.content_hash,
+                document.duplicate_of
             )
             return result
 
+    _INSERT_CHUNK_QUERY = """
+        INSERT INTO document_chunks (id, document_id, chunk_index, content, content_hash, embedding, metadata, status)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+    """
+
+    @staticmethod
+    def _chunk_record(chunk: DocumentChunk) -> tuple:
+        return (
+            chunk.id,
+            chunk.document_id,
+            chunk.chunk_index,
+            chunk.content,
+            chunk.content_hash,
+            chunk.embedding,
+            json.dumps(chunk.metadata),
+            chunk.status.value
+        )
+
+    async def insert_chunks_bulk(self, chunks: List[DocumentChunk], batch_size: int = 500) -> int:
+        """Thêm nhiều chunks trong một transaction - commit tất cả hoặc không gì cả"""
+        if not chunks:
+            return 0
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for start in range(0, len(chunks), batch_size):
+                    await conn.executemany(
+                        self._INSERT_CHUNK_QUERY,
+                        [self._chunk_record(chunk) for chunk in chunks[start:start + batch_size]]
+                    )
+        return len(chunks)
+
     async def get_document(self, doc_id: UUID) -> Optional[Document]:
         """Lấy document theo ID"""
         async with self.pool.acquire() as conn:
             query = """
-                SELECT id, filename, content, file_size, embedding, metadata, status, created_at, updated_at
+                SELECT id, filename, content, file_size, metadata, status, created_at, updated_at,
+                       content_hash, duplicate_of
                 FROM documents WHERE id = $1
             """
             row = await conn.fetchrow(query, doc_id)
@@ -52,51 +81,83 @@ class DocumentRepository:
                     filename=row['filename'],
                     content=row['content'],
                     file_size=row['file_size'],
-                    embedding=row['embedding'],
                     metadata=json.loads(row['metadata']) if row['metadata'] else {},
                     created_at=row['created_at'],
                     updated_at=row['updated_at'],
-                    status=FileStatus(row['status'])
+                    status=FileStatus(row['status']),
+                    content_hash=row['content_hash'],
+                    duplicate_of=row['duplicate_of']
                 )
             return None
 
-    async def get_all_documents(self, page: int = 1, size: int = 10) -> tuple[List[Document], int]:
-        """Lấy danh sách original documents với pagination"""
+    async def find_document_by_hash(self, content_hash: str) -> Optional[Document]:
+        """Tìm document gốc (không phải bản link) đã xử lý xong có cùng content hash"""
         async with self.pool.acquire() as conn:
-            # Get total count of original documents (not chunks)
-            count_query = """
-                SELECT COUNT(*) FROM documents 
-                WHERE filename NOT LIKE '%_chunk_%'
-            """
-            total = await conn.fetchval(count_query)
-            
-            # Get documents with pagination
-            offset = (page - 1) * size
             query = """
-                SELECT id, filename, content, file_size, embedding, metadata, status, created_at, updated_at
-                FROM documents 
-                WHERE filename NOT LIKE '%_chunk_%'
-                ORDER BY created_at DESC
-                LIMIT $1 OFFSET $2
+                SELECT id FROM documents
+                WHERE content_hash = $1 AND duplicate_of IS NULL AND status = 'completed'
+                ORDER BY created_at
+                LIMIT 1
             """
-            rows = await conn.fetch(query, size, offset)
-            
-            documents = []
-            for row in rows:
-                doc = Document(
-                    id=row['id'],
-                    filename=row['filename'],
-                    content=row['content'],
-                    file_size=row['file_size'],
-                    embedding=row['embedding'],
-                    metadata=json.loads(row['metadata']) if row['metadata'] else {},
-                    created_at=row['created_at'],
-                    updated_at=row['updated_at'],
-                    status=FileStatus(row['status'])
-                )
-                documents.append(doc)
+            doc_id = await conn.fetchval(query, content_hash)
+        return await self.get_document(doc_id) if doc_id else None
+
+    # Columns có thể chọn qua fields= (content không trả về mặc định)
+    LIST_FIELDS = (
+        "id", "filename", "content", "file_size", "metadata", "status",
+        "created_at", "updated_at", "content_hash", "duplicate_of"
+    )
+
+    async def get_all_documents(self, limit: int, fields: Sequence[str],
+                                after: Optional[Tuple[datetime, UUID]] = None, offset: Optional[int] = None,
+                                count: CountMode = CountMode.ESTIMATE
+                                ) -> Tuple[List[Dict[str, Any]], Optional[int], bool]:
+        """Lấy danh sách documents theo keyset (created_at, id), kèm (total, total có phải ước lượng không)"""
+        # id / created_at luôn cần để tạo cursor
+        wanted = set(fields) | {"id", "created_at"}
+        columns = ", ".join(field for field in self.LIST_FIELDS if field in wanted)
+        
+        async with self.pool.acquire() as conn:
+            if after is not None:
+                query = f"""
+                    SELECT {columns} FROM documents
+                    WHERE (created_at, id) < ($2, $3)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT $1
+                """
+                rows = await conn.fetch(query, limit, *after)
+            else:
+                # offset chỉ dùng cho legacy page= parameter
+                query = f"""
+                    SELECT {columns} FROM documents
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT $1 OFFSET $2
+                """
+                rows = await conn.fetch(query, limit, offset or 0)
             
-            return documents, total
+            total, is_estimate = await self._count_documents(conn, count)
+        
+        documents = []
+        for row in rows:
+            document = dict(row)
+            if "metadata" in document:
+                document["metadata"] = json.loads(document["metadata"]) if document["metadata"] else {}
+            documents.append(document)
+        return documents, total, is_estimate
+
+    @staticmethod
+    async def _count_documents(conn, count: CountMode) -> Tuple[Optional[int], bool]:
+        """(total, is_estimate) - ESTIMATE dùng COUNT(*) chính xác khi chưa có planner stats"""
+        if count == CountMode.NONE:
+            return None, False
+        if count == CountMode.ESTIMATE:
+            # reltuples được cập nhật bởi autovacuum / ANALYZE; -1 nếu bảng chưa từng được analyze
+            estimate = await conn.fetchval(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = 'documents'::regclass"
+            )
+            if estimate is not None and estimate >= 0:
+                return estimate, True
+        return await conn.fetchval("SELECT COUNT(*) FROM documents"), False
 
     async def update_document(self, doc_id: UUID, content: str = None, metadata: Dict = None) -> bool:
         """Cập nhật document"""
@@ -133,101 +194,309 @@ class DocumentRepository:
 
     async def delete_document(self, doc_id: UUID) -> bool:
         """Xóa document theo ID và tất cả chunks của nó"""
+        deleted = await self.delete_documents([doc_id])
+        return doc_id in deleted
+
+    async def delete_documents(self, doc_ids: List[UUID]) -> Dict[UUID, Optional[str]]:
+        """Xóa nhiều documents trong một transaction - trả về {id: file_path} của các documents đã xóa"""
+        if not doc_ids:
+            return {}
+        
         async with self.pool.acquire() as conn:
             async with conn.transaction():
-                # First, get the document to find file path
-                doc_query = "SELECT filename, metadata FROM documents WHERE id = $1"
-                doc_row = await conn.fetchrow(doc_query, doc_id)
+                # Hand the chunks over to a surviving linked duplicate, if any, so it stays searchable
+                await self._promote_duplicates(conn, doc_ids)
                 
-                if not doc_row:
-                    logger.warning(f"Document {doc_id} not found for deletion")
-                    return False
+                # Chunks are removed by ON DELETE CASCADE
+                rows = await conn.fetch("""
+                    DELETE FROM documents WHERE id = ANY($1::uuid[])
+                    RETURNING id, metadata->>'file_path' AS file_path
+                """, doc_ids)
+        
+        deleted = {row['id']: row['file_path'] for row in rows}
+        logger.info(f"Deleted {len(deleted)} of {len(doc_ids)} documents and their chunks")
+        return deleted
+
+    @staticmethod
+    async def _promote_duplicates(conn, doc_ids: List[UUID]) -> Dict[UUID, UUID]:
+        """Chuyển chunks của các documents gốc sang bản link cũ nhất không bị xóa cùng - trả về {gốc: bản link}"""
+        rows = await conn.fetch("""
+            SELECT DISTINCT ON (duplicate_of) duplicate_of AS doc_id, id AS successor
+            FROM documents
+            WHERE duplicate_of = ANY($1::uuid[]) AND NOT (id = ANY($1::uuid[]))
+            ORDER BY duplicate_of, created_at
+        """, doc_ids)
+        if not rows:
+            return {}
+        
+        originals = [row['doc_id'] for row in rows]
+        successors = [row['successor'] for row in rows]
+        await conn.execute("UPDATE documents SET duplicate_of = NULL WHERE id = ANY($1::uuid[])", successors)
+        await conn.execute("""
+            UPDATE documents d SET duplicate_of = m.successor
+            FROM unnest($1::uuid[], $2::uuid[]) AS m(doc_id, successor)
+            WHERE d.duplicate_of = m.doc_id
+        """, originals, successors)
+        await conn.execute("""
+            UPDATE document_chunks c SET document_id = m.successor
+            FROM unnest($1::uuid[], $2::uuid[]) AS m(doc_id, successor)
+            WHERE c.document_id = m.doc_id
+        """, originals, successors)
+        for row in rows:
+            logger.info(f"Promoted duplicate {row['successor']} to owner of chunks of document {row['doc_id']}")
+        return dict(zip(originals, successors))
+
+    async def delete_document_chunks(self, doc_id: UUID) -> int:
+        """Xóa tất cả chunks của document (giữ lại document gốc)"""
+        async with self.pool.acquire() as conn:
+            query = "DELETE FROM document_chunks WHERE document_id = $1"
+            result = await conn.execute(query, doc_id)
+            return int(result.split()[-1])
+
+    async def get_chunk_hashes(self, doc_id: UUID) -> List[tuple[UUID, str]]:
+        """Lấy (chunk id, content hash) theo thứ tự chunk_index"""
+        async with self.pool.acquire() as conn:
+            # Chunks cũ chưa có content_hash thì tính từ content
+            query = """
+                SELECT id, COALESCE(content_hash, encode(sha256(convert_to(content, 'UTF8')), 'hex')) AS content_hash
+                FROM document_chunks 
+                WHERE document_id = $1
+                ORDER BY chunk_index
+            """
+            rows = await conn.fetch(query, doc_id)
+            return [(row['id'], row['content_hash']) for row in rows]
+
+    async def has_duplicates(self, doc_id: UUID) -> bool:
+        """Document có linked duplicates dùng chung chunks hay không"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM documents WHERE duplicate_of = $1)", doc_id
+            )
+
+    async def apply_chunk_diff(self, doc_id: UUID, content: str, metadata: Dict,
+                               added: List[DocumentChunk], kept: Dict[UUID, int], removed: List[UUID],
+                               batch_size: int = 500) -> bool:
+        """Cập nhật content và áp dụng thay đổi chunks trong một transaction"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Bản link được tách ra thành document độc lập; document gốc giao chunks cũ cho bản link
+                detached = await conn.fetchval(
+                    "UPDATE documents SET duplicate_of = NULL WHERE id = $1 AND duplicate_of IS NOT NULL RETURNING id",
+                    doc_id
+                )
+                if not detached:
+                    await self._promote_duplicates(conn, [doc_id])
                 
-                # Delete all chunks of this document
-                chunks_query = """
-                    DELETE FROM documents 
-                    WHERE filename LIKE $1 AND metadata->>'parent_document_id' = $2
-                """
-                pattern = f"%_chunk_%"
-                chunks_result = await conn.execute(chunks_query, pattern, str(doc_id))
-                chunks_deleted = int(chunks_result.split()[-1])
-                logger.info(f"Deleted {chunks_deleted} chunks for document {doc_id}")
+                # content_hash is the uploaded file's SHA-256 (dedup key) - edited content no longer matches it
+                result = await conn.execute("""
+                    UPDATE documents SET content = $2, content_hash = NULL, metadata = $3, updated_at = NOW()
+                    WHERE id = $1
+                """, doc_id, content, json.dumps(metadata))
+                if result.split()[-1] == "0":
+                    return False
                 
-                # Delete the original document
-                query = "DELETE FROM documents WHERE id = $1"
-                result = await conn.execute(query, doc_id)
-                doc_deleted = result.split()[-1] != "0"
+                if removed:
+                    await conn.execute("DELETE FROM document_chunks WHERE id = ANY($1::uuid[])", removed)
                 
-                if doc_deleted:
-                    logger.info(f"Successfully deleted document {doc_id} and {chunks_deleted} chunks")
-                else:
-                    logger.error(f"Failed to delete document {doc_id}")
+                if kept:
+                    await conn.executemany(
+                        "UPDATE document_chunks SET chunk_index = $2 WHERE id = $1",
+                        list(kept.items())
+                    )
                 
-                return doc_deleted
+                for start in range(0, len(added), batch_size):
+                    await conn.executemany(
+                        self._INSERT_CHUNK_QUERY,
+                        [self._chunk_record(chunk) for chunk in added[start:start + batch_size]]
+                    )
+        
+        logger.info(
+            f"Reindexed document {doc_id}: {len(added)} added, {len(kept)} kept, {len(removed)} removed"
+        )
+        return True
 
-    async def search_similar_documents(self, embedding: List[float], limit: int = 5) -> List[Document]:
-        """Tìm documents tương tự dựa trên vector similarity - chỉ select trường cần thiết"""
-        async with self.pool.acquire() as conn:
-            # Format embedding for pgvector
-            embedding_param = f"[{','.join(map(str, embedding))}]"
+    @staticmethod
+    def _row_to_chunk_document(row, extra_metadata: Dict[str, Any] = None) -> Document:
+        """Chunk được trả về dưới dạng Document (filename = <document>_chunk_<index>) cho search / listing"""
+        metadata = json.loads(row['metadata']) if row['metadata'] else {}
+        metadata.update({
+            "parent_document_id": str(row['document_id']),
+            "chunk_index": row['chunk_index'],
+            **(extra_metadata or {})
+        })
+        return Document(
+            id=row['id'],
+            filename=f"{row['filename']}_chunk_{row['chunk_index']}",
+            content=row['content'],
+            file_size=0,  # Không cần thiết cho chunks
+            embedding=None,  # Không cần thiết cho chunks
+            metadata=metadata,
+            created_at=None,  # Không cần thiết cho chunks
+            updated_at=None,  # Không cần thiết cho chunks
+            status=FileStatus(row['status'])
+        )
+
+    # ANN distance theo storage mode - phải khớp expression của HNSW index (dbconnection.schema.VECTOR_INDEX_EXPRESSIONS)
+    VECTOR_DISTANCE_SQL = {
+        VectorStorageMode.FULL: "embedding <=> $1::vector",
+        VectorStorageMode.HALFVEC: "embedding::halfvec(768) <=> $1::vector::halfvec(768)",
+        VectorStorageMode.BINARY: "binary_quantize(embedding)::bit(768) <~> binary_quantize($1::vector)::bit(768)"
+    }
+
+    async def search_similar_documents(self, embedding: Sequence[float], limit: int = 5,
+                                       mode: VectorStorageMode = VectorStorageMode.FULL,
+                                       oversample: int = 4, ef_search: int = 40) -> List[Document]:
+        """Tìm chunks tương tự - quantized modes lấy oversampled candidates rồi re-rank bằng full vectors"""
+        candidates = limit if mode == VectorStorageMode.FULL else limit * max(oversample, 1)
+        async with self.pool.acquire() as conn, conn.transaction():
+            # HNSW trả về tối đa ef_search rows - không nhỏ hơn số candidates cần lấy
+            await conn.execute(
+                "SELECT set_config('hnsw.ef_search', $1, true)", str(max(ef_search, candidates))
+            )
             
-            # Vector search với pgvector - chỉ select trường cần thiết
-            query = """
-                SELECT id, filename, content, metadata, status,
-                       embedding <=> $1 as similarity_score
-                FROM documents 
-                WHERE embedding IS NOT NULL AND status = 'completed'
-                ORDER BY embedding <=> $1
-                LIMIT $2
+            # ANN scan trên document_chunks trước, re-rank bằng cosine distance, join documents chỉ cho top-k
+            query = f"""
+                SELECT c.id, c.document_id, c.chunk_index, c.content, c.metadata, c.status, c.similarity_score,
+                       d.filename
+                FROM (
+                    SELECT id, document_id, chunk_index, content, metadata, status,
+                           embedding <=> $1::vector AS similarity_score
+                    FROM (
+                        SELECT id, document_id, chunk_index, content, metadata, status, embedding
+                        FROM document_chunks
+                        WHERE embedding IS NOT NULL AND status = 'completed'
+                        ORDER BY {self.VECTOR_DISTANCE_SQL[mode]}
+                        LIMIT $3
+                    ) candidates
+                    ORDER BY similarity_score
+                    LIMIT $2
+                ) c
+                JOIN documents d ON d.id = c.document_id
+                ORDER BY c.similarity_score
             """
-            rows = await conn.fetch(query, embedding_param, limit)
+            rows = await conn.fetch(query, embedding, limit, candidates)
             
-            documents = []
-            for row in rows:
-                # Parse metadata và thêm similarity score
-                metadata = json.loads(row['metadata']) if row['metadata'] else {}
-                metadata['similarity_score'] = float(row['similarity_score'])
-                
-                doc = Document(
-                    id=row['id'],
-                    filename=row['filename'],
-                    content=row['content'],
-                    file_size=0,  # Không cần thiết cho search
-                    embedding=None,  # Không cần thiết cho search result
-                    metadata=metadata,
-                    created_at=None,  # Không cần thiết cho search
-                    updated_at=None,  # Không cần thiết cho search
-                    status=FileStatus(row['status'])
+            return [
+                self._row_to_chunk_document(row, {"similarity_score": float(row['similarity_score'])})
+                for row in rows
+            ]
+
+    async def hybrid_search_documents(self, embedding: Sequence[float], query_text: str, limit: int = 5,
+                                      mode: VectorStorageMode = VectorStorageMode.FULL, oversample: int = 4,
+                                      ef_search: int = 40, candidates: int = 20, vector_weight: float = 1.0,
+                                      text_weight: float = 1.0, rrf_k: int = 60) -> List[Document]:
+        """Vector + full-text search trong một query, gộp hai danh sách bằng reciprocal rank fusion"""
+        candidates = max(candidates, limit)
+        ann_candidates = candidates if mode == VectorStorageMode.FULL else candidates * max(oversample, 1)
+        async with self.pool.acquire() as conn, conn.transaction():
+            await conn.execute(
+                "SELECT set_config('hnsw.ef_search', $1, true)", str(max(ef_search, ann_candidates))
+            )
+            
+            query = f"""
+                WITH vector_hits AS (
+                    SELECT id, row_number() OVER (ORDER BY distance) AS rank
+                    FROM (
+                        SELECT id, embedding <=> $1::vector AS distance
+                        FROM (
+                            SELECT id, embedding FROM document_chunks
+                            WHERE embedding IS NOT NULL AND status = 'completed'
+                            ORDER BY {self.VECTOR_DISTANCE_SQL[mode]}
+                            LIMIT $3
+                        ) ann
+                        ORDER BY distance
+                        LIMIT $4
+                    ) v
+                ),
+                text_hits AS (
+                    SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+                    FROM (
+                        SELECT id, ts_rank(to_tsvector('english', content), query) AS score
+                        FROM document_chunks, websearch_to_tsquery('english', $2) AS query
+                        WHERE status = 'completed' AND to_tsvector('english', content) @@ query
+                        ORDER BY score DESC
+                        LIMIT $4
+                    ) t
+                ),
+                fused AS (
+                    SELECT id, SUM(score) AS rrf_score, MIN(vector_rank) AS vector_rank, MIN(text_rank) AS text_rank
+                    FROM (
+                        SELECT id, $5::float8 / ($7 + rank) AS score, rank AS vector_rank, NULL::bigint AS text_rank
+                        FROM vector_hits
+                        UNION ALL
+                        SELECT id, $6::float8 / ($7 + rank), NULL, rank
+                        FROM text_hits
+                    ) ranked
+                    GROUP BY id
+                    ORDER BY rrf_score DESC
+                    LIMIT $8
                 )
-                documents.append(doc)
+                SELECT c.id, c.document_id, c.chunk_index, c.content, c.metadata, c.status,
+                       f.rrf_score, f.vector_rank, f.text_rank, d.filename
+                FROM fused f
+                JOIN document_chunks c ON c.id = f.id
+                JOIN documents d ON d.id = c.document_id
+                ORDER BY f.rrf_score DESC
+            """
+            rows = await conn.fetch(
+                query, embedding, query_text, ann_candidates, candidates,
+                float(vector_weight), float(text_weight), rrf_k, limit
+            )
             
-            return documents
+            return [
+                self._row_to_chunk_document(row, {
+                    "rrf_score": float(row['rrf_score']),
+                    "vector_rank": row['vector_rank'],
+                    "text_rank": row['text_rank']
+                })
+                for row in rows
+            ]
+
+    _SEARCHABLE_CHUNKS_QUERY = """
+        SELECT c.id, c.document_id, c.chunk_index, c.content, c.metadata, c.status, c.embedding, d.filename
+        FROM document_chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE c.embedding IS NOT NULL AND c.status = 'completed'
+    """
+
+    # xmin của snapshot: mọi transaction có xid < xmin đã kết thúc và đã được snapshot nhìn thấy
+    _SNAPSHOT_XMIN_QUERY = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text"
+
+    async def get_searchable_chunks(self) -> Tuple[List[Any], str]:
+        """Toàn bộ chunks searchable (kèm embedding) và xmin của snapshot đã đọc chúng"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                xmin = await conn.fetchval(self._SNAPSHOT_XMIN_QUERY)
+                rows = await conn.fetch(self._SEARCHABLE_CHUNKS_QUERY)
+        return rows, xmin
+
+    async def get_chunk_changes(self, since_xid: str) -> Tuple[List[UUID], List[Any], str]:
+        """Chunks thay đổi bởi các transactions đã kết thúc trong [since_xid, xmin) - ids, rows hiện tại và xmin mới"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                xmin = await conn.fetchval(self._SNAPSHOT_XMIN_QUERY)
+                changed = await conn.fetch("""
+                    SELECT DISTINCT chunk_id FROM document_chunk_changes
+                    WHERE xid >= $1::text::xid8 AND xid < $2::text::xid8
+                """, since_xid, xmin)
+                chunk_ids = [row['chunk_id'] for row in changed]
+                # Chunk bị xóa hoặc không còn searchable sẽ không có row
+                rows = await conn.fetch(
+                    self._SEARCHABLE_CHUNKS_QUERY + " AND c.id = ANY($1::uuid[])", chunk_ids
+                ) if chunk_ids else []
+        return chunk_ids, rows, xmin
 
     async def get_document_chunks(self, doc_id: UUID) -> List[Document]:
         """Lấy chunks của document - chỉ select trường cần thiết"""
         async with self.pool.acquire() as conn:
+            # Linked duplicates dùng chung chunks với document gốc
             query = """
-                SELECT id, filename, content, metadata, status
-                FROM documents 
-                WHERE filename LIKE $1 AND metadata->>'parent_document_id' = $2
-                ORDER BY (metadata->>'chunk_index')::int
+                SELECT c.id, c.document_id, c.chunk_index, c.content, c.metadata, c.status, d.filename
+                FROM documents d
+                JOIN document_chunks c ON c.document_id = COALESCE(d.duplicate_of, d.id)
+                WHERE d.id = $1
+                ORDER BY c.chunk_index
             """
-            pattern = f"%_chunk_%"
-            rows = await conn.fetch(query, pattern, str(doc_id))
-            
-            chunks = []
-            for row in rows:
-                doc = Document(
-                    id=row['id'],
-                    filename=row['filename'],
-                    content=row['content'],
-                    file_size=0,  # Không cần thiết cho chunks
-                    embedding=None,  # Không cần thiết cho chunks
-                    metadata=json.loads(row['metadata']) if row['metadata'] else {},
-                    created_at=None,  # Không cần thiết cho chunks
-                    updated_at=None,  # Không cần thiết cho chunks
-                    status=FileStatus(row['status'])
-                )
-                chunks.append(doc)
+            rows = await conn.fetch(query, doc_id)
             
-            return chunks 
\ No newline at end of file
+            return [self._row_to_chunk_document(row) for row in rows]
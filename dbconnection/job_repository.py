@@ -0,0 +1,105 @@
+import logging
+from typing import List, Optional
+from uuid import UUID
+
+from model.models import IngestionJob, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+class JobRepository:
+    def __init__(self, pool):
+        self.pool = pool
+
+    @staticmethod
+    def _row_to_job(row) -> IngestionJob:
+        return IngestionJob(
+            id=row['id'],
+            document_id=row['document_id'],
+            status=JobStatus(row['status']),
+            attempts=row['attempts'],
+            max_attempts=row['max_attempts'],
+            worker_id=row['worker_id'],
+            last_error=row['last_error']
+        )
+
+    async def enqueue_job(self, document_id: UUID, max_attempts: int = 3) -> UUID:
+        """Thêm ingestion job vào queue"""
+        async with self.pool.acquire() as conn:
+            query = """
+                INSERT INTO ingestion_jobs (document_id, max_attempts)
+                VALUES ($1, $2)
+                RETURNING id
+            """
+            return await conn.fetchval(query, document_id, max_attempts)
+
+    async def claim_job(self, worker_id: str) -> Optional[IngestionJob]:
+        """Claim job tiếp theo - SKIP LOCKED để nhiều workers không tranh nhau cùng một row"""
+        async with self.pool.acquire() as conn:
+            query = """
+                UPDATE ingestion_jobs
+                SET status = 'running', worker_id = $1, attempts = attempts + 1,
+                    heartbeat_at = NOW(), updated_at = NOW()
+                WHERE id = (
+                    SELECT id FROM ingestion_jobs
+                    WHERE status = 'queued' AND run_after <= NOW()
+                    ORDER BY run_after
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, document_id, status, attempts, max_attempts, worker_id, last_error
+            """
+            row = await conn.fetchrow(query, worker_id)
+            return self._row_to_job(row) if row else None
+
+    async def heartbeat(self, job_id: UUID, worker_id: str) -> bool:
+        """Cập nhật heartbeat - False nếu job không còn thuộc về worker này"""
+        async with self.pool.acquire() as conn:
+            query = """
+                UPDATE ingestion_jobs SET heartbeat_at = NOW()
+                WHERE id = $1 AND worker_id = $2 AND status = 'running'
+            """
+            result = await conn.execute(query, job_id, worker_id)
+            return result.split()[-1] != "0"
+
+    async def complete_job(self, job_id: UUID, worker_id: str) -> bool:
+        """Đánh dấu job hoàn thành"""
+        async with self.pool.acquire() as conn:
+            query = """
+                UPDATE ingestion_jobs SET status = 'completed', last_error = NULL, updated_at = NOW()
+                WHERE id = $1 AND worker_id = $2 AND status = 'running'
+            """
+            result = await conn.execute(query, job_id, worker_id)
+            return result.split()[-1] != "0"
+
+    async def fail_job(self, job_id: UUID, worker_id: str, error: str, retry_delay: float) -> Optional[JobStatus]:
+        """Requeue job nếu còn attempts, ngược lại đánh dấu failed - trả về status mới"""
+        async with self.pool.acquire() as conn:
+            query = """
+                UPDATE ingestion_jobs
+                SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                    run_after = NOW() + make_interval(secs => $4),
+                    worker_id = NULL, last_error = $3, updated_at = NOW()
+                WHERE id = $1 AND worker_id = $2 AND status = 'running'
+                RETURNING status
+            """
+            status = await conn.fetchval(query, job_id, worker_id, error, float(retry_delay))
+            return JobStatus(status) if status else None
+
+    async def requeue_stalled_jobs(self, stall_timeout: float) -> List[IngestionJob]:
+        """Requeue các job có heartbeat quá hạn (worker chết hoặc bị treo)"""
+        async with self.pool.acquire() as conn:
+            query = """
+                UPDATE ingestion_jobs
+                SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                    run_after = NOW(), worker_id = NULL,
+                    last_error = 'Worker heartbeat timed out', updated_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM ingestion_jobs
+                    WHERE status = 'running' AND heartbeat_at < NOW() - make_interval(secs => $1)
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, document_id, status, attempts, max_attempts, worker_id, last_error
+            """
+            rows = await conn.fetch(query, float(stall_timeout))
+            return [self._row_to_job(row) for row in rows]
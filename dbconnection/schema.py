@@ -1,85 +1,419 @@
 import logging
+from typing import Awaitable, Callable, List, Sequence, Tuple, Union
+
+import asyncpg
 
 logger = logging.getLogger(__name__)
 
+# pg_advisory_lock key - chỉ một process chạy migrations tại một thời điểm
+MIGRATION_LOCK_ID = 7305218391
+
+Step = Union[str, Callable[[asyncpg.Connection], Awaitable[None]]]
+
+
+class Migration:
+    def __init__(self, version: int, name: str, steps: Sequence[Step], transactional: bool = True):
+        self.version = version
+        self.name = name
+        self.steps = list(steps)
+        # CREATE INDEX CONCURRENTLY không chạy được trong transaction
+        self.transactional = transactional
+
+
+def concurrent_index(name: str, definition: str) -> Step:
+    """Step tạo index CONCURRENTLY - drop index INVALID còn sót lại từ lần build lỗi trước"""
+    async def step(conn):
+        valid = await conn.fetchval("""
+            SELECT i.indisvalid FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = $1
+        """, name)
+        if valid is False:
+            logger.warning(f"Dropping invalid index {name}")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        logger.info(f"Building index {name}")
+        await conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+    return step
+
+
+async def _migrate_legacy_chunks(conn):
+    """Chuyển chunk rows cũ (filename LIKE '%_chunk_%' trong documents) sang document_chunks"""
+    has_embedding = await conn.fetchval("""
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'documents' AND column_name = 'embedding'
+        )
+    """)
+    if not has_embedding:
+        return
+
+    moved = await conn.execute("""
+        INSERT INTO document_chunks (id, document_id, chunk_index, content, content_hash, embedding, status, created_at)
+        SELECT c.id, p.id, COALESCE((c.metadata->>'chunk_index')::int, 0), c.content,
+               COALESCE(c.content_hash, encode(sha256(convert_to(c.content, 'UTF8')), 'hex')),
+               c.embedding, c.status, c.created_at
+        FROM documents c
+        JOIN documents p ON p.id::text = c.metadata->>'parent_document_id'
+        WHERE c.filename LIKE '%\\_chunk\\_%' AND c.metadata ? 'parent_document_id'
+        ON CONFLICT (id) DO NOTHING
+    """)
+    deleted = await conn.execute("""
+        DELETE FROM documents
+        WHERE filename LIKE '%\\_chunk\\_%' AND metadata ? 'parent_document_id'
+    """)
+    await conn.execute("DROP INDEX IF EXISTS documents_embedding_idx")
+    await conn.execute("DROP INDEX IF EXISTS idx_documents_content_fts")
+    await conn.execute("ALTER TABLE documents DROP COLUMN embedding")
+
+    logger.info(f"Migrated legacy chunks: {moved.split()[-1]} moved, {deleted.split()[-1]} removed from documents")
+
+
+# Thứ tự là lịch sử schema - chỉ thêm migration mới vào cuối, không sửa migration đã release
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial tables", [
+        "CREATE EXTENSION IF NOT EXISTS vector",
+        """
+        CREATE TABLE IF NOT EXISTS documents (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            filename TEXT NOT NULL,
+            content TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            metadata JSONB DEFAULT '{}',
+            status TEXT DEFAULT 'completed',
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        """,
+        # Content hash / duplicate link columns for upload deduplication
+        """
+        ALTER TABLE documents
+            ADD COLUMN IF NOT EXISTS content_hash TEXT,
+            ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES documents(id) ON DELETE SET NULL
+        """,
+        # Chunks table - embeddings only live on chunks
+        """
+        CREATE TABLE IF NOT EXISTS document_chunks (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+            chunk_index INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            content_hash TEXT,
+            embedding vector(768),
+            metadata JSONB DEFAULT '{}',
+            status TEXT DEFAULT 'completed',
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+        """,
+        _migrate_legacy_chunks,
+        """
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            chat_id UUID PRIMARY KEY,
+            question TEXT NOT NULL,
+            response TEXT NOT NULL,
+            retrieved_docs JSONB DEFAULT '[]',
+            latency_ms INTEGER NOT NULL,
+            timestamp TIMESTAMP DEFAULT NOW(),
+            feedback TEXT,
+            model_confidence FLOAT
+        )
+        """,
+        # Ingestion job queue
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            worker_id TEXT,
+            last_error TEXT,
+            run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+            heartbeat_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    ]),
+    Migration(2, "initial indexes", [
+        # HNSW index on document_chunks.embedding is owned by ensure_vector_indexes
+        # Non-unique: re-index shifts chunk_index values inside one transaction
+        concurrent_index("idx_document_chunks_document", "ON document_chunks(document_id, chunk_index)"),
+        concurrent_index("idx_document_chunks_content_fts",
+                         "ON document_chunks USING gin (to_tsvector('english', content))"),
+        concurrent_index("idx_documents_status_created", "ON documents(status, created_at)"),
+        concurrent_index("idx_documents_filename", "ON documents(filename)"),
+        concurrent_index("idx_documents_content_hash", "ON documents(content_hash)"),
+        concurrent_index("idx_documents_duplicate_of",
+                         "ON documents(duplicate_of) WHERE duplicate_of IS NOT NULL"),
+        concurrent_index("idx_documents_metadata", "ON documents USING gin (metadata)"),
+        concurrent_index("idx_audit_logs_timestamp", "ON audit_logs(timestamp)"),
+        concurrent_index("idx_audit_logs_latency", "ON audit_logs(latency_ms)"),
+        # Partial indexes for job claiming and stalled job detection
+        concurrent_index("idx_ingestion_jobs_queued", "ON ingestion_jobs(run_after) WHERE status = 'queued'"),
+        concurrent_index("idx_ingestion_jobs_running", "ON ingestion_jobs(heartbeat_at) WHERE status = 'running'")
+    ], transactional=False),
+    Migration(3, "documents keyset index", [
+        # Keyset pagination for GET /knowledge: ORDER BY created_at DESC, id DESC
+        concurrent_index("idx_documents_created_id", "ON documents(created_at DESC, id DESC)")
+    ], transactional=False),
+    Migration(4, "partitioned audit logs and hourly rollups", [
+        # Move the plain table aside; its index names are reused by the partitioned table
+        "DROP INDEX IF EXISTS idx_audit_logs_timestamp",
+        "DROP INDEX IF EXISTS idx_audit_logs_latency",
+        "ALTER TABLE audit_logs RENAME TO audit_logs_legacy",
+        "ALTER INDEX audit_logs_pkey RENAME TO audit_logs_legacy_pkey",
+        """
+        CREATE TABLE audit_logs (
+            chat_id UUID NOT NULL,
+            question TEXT NOT NULL,
+            response TEXT NOT NULL,
+            retrieved_docs JSONB DEFAULT '[]',
+            latency_ms INTEGER NOT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+            feedback TEXT,
+            model_confidence FLOAT,
+            PRIMARY KEY (chat_id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        # Catches rows outside the pre-created daily partitions; ensure_audit_log_partitions moves them out
+        "CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT",
+        "CREATE INDEX idx_audit_logs_timestamp ON audit_logs(timestamp)",
+        """
+        CREATE OR REPLACE FUNCTION ensure_audit_log_partitions(p_from DATE, p_to DATE) RETURNS INTEGER AS $$
+        DECLARE
+            cur_day DATE := p_from;
+            part TEXT;
+            created INTEGER := 0;
+        BEGIN
+            WHILE cur_day < p_to LOOP
+                part := 'audit_logs_p' || to_char(cur_day, 'YYYYMMDD');
+                IF to_regclass(part) IS NULL THEN
+                    IF EXISTS (SELECT 1 FROM audit_logs_default WHERE timestamp >= cur_day AND timestamp < cur_day + 1) THEN
+                        -- Rows already landed in the default partition: move them, then attach
+                        EXECUTE format('CREATE TABLE %I (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part);
+                        EXECUTE format(
+                            'WITH moved AS (DELETE FROM audit_logs_default WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+                            'INSERT INTO %I SELECT * FROM moved', cur_day, cur_day + 1, part);
+                        EXECUTE format('ALTER TABLE audit_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                       part, cur_day, cur_day + 1);
+                    ELSE
+                        EXECUTE format('CREATE TABLE %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+                                       part, cur_day, cur_day + 1);
+                    END IF;
+                    created := created + 1;
+                END IF;
+                cur_day := cur_day + 1;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION drop_audit_log_partitions(p_before DATE) RETURNS SETOF TEXT AS $$
+        DECLARE
+            part RECORD;
+        BEGIN
+            FOR part IN
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'audit_logs'::regclass AND c.relname ~ '^audit_logs_p[0-9]{8}$'
+                  AND to_date(substring(c.relname FROM 13), 'YYYYMMDD') + 1 <= p_before
+                ORDER BY c.relname
+            LOOP
+                EXECUTE format('DROP TABLE %I', part.relname);
+                RETURN NEXT part.relname;
+            END LOOP;
+            DELETE FROM audit_logs_default WHERE timestamp < p_before;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        SELECT ensure_audit_log_partitions(d, d + 1)
+        FROM (SELECT DISTINCT timestamp::date AS d FROM audit_logs_legacy WHERE timestamp IS NOT NULL) days
+        """,
+        "SELECT ensure_audit_log_partitions((NOW() AT TIME ZONE 'UTC')::date, (NOW() AT TIME ZONE 'UTC')::date + 7)",
+        """
+        INSERT INTO audit_logs (chat_id, question, response, retrieved_docs, latency_ms, timestamp, feedback, model_confidence)
+        SELECT chat_id, question, response, retrieved_docs, latency_ms, COALESCE(timestamp, NOW()), feedback, model_confidence
+        FROM audit_logs_legacy
+        """,
+        "DROP TABLE audit_logs_legacy",
+        # Hourly volume / latency percentiles; dashboards read this instead of raw logs
+        """
+        CREATE TABLE IF NOT EXISTS audit_log_rollups (
+            bucket TIMESTAMP PRIMARY KEY,
+            requests INTEGER NOT NULL,
+            avg_latency_ms FLOAT NOT NULL,
+            p50_latency_ms FLOAT NOT NULL,
+            p95_latency_ms FLOAT NOT NULL,
+            p99_latency_ms FLOAT NOT NULL,
+            max_latency_ms INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    ]),
+    Migration(5, "document chunk change log", [
+        # Polled by LocalVectorIndex; xid lets readers consume only finished transactions
+        """
+        CREATE TABLE IF NOT EXISTS document_chunk_changes (
+            seq BIGSERIAL PRIMARY KEY,
+            chunk_id UUID NOT NULL,
+            xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+            changed_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_document_chunk_changes_xid ON document_chunk_changes(xid)",
+        "CREATE INDEX IF NOT EXISTS idx_document_chunk_changes_changed_at ON document_chunk_changes(changed_at)",
+        """
+        CREATE OR REPLACE FUNCTION log_document_chunk_changes() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO document_chunk_changes (chunk_id) SELECT id FROM old_rows;
+            ELSE
+                INSERT INTO document_chunk_changes (chunk_id) SELECT id FROM new_rows;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Statement-level with transition tables: one INSERT per statement, not per row
+        """
+        CREATE TRIGGER document_chunks_log_insert AFTER INSERT ON document_chunks
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_document_chunk_changes()
+        """,
+        """
+        CREATE TRIGGER document_chunks_log_update AFTER UPDATE ON document_chunks
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_document_chunk_changes()
+        """,
+        # Also fires for chunks removed by ON DELETE CASCADE from documents
+        """
+        CREATE TRIGGER document_chunks_log_delete AFTER DELETE ON document_chunks
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_document_chunk_changes()
+        """
+    ]),
+    Migration(6, "audit cache source", [
+        # Added to every partition of audit_logs
+        "ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS cache_source TEXT",
+        "ALTER TABLE audit_log_rollups ADD COLUMN IF NOT EXISTS cache_hits INTEGER NOT NULL DEFAULT 0"
+    ])
+]
+
+
+# Vector index theo VECTOR_STORAGE_MODE - expression phải khớp với ORDER BY trong search_similar_documents
+VECTOR_INDEX_EXPRESSIONS = {
+    "full": "embedding vector_cosine_ops",
+    "halfvec": "(embedding::halfvec(768)) halfvec_cosine_ops",
+    "binary": "(binary_quantize(embedding)::bit(768)) bit_hamming_ops"
+}
+
+
+def vector_index(mode: str, m: int, ef_construction: int) -> Tuple[str, str]:
+    """Tên + definition của HNSW index - build params nằm trong tên để đổi settings sẽ build index mới"""
+    if mode not in VECTOR_INDEX_EXPRESSIONS:
+        raise ValueError(f"Invalid vector storage mode. Supported: {', '.join(VECTOR_INDEX_EXPRESSIONS)}")
+    name = f"document_chunks_embedding_{mode}_m{int(m)}_ef{int(ef_construction)}_idx"
+    # Partial: chỉ chunks searchable, khớp với filter của search_similar_documents
+    definition = (
+        f"ON document_chunks USING hnsw ({VECTOR_INDEX_EXPRESSIONS[mode]}) "
+        f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)}) "
+        f"WHERE status = 'completed'"
+    )
+    return name, definition
+
+
+class SchemaOutOfDateError(RuntimeError):
+    pass
+
 
 class DatabaseSchema:
+    latest_version = MIGRATIONS[-1].version
+
+    @staticmethod
+    async def get_version(conn) -> int:
+        """Version hiện tại của schema - 0 nếu chưa có bảng schema_migrations"""
+        try:
+            return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        except asyncpg.UndefinedTableError:
+            return 0
+
+    @staticmethod
+    async def check_version(pool) -> Tuple[int, int]:
+        """Kiểm tra version khi startup - chỉ một query, không chạy DDL"""
+        async with pool.acquire() as conn:
+            current = await DatabaseSchema.get_version(conn)
+        return current, DatabaseSchema.latest_version
+
     @staticmethod
-    async def create_tables(pool):
-        """Tạo tables nếu chưa tồn tại với optimized indexes"""
+    async def migrate(pool) -> List[Migration]:
+        """Áp dụng các migrations còn thiếu dưới advisory lock - trả về migrations đã chạy"""
+        applied = []
         async with pool.acquire() as conn:
-            # Enable pgvector extension
-            await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
-            
-            # Create documents table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS documents (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    filename TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    file_size INTEGER NOT NULL,
-                    embedding vector(768),
-                    metadata JSONB DEFAULT '{}',
-                    status TEXT DEFAULT 'completed',
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            
-            # Create audit_logs table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS audit_logs (
-                    chat_id UUID PRIMARY KEY,
-                    question TEXT NOT NULL,
-                    response TEXT NOT NULL,
-                    retrieved_docs JSONB DEFAULT '[]',
-                    latency_ms INTEGER NOT NULL,
-                    timestamp TIMESTAMP DEFAULT NOW(),
-                    feedback TEXT,
-                    model_confidence FLOAT
-                )
-            """)
-            
-            # Create optimized indexes for better performance
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS documents_embedding_idx 
-                ON documents USING hnsw (embedding vector_cosine_ops)
-            """)
-            
-            # Add composite indexes for faster queries
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_documents_status_created 
-                ON documents(status, created_at)
-            """)
-            
-            # Add index for filename searches
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_documents_filename 
-                ON documents(filename)
-            """)
-            
-            # Add index for metadata queries
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_documents_metadata 
-                ON documents USING gin (metadata)
-            """)
-            
-            # Add full-text search index for content
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_documents_content_fts 
-                ON documents USING gin (to_tsvector('english', content))
-            """)
-            
-            # Add index for audit logs timestamp
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp 
-                ON audit_logs(timestamp)
-            """)
-            
-            # Add index for audit logs latency
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_audit_logs_latency 
-                ON audit_logs(latency_ms)
-            """)
-            
-            logger.info("Database tables and indexes created successfully") 
\ No newline at end of file
+            # Session-level lock: giữ qua nhiều transactions và các lệnh CONCURRENTLY
+            await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+            try:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMP DEFAULT NOW()
+                    )
+                """)
+                # Đọc lại version sau khi có lock - replica khác có thể vừa migrate xong
+                current = await DatabaseSchema.get_version(conn)
+                for migration in MIGRATIONS:
+                    if migration.version <= current:
+                        continue
+                    logger.info(f"Applying migration {migration.version}: {migration.name}")
+                    if migration.transactional:
+                        async with conn.transaction():
+                            await DatabaseSchema._run_steps(conn, migration)
+                            await DatabaseSchema._record(conn, migration)
+                    else:
+                        # Steps phải idempotent: lỗi giữa chừng thì chạy lại toàn bộ migration
+                        await DatabaseSchema._run_steps(conn, migration)
+                        await DatabaseSchema._record(conn, migration)
+                    applied.append(migration)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+        if applied:
+            logger.info(f"Applied {len(applied)} migrations, schema at version {applied[-1].version}")
+        else:
+            logger.info("Database schema is up to date")
+        return applied
+
+    @staticmethod
+    async def ensure_vector_indexes(pool, mode: str, m: int, ef_construction: int, prune: bool = True):
+        """Build HNSW index theo storage mode / build params, sau đó drop các HNSW index cũ để giải phóng memory"""
+        name, definition = vector_index(mode, m, ef_construction)
+        async with pool.acquire() as conn:
+            await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+            try:
+                await concurrent_index(name, definition)(conn)
+                if prune:
+                    # Index mới đã sẵn sàng trước khi drop index cũ - search không bị rơi về seq scan
+                    stale = await conn.fetch("""
+                        SELECT indexname FROM pg_indexes
+                        WHERE tablename = 'document_chunks' AND indexdef ILIKE '%USING hnsw%' AND indexname <> $1
+                    """, name)
+                    for row in stale:
+                        logger.info(f"Dropping HNSW index {row['indexname']}")
+                        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {row['indexname']}")
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+        logger.info(f"Vector index {name} ready")
+
+    @staticmethod
+    async def _run_steps(conn, migration: Migration):
+        for step in migration.steps:
+            if isinstance(step, str):
+                await conn.execute(step)
+            else:
+                await step(conn)
+
+    @staticmethod
+    async def _record(conn, migration: Migration):
+        await conn.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+            migration.version, migration.name
+        )
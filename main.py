@@ -1,12 +1,17 @@
 import logging
-from fastapi import FastAPI, BackgroundTasks, UploadFile, File
+from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
+from config.settings import settings
 from dbconnection.database import db_manager
 from service.knowledge_base_service import KnowledgeBaseService
+from service.audit_writer import audit_writer
+from service.local_vector_index import local_vector_index
 from api.routes import APIRoutes
 from model.models import ChatRequest
 # Load environment variables
@@ -32,6 +37,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Multipart framing allowance per file when checking Content-Length
+MULTIPART_OVERHEAD_PER_FILE = 64 * 1024
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject uploads whose declared body size is already over the limit, before the body is read"""
+    if request.method == "POST" and request.url.path.startswith("/knowledge/upload"):
+        max_files = 50 if request.url.path.endswith("/batch") else 1
+        limit = (settings.max_file_size + MULTIPART_OVERHEAD_PER_FILE) * max_files
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File size exceeds limit of {settings.max_file_size} bytes"}
+            )
+    return await call_next(request)
+
+
 # Initialize services
 knowledge_base_service = KnowledgeBaseService()
 api_routes = APIRoutes(knowledge_base_service)
@@ -42,6 +66,9 @@ async def startup_event():
     """Initialize database connection on startup"""
     try:
         await db_manager.connect()
+        audit_writer.start()
+        if settings.local_index_enabled:
+            await local_vector_index.start()
         logger.info("Application started successfully")
     except Exception as e:
         logger.error(f"Failed to start application: {e}")
@@ -52,6 +79,9 @@ async def startup_event():
 async def shutdown_event():
     """Close database connection on shutdown"""
     try:
+        # Drain buffered audit logs before the pool closes
+        await audit_writer.stop()
+        await local_vector_index.stop()
         await db_manager.disconnect()
         logger.info("Application shutdown successfully")
     except Exception as e:
@@ -76,19 +106,22 @@ async def root():
 #     return await api_routes.upload_multiple_files(background_tasks, files)
 
 @app.post("/knowledge/upload")
-async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), dedup: Optional[str] = None):
     """Upload file endpoint"""
-    return await api_routes.upload_file(background_tasks, file)
+    return await api_routes.upload_file(background_tasks, file, dedup)
 
 @app.post("/knowledge/upload/batch")
-async def upload_multiple_files(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
-    """Upload multiple files endpoint"""
-    return await api_routes.upload_multiple_files(background_tasks, files)
+async def upload_multiple_files(request: Request, background_tasks: BackgroundTasks,
+                                files: List[UploadFile] = File(...), dedup: Optional[str] = None):
+    """Upload multiple files endpoint (NDJSON progress with Accept: application/x-ndjson)"""
+    stream = "application/x-ndjson" in request.headers.get("accept", "")
+    return await api_routes.upload_multiple_files(background_tasks, files, dedup, stream)
 
 @app.get("/knowledge")
-async def get_documents(page: int = 1, size: int = 10):
+async def get_documents(size: int = 10, cursor: Optional[str] = None, fields: Optional[str] = None,
+                        count: Optional[str] = None, page: Optional[int] = None):
     """Get documents endpoint"""
-    return await api_routes.get_documents(page, size)
+    return await api_routes.get_documents(size, cursor, fields, count, page)
 
 
 @app.get("/knowledge/{doc_id}")
@@ -128,15 +161,21 @@ async def retry_document_processing(doc_id):
 
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
     """Chat endpoint"""
-    return await api_routes.chat(request)
+    return await api_routes.chat(request, background_tasks)
 
 
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, background_tasks: BackgroundTasks):
     """Chat streaming endpoint"""
-    return await api_routes.chat_stream(request)
+    return await api_routes.chat_stream(request, background_tasks)
+
+
+@app.get("/audit/rollups")
+async def get_audit_rollups(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Get hourly audit rollups endpoint"""
+    return await api_routes.get_audit_rollups(start, end)
 
 
 @app.get("/audit/{chat_id}")
@@ -145,6 +184,12 @@ async def get_audit_log(chat_id):
     return await api_routes.get_audit_log(chat_id)
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics endpoint"""
+    return await api_routes.get_metrics()
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,52 @@
+"""
+Apply database schema migrations.
+
+    python migrate.py                        # áp dụng migrations + vector index theo VECTOR_STORAGE_MODE
+    python migrate.py --status               # chỉ in version hiện tại
+    python migrate.py --keep-vector-indexes  # không drop index của các storage mode khác
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run(status_only: bool, prune_vector_indexes: bool = True) -> int:
+    from config.settings import settings
+    from dbconnection.connection import DatabaseConnection
+    from dbconnection.schema import DatabaseSchema
+
+    connection = DatabaseConnection()
+    await connection.connect()
+    try:
+        pool = await connection.get_pool()
+        current, latest = await DatabaseSchema.check_version(pool)
+        logger.info(f"Schema version {current}, latest {latest}")
+        if status_only:
+            return 0 if current >= latest else 1
+        await DatabaseSchema.migrate(pool)
+        await DatabaseSchema.ensure_vector_indexes(
+            pool, settings.vector_storage_mode, settings.hnsw_m, settings.hnsw_ef_construction,
+            prune_vector_indexes
+        )
+        return 0
+    finally:
+        await connection.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Knowledge base schema migrations")
+    parser.add_argument("--status", action="store_true", help="Only report the schema version")
+    parser.add_argument("--keep-vector-indexes", action="store_true",
+                        help="Keep HNSW indexes of other vector storage modes")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.status, not args.keep_vector_indexes)))
@@ -1,5 +1,6 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
+import numpy as np
 from uuid import UUID
 from pydantic import BaseModel, Field
 from enum import Enum
@@ -12,6 +13,13 @@ class FileStatus(str, Enum):
     FAILED = "failed"
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class DocumentBase(BaseModel):
     filename: str = Field(..., description="Tên file gốc")
     content: str = Field(..., description="Nội dung file text")
@@ -40,15 +48,30 @@ class DocumentResponse(DocumentBase):
 
 
 class DocumentListResponse(BaseModel):
-    documents: List[DocumentResponse]
-    total: int
-    page: int
+    documents: List[Dict[str, Any]] = Field(..., description="Documents với các trường được chọn qua fields=")
+    total: Optional[int] = None
+    total_is_estimate: bool = False
     size: int
+    page: Optional[int] = None
+    next_cursor: Optional[str] = Field(None, description="Truyền vào cursor= để lấy trang tiếp theo")
+
+
+class SearchMode(str, Enum):
+    VECTOR = "vector"    # Chỉ ANN vector search
+    HYBRID = "hybrid"    # Vector + full-text, gộp bằng reciprocal rank fusion
+
+
+class CacheSource(str, Enum):
+    SEMANTIC = "semantic"  # Câu trả lời của một câu hỏi gần giống (semantic answer cache)
 
 
 class ChatRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=1000)
     stream: bool = Field(default=False, description="Enable streaming response")
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000, description="HNSW ef_search cho request này (recall vs latency)")
+    search_mode: Optional[SearchMode] = Field(default=None, description="vector | hybrid (default: settings.search_mode)")
+    vector_weight: Optional[float] = Field(default=None, ge=0, le=10, description="Trọng số RRF của vector search (hybrid)")
+    text_weight: Optional[float] = Field(default=None, ge=0, le=10, description="Trọng số RRF của full-text search (hybrid)")
 
 
 class ChatResponse(BaseModel):
@@ -73,6 +96,7 @@ class AuditLogResponse(BaseModel):
     timestamp: datetime
     feedback: Optional[str] = None
     model_confidence: Optional[float] = None
+    cache_source: Optional[str] = None
 
     model_config = {
         "from_attributes": True,  # Migrated from Config class
@@ -80,12 +104,36 @@ class AuditLogResponse(BaseModel):
     }
 
 
+class CountMode(str, Enum):
+    NONE = "none"            # Không đếm
+    ESTIMATE = "estimate"    # Ước lượng từ pg_class.reltuples
+    EXACT = "exact"          # COUNT(*)
+
+
+class VectorStorageMode(str, Enum):
+    FULL = "full"          # HNSW trên vector(768) float32
+    HALFVEC = "halfvec"    # HNSW trên embedding::halfvec(768), re-rank bằng full vectors
+    BINARY = "binary"      # HNSW Hamming trên binary_quantize(embedding), re-rank bằng full vectors
+
+
+class OverflowPolicy(str, Enum):
+    DROP = "drop"      # Bỏ entry mới khi queue đầy
+    BLOCK = "block"    # Chờ tới khi queue có chỗ
+
+
+class DedupMode(str, Enum):
+    OFF = "off"        # Luôn tạo document mới
+    REUSE = "reuse"    # Trả về document đã tồn tại
+    LINK = "link"      # Tạo document mới dùng chung chunks với document đã tồn tại
+
+
 class UploadResponse(BaseModel):
     file_id: UUID
     filename: str
     status: FileStatus
     message: str
     file_size: int
+    duplicate_of: Optional[UUID] = None
 
 
 class ErrorResponse(BaseModel):
@@ -116,11 +164,13 @@ class Document:
         filename: str,
         content: str,
         file_size: int,
-        embedding: Optional[List[float]] = None,
+        embedding: Optional[Union[List[float], np.ndarray]] = None,
         metadata: Dict[str, Any] = None,
         created_at: datetime = None,
         updated_at: datetime = None,
-        status: FileStatus = FileStatus.COMPLETED
+        status: FileStatus = FileStatus.COMPLETED,
+        content_hash: Optional[str] = None,
+        duplicate_of: Optional[UUID] = None
     ):
         self.id = id
         self.filename = filename
@@ -131,6 +181,32 @@ class Document:
         self.created_at = created_at or datetime.utcnow()
         self.updated_at = updated_at or datetime.utcnow()
         self.status = status
+        self.content_hash = content_hash
+        self.duplicate_of = duplicate_of
+
+
+class DocumentChunk:
+    def __init__(
+        self,
+        id: UUID,
+        document_id: UUID,
+        chunk_index: int,
+        content: str,
+        embedding: Optional[Union[List[float], np.ndarray]] = None,
+        content_hash: Optional[str] = None,
+        metadata: Dict[str, Any] = None,
+        status: FileStatus = FileStatus.COMPLETED,
+        created_at: datetime = None
+    ):
+        self.id = id
+        self.document_id = document_id
+        self.chunk_index = chunk_index
+        self.content = content
+        self.embedding = embedding
+        self.content_hash = content_hash
+        self.metadata = metadata or {}
+        self.status = status
+        self.created_at = created_at or datetime.utcnow()
 
 
 class AuditLog:
@@ -143,7 +219,8 @@ class AuditLog:
         latency_ms: int,
         timestamp: datetime = None,
         feedback: Optional[str] = None,
-        model_confidence: Optional[float] = None
+        model_confidence: Optional[float] = None,
+        cache_source: Optional[str] = None
     ):
         self.chat_id = chat_id
         self.question = question
@@ -152,4 +229,37 @@ class AuditLog:
         self.latency_ms = latency_ms
         self.timestamp = timestamp or datetime.utcnow()
         self.feedback = feedback
-        self.model_confidence = model_confidence
\ No newline at end of file
+        self.model_confidence = model_confidence
+        self.cache_source = cache_source  # CacheSource value when the answer came from a cache
+
+
+class AuditRollup(BaseModel):
+    bucket: datetime
+    requests: int
+    avg_latency_ms: float
+    p50_latency_ms: float
+    p95_latency_ms: float
+    p99_latency_ms: float
+    max_latency_ms: int
+    cache_hits: int = 0
+    cache_hit_ratio: float = 0.0
+
+
+class IngestionJob:
+    def __init__(
+        self,
+        id: UUID,
+        document_id: UUID,
+        status: JobStatus = JobStatus.QUEUED,
+        attempts: int = 0,
+        max_attempts: int = 3,
+        worker_id: Optional[str] = None,
+        last_error: Optional[str] = None
+    ):
+        self.id = id
+        self.document_id = document_id
+        self.status = status
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id
+        self.last_error = last_error
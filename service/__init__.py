@@ -1,10 +1,11 @@
-from .knowledge_base_service import KnowledgeBaseService
+from .knowledge_base_service import KnowledgeBaseService, DocumentStateError
 from .file_processor import FileProcessingService
 from .embedding_service import EmbeddingService
 from .ai_service import AIService
 
 __all__ = [
     'KnowledgeBaseService',
+    'DocumentStateError',
     'FileProcessingService', 
     'EmbeddingService',
     'AIService'
@@ -2,17 +2,22 @@ import logging
 import json
 import asyncio
 import time
-from typing import List, AsyncGenerator
+from typing import Any, Dict, List, AsyncGenerator, Optional
 import redis.asyncio as redis
 
 import google.generativeai as genai
 
-from model.models import Document
+from model.models import Document, SearchMode
 from .embedding_service import EmbeddingService
+from .corpus_version import corpus_version, question_digest
+from .semantic_cache import semantic_cache
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Answers containing this (also mid-stream) are never cached
+ERROR_RESPONSE_PREFIX = "Sorry, I encountered an error while processing your question"
+
 
 class AIService:
     def __init__(self):
@@ -33,8 +38,8 @@ class AIService:
         start_time = time.time()
 
         try:
-            cache_key = f"response:{hash(question)}"
-            cached_response = await self.redis_client.get(cache_key)
+            cache_key = await self._cache_key("response", question)
+            cached_response = await self.redis_client.get(cache_key) if cache_key else None
             if cached_response:
                 logger.info(f"Cache hit for question: {question[:50]}...")
                 return cached_response
@@ -42,7 +47,8 @@ class AIService:
             context = await self._prepare_optimized_context(context_docs, settings.max_context_tokens)
             response = await self._generate_ai_response(question, context)
 
-            await self.redis_client.setex(cache_key, settings.cache_ttl_response, response)
+            if cache_key:
+                await self.redis_client.setex(cache_key, settings.cache_ttl_response, response)
 
             response_time = time.time() - start_time
             await self._log_response_time(response_time, len(context_docs))
@@ -53,7 +59,7 @@ class AIService:
             response_time = time.time() - start_time
             await self._log_error_response_time(response_time)
             logger.error(f"Error generating response: {e}")
-            return f"Sorry, I encountered an error while processing your question: {str(e)}"
+            return f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
 
     async def generate_streaming_response(self, question: str, context_docs: List[Document]) -> AsyncGenerator[str, None]:
         """Generate streaming response using Gemini, yielding chunks of text."""
@@ -86,7 +92,7 @@ A:"""
                         
             except Exception as e:
                 logger.error(f"Error during streaming AI response generation: {e}")
-                yield f"Sorry, I encountered an error while processing your question: {str(e)}"
+                yield f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
 
             response_time = time.time() - start_time
             await self._log_response_time(response_time, len(context_docs))
@@ -95,7 +101,53 @@ A:"""
             response_time = time.time() - start_time
             await self._log_error_response_time(response_time)
             logger.error(f"Error generating streaming response: {e}")
-            yield f"Sorry, I encountered an error while processing your question: {str(e)}"
+            yield f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
+
+    @staticmethod
+    def _retrieval_settings(ef_search: int = None, search_mode: SearchMode = None, vector_weight: float = None,
+                            text_weight: float = None) -> str:
+        """Retrieval settings của request sau khi áp defaults (key phụ của semantic cache)"""
+        mode = SearchMode(search_mode or settings.search_mode)
+        params = [mode.value, ef_search or settings.hnsw_ef_search]
+        if mode == SearchMode.HYBRID:
+            params += [
+                float(settings.hybrid_vector_weight if vector_weight is None else vector_weight),
+                float(settings.hybrid_text_weight if text_weight is None else text_weight)
+            ]
+        return ":".join(map(str, params))
+
+    async def find_cached_answer(self, question: str, ef_search: int = None, search_mode: SearchMode = None,
+                                 vector_weight: float = None, text_weight: float = None) -> Optional[Dict[str, Any]]:
+        """Câu trả lời đã cache của một câu hỏi gần giống với cùng retrieval settings - None nếu miss"""
+        if not semantic_cache.enabled:
+            return None
+        try:
+            # Same embedding the search uses; served from the query embedding cache afterwards
+            embedding = await self.embeddings_service.generate_embedding(question)
+        except Exception as e:
+            logger.warning(f"Semantic cache skipped, could not embed question: {e}")
+            return None
+        hit = await semantic_cache.lookup(
+            embedding, self._retrieval_settings(ef_search, search_mode, vector_weight, text_weight)
+        )
+        if hit:
+            logger.info(f"Semantic cache hit ({hit['similarity']:.3f}) for question: {question[:50]}...")
+        return hit
+
+    async def cache_answer(self, question: str, answer: str, context_docs: List[Document], ef_search: int = None,
+                           search_mode: SearchMode = None, vector_weight: float = None, text_weight: float = None):
+        """Lưu câu trả lời vào semantic cache (bỏ qua câu trả lời lỗi)"""
+        if not semantic_cache.enabled or not answer or ERROR_RESPONSE_PREFIX in answer:
+            return
+        try:
+            embedding = await self.embeddings_service.generate_embedding(question)
+        except Exception as e:
+            logger.warning(f"Could not cache answer, embedding failed: {e}")
+            return
+        await semantic_cache.store(
+            embedding, self._retrieval_settings(ef_search, search_mode, vector_weight, text_weight),
+            question, answer, [{"id": str(doc.id), "filename": doc.filename} for doc in context_docs]
+        )
 
     async def _generate_ai_response(self, question: str, context: str) -> str:
         prompt = f"""Context: {context}
@@ -126,10 +178,16 @@ A:"""
 
         return "\n".join(context_parts)
 
-    async def search_relevant_documents(self, question: str, limit: int = 5) -> List[Document]:
+    async def search_relevant_documents(self, question: str, limit: int = 5, ef_search: int = None,
+                                        search_mode: SearchMode = None, vector_weight: float = None,
+                                        text_weight: float = None) -> List[Document]:
         try:
-            cache_key = f"search:{hash(question)}:{limit}"
-            cached_result = await self.redis_client.get(cache_key)
+            mode = SearchMode(search_mode or settings.search_mode)
+            params = [limit, ef_search or settings.hnsw_ef_search, mode.value]
+            if mode == SearchMode.HYBRID:
+                params += [vector_weight, text_weight]
+            cache_key = await self._cache_key("search", question, *params)
+            cached_result = await self.redis_client.get(cache_key) if cache_key else None
             if cached_result:
                 logger.info(f"Cache hit for search: {question[:50]}...")
                 # Reconstruct Document objects from dicts
@@ -143,22 +201,28 @@ A:"""
             question_embedding, _ = await asyncio.gather(*tasks)
 
             from dbconnection.database import db_manager
-            similar_docs = await db_manager.search_similar_documents(question_embedding, limit)
-
-            await self.redis_client.setex(
-                cache_key,
-                settings.cache_ttl_search,
-                json.dumps([
-                    {
-                        'id': str(doc.id),
-                        'filename': doc.filename,
-                        'content': doc.content,
-                        'file_size': doc.file_size,
-                        'metadata': doc.metadata,
-                        'status': doc.status.value if hasattr(doc.status, 'value') else doc.status
-                    } for doc in similar_docs
-                ])
-            )
+            if mode == SearchMode.HYBRID:
+                similar_docs = await db_manager.hybrid_search_documents(
+                    question_embedding, question, limit, ef_search, vector_weight, text_weight
+                )
+            else:
+                similar_docs = await self._vector_search(question_embedding, limit, ef_search)
+
+            if cache_key:
+                await self.redis_client.setex(
+                    cache_key,
+                    settings.cache_ttl_search,
+                    json.dumps([
+                        {
+                            'id': str(doc.id),
+                            'filename': doc.filename,
+                            'content': doc.content,
+                            'file_size': doc.file_size,
+                            'metadata': doc.metadata,
+                            'status': doc.status.value if hasattr(doc.status, 'value') else doc.status
+                        } for doc in similar_docs
+                    ])
+                )
 
             return similar_docs
 
@@ -166,6 +230,26 @@ A:"""
             logger.error(f"Error in vector search: {e}")
             return []
 
+    @staticmethod
+    async def _cache_key(namespace: str, question: str, *params) -> Optional[str]:
+        """Key theo corpus version + SHA-256 của câu hỏi - None (không dùng cache) nếu không đọc được version"""
+        version = await corpus_version.get()
+        if version is None:
+            return None
+        return ":".join([namespace, f"v{version}", question_digest(question), *map(str, params)])
+
+    async def _vector_search(self, embedding: List[float], limit: int, ef_search: int = None) -> List[Document]:
+        """Search trên local vector index khi đã sync, database là fallback"""
+        from dbconnection.database import db_manager
+        from .local_vector_index import local_vector_index
+        if local_vector_index.ready:
+            try:
+                return await local_vector_index.search_similar_documents(embedding, limit, ef_search)
+            except Exception as e:
+                local_vector_index.fallbacks += 1
+                logger.warning(f"Local vector index search failed, using database: {e}")
+        return await db_manager.search_similar_documents(embedding, limit, ef_search)
+
     async def _prepare_search_context(self, question: str) -> str:
         return f"Searching for documents related to: {question}"
 
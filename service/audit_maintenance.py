@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from config.settings import settings
+from dbconnection.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class AuditMaintenance:
+    """Định kỳ tạo audit partitions mới, cập nhật hourly rollups và drop partitions quá retention.
+
+    Cũng dọn document_chunk_changes (change log cho local vector index) quá CHUNK_CHANGE_RETENTION_DAYS.
+    """
+
+    def __init__(self, interval: float = None, retention_days: int = None, partitions_ahead: int = None):
+        self.interval = interval or settings.audit_maintenance_interval
+        self.retention_days = retention_days or settings.audit_retention_days
+        self.partitions_ahead = partitions_ahead or settings.audit_partitions_ahead
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run_once(self) -> Optional[Dict[str, Any]]:
+        """Chạy một lượt maintenance - None nếu process khác đang giữ lock"""
+        now = datetime.utcnow()
+        today = now.date()
+        result = await db_manager.run_audit_maintenance(
+            today, self.partitions_ahead, today - timedelta(days=self.retention_days),
+            now - timedelta(days=settings.chunk_change_retention_days)
+        )
+        if result is None:
+            logger.debug("Audit maintenance running elsewhere, skipped")
+        elif result["partitions_created"] or result["partitions_dropped"] or result["chunk_changes_pruned"]:
+            logger.info(f"Audit maintenance: {result}")
+        return result
+
+    async def run(self):
+        """Chạy maintenance cho tới khi stop() được gọi"""
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Audit maintenance failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+from dbconnection.database import db_manager
+from model.models import AuditLog, OverflowPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Buffer audit logs trong bounded queue và ghi theo batch (đủ batch_size hoặc hết flush_interval)"""
+
+    def __init__(self, max_queue: int = None, batch_size: int = None, flush_interval: float = None,
+                 overflow_policy: str = None):
+        self.batch_size = batch_size or settings.audit_batch_size
+        self.flush_interval = flush_interval or settings.audit_flush_interval
+        self.overflow_policy = OverflowPolicy(overflow_policy or settings.audit_overflow_policy)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue or settings.audit_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Chạy background flush loop trên event loop hiện tại"""
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Audit writer started ({self.overflow_policy.value} on overflow)")
+
+    async def stop(self, timeout: float = 30):
+        """Ngừng nhận entries và ghi nốt những gì còn trong queue"""
+        if not self.running:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Audit writer did not drain within {timeout}s, {self._queue.qsize()} entries lost")
+            self._task.cancel()
+        self._task = None
+        logger.info("Audit writer stopped")
+
+    async def submit(self, audit_log: AuditLog) -> bool:
+        """Đưa audit log vào queue - False nếu bị drop"""
+        if not self.running or self._stopping.is_set():
+            # Writer chưa chạy (scripts, shutdown) - ghi trực tiếp
+            await self._write([audit_log])
+            return True
+
+        if self.overflow_policy == OverflowPolicy.BLOCK:
+            await self._queue.put(audit_log)
+            return True
+
+        try:
+            self._queue.put_nowait(audit_log)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Audit queue full, dropped {self.dropped} entries so far")
+            return False
+
+    async def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = await self._next_batch()
+                if batch:
+                    await self._write(batch)
+            except Exception as e:
+                # Flush loop không được chết - entry lỗi đã được đếm trong _write
+                logger.error(f"Audit writer loop error: {e}")
+
+    async def _next_batch(self) -> List[AuditLog]:
+        loop = asyncio.get_running_loop()
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            return []
+
+        batch = [first]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if self._stopping.is_set() or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: List[AuditLog]):
+        try:
+            await db_manager.insert_audit_logs_bulk(batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Error writing {len(batch)} audit logs: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "overflow_policy": self.overflow_policy.value
+        }
+
+
+# Global audit writer instance
+audit_writer = AuditWriter()
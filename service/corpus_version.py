@@ -0,0 +1,62 @@
+import logging
+from typing import Any, Dict, Optional
+
+import redis.asyncio as redis
+
+from config.settings import settings
+from utils.file_utils import compute_text_hash, normalize_question
+
+logger = logging.getLogger(__name__)
+
+CORPUS_VERSION_KEY = "corpus:version"
+
+
+def question_digest(question: str) -> str:
+    """SHA-256 của câu hỏi đã chuẩn hóa (whitespace, hoa/thường) - ổn định giữa các processes"""
+    return compute_text_hash(normalize_question(question))
+
+
+class CorpusVersion:
+    """Version của corpus trong Redis - tăng sau mỗi lần chunks searchable thay đổi (ingest, re-index, delete).
+
+    Search / response cache keys chứa version nên entries cũ không còn được đọc sau thay đổi
+    và tự hết hạn theo TTL.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client or redis.Redis(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            password=settings.redis_password,
+            decode_responses=True
+        )
+        self.bumps = 0
+        self.errors = 0
+
+    async def get(self) -> Optional[str]:
+        """Version hiện tại - None nếu Redis lỗi (caller bỏ qua cache)"""
+        try:
+            return await self.redis_client.get(CORPUS_VERSION_KEY) or "0"
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Could not read corpus version: {e}")
+            return None
+
+    async def bump(self) -> Optional[int]:
+        try:
+            version = await self.redis_client.incr(CORPUS_VERSION_KEY)
+            self.bumps += 1
+            return version
+        except Exception as e:
+            # Cache entries của version cũ vẫn được đọc cho tới khi hết TTL
+            self.errors += 1
+            logger.error(f"Could not bump corpus version: {e}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"bumps": self.bumps, "errors": self.errors}
+
+
+# Global corpus version instance
+corpus_version = CorpusVersion()
@@ -0,0 +1,116 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import redis.asyncio as redis
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Cache embeddings theo SHA-256(model, task_type, text): LRU trong process + Redis dùng chung"""
+
+    def __init__(self, max_entries: int = None, ttl: int = None, redis_client=None, key_prefix: str = "emb"):
+        self.enabled = settings.embedding_cache_enabled
+        self.max_entries = max_entries or settings.embedding_cache_max_entries
+        self.ttl = ttl or settings.embedding_cache_ttl
+        self.key_prefix = key_prefix
+        # Giữ float32 arrays thay vì list[float] để LRU tốn ~4 bytes/dimension
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.redis_client = redis_client or redis.Redis(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            password=settings.redis_password,
+            decode_responses=False
+        )
+
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    def make_key(self, model: str, task_type: str, text: str) -> str:
+        digest = hashlib.sha256(f"{model}\x00{task_type}\x00{text}".encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{digest}"
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self._lru[key] = embedding
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[List[float]]]:
+        """Lấy embeddings theo keys - None cho cache miss"""
+        if not self.enabled:
+            self.misses += len(keys)
+            return [None] * len(keys)
+
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        redis_indexes = []
+        for i, key in enumerate(keys):
+            embedding = self._lru.get(key)
+            if embedding is not None:
+                self._lru.move_to_end(key)
+                results[i] = embedding
+                self.memory_hits += 1
+            else:
+                redis_indexes.append(i)
+
+        if redis_indexes:
+            try:
+                values = await self.redis_client.mget([keys[i] for i in redis_indexes])
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"Embedding cache Redis lookup failed: {e}")
+                values = [None] * len(redis_indexes)
+
+            for i, value in zip(redis_indexes, values):
+                if value is None:
+                    self.misses += 1
+                    continue
+                embedding = np.frombuffer(value, dtype=np.float32)
+                self._remember(keys[i], embedding)
+                results[i] = embedding
+                self.redis_hits += 1
+
+        return [embedding.tolist() if embedding is not None else None for embedding in results]
+
+    async def set_many(self, items: Dict[str, Sequence[float]]):
+        """Lưu embeddings vào cả hai tier (Redis lưu packed float32 bytes)"""
+        if not self.enabled or not items:
+            return
+
+        packed = {}
+        for key, embedding in items.items():
+            array = np.asarray(embedding, dtype=np.float32)
+            self._remember(key, array)
+            packed[key] = array.tobytes()
+
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, value in packed.items():
+                    pipe.setex(key, self.ttl, value)
+                await pipe.execute()
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Embedding cache Redis write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.redis_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": round((self.memory_hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._lru)
+        }
+
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_embedding_semaphore() -> asyncio.Semaphore:
+    """Semaphore dùng chung cho mọi ingestion trong process"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
+    return _semaphore
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """429 / 5xx / network errors được retry, các lỗi khác fail ngay.
+
+    Provider wrap lỗi gốc (GoogleGenerativeAIError(...) from e) nên kiểm tra cả chuỗi __cause__ / __context__.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+            return True
+        code = getattr(exc, "code", None)
+        if code is None:
+            code = getattr(exc, "status_code", None)
+        if isinstance(code, int) and (code == 429 or 500 <= code < 600):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class EmbeddingStats:
+    """Throughput tính trên wall time khi có ít nhất một embed_documents đang chạy (các lần gọi song song
+    không bị cộng dồn thời gian)"""
+
+    def __init__(self):
+        self.embeddings = 0
+        self.batches = 0
+        self.retries = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self._active = 0
+        self._active_since = 0.0
+
+    def start(self):
+        if self._active == 0:
+            self._active_since = time.perf_counter()
+        self._active += 1
+
+    def finish(self, count: int, batches: int):
+        self.embeddings += count
+        self.batches += batches
+        self._active -= 1
+        if self._active == 0:
+            self.busy_seconds += time.perf_counter() - self._active_since
+
+    def snapshot(self) -> Dict[str, Any]:
+        busy_seconds = self.busy_seconds + (time.perf_counter() - self._active_since if self._active else 0.0)
+        return {
+            "embeddings": self.embeddings,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failures": self.failures,
+            "embeddings_per_second": round(self.embeddings / busy_seconds, 2) if busy_seconds else 0.0
+        }
+
+
+# Global stats instance
+embedding_stats = EmbeddingStats()
+
+
+class EmbeddingScheduler:
+    """Chia texts thành batches, chạy song song dưới global semaphore, retry với jittered backoff"""
+
+    def __init__(
+        self,
+        provider,
+        batch_size: int = None,
+        max_retries: int = None,
+        retry_base_delay: float = None,
+        retry_max_delay: float = None,
+        semaphore: asyncio.Semaphore = None,
+        stats: EmbeddingStats = None
+    ):
+        # provider: bất kỳ object nào có aembed_documents(texts) - Google embeddings hoặc fake local
+        self.provider = provider
+        self.batch_size = batch_size or settings.embedding_batch_size
+        self.max_retries = settings.embedding_max_retries if max_retries is None else max_retries
+        self.retry_base_delay = retry_base_delay or settings.embedding_retry_base_delay
+        self.retry_max_delay = retry_max_delay or settings.embedding_retry_max_delay
+        self._semaphore = semaphore
+        self.stats = stats or embedding_stats
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        return self._semaphore or get_embedding_semaphore()
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts theo batches, giữ nguyên thứ tự kết quả"""
+        if not texts:
+            return []
+
+        start_time = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+        embeddings: List[List[float]] = []
+        self.stats.start()
+        try:
+            tasks = [asyncio.create_task(self._embed_batch(batch)) for batch in batches]
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                # Một batch fail hẳn thì huỷ các batch còn lại và chờ chúng kết thúc
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            embeddings = [embedding for result in results for embedding in result]
+        finally:
+            self.stats.finish(len(embeddings), len(batches) if embeddings else 0)
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(
+            f"Embedded {len(embeddings)} texts in {len(batches)} batches in {elapsed:.2f}s "
+            f"({len(embeddings) / elapsed if elapsed else 0:.1f} embeddings/s)"
+        )
+        return embeddings
+
+    async def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    embeddings = await self.provider.aembed_documents(batch)
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"Provider returned {len(embeddings)} embeddings for {len(batch)} texts")
+                return embeddings
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    self.stats.failures += 1
+                    raise
+                # Full jitter: sleep ngoài semaphore để batch khác dùng slot
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+                attempt += 1
+                self.stats.retries += 1
+                logger.warning(f"Embedding batch failed ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
@@ -1,37 +1,96 @@
 import os
-from typing import List
+import asyncio
+from typing import Dict, List
 import logging
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
+from .embedding_scheduler import EmbeddingScheduler
+from .embedding_cache import embedding_cache
+from utils.file_utils import normalize_question
+
 logger = logging.getLogger(__name__)
 
+# Cache namespace for aembed_query results, separate from document embeddings of the same text
+QUERY_TASK_TYPE = "retrieval_query"
+
 
 class EmbeddingService:
-    def __init__(self):
-        from config.settings import settings
-        if not settings.google_api_key:
-            raise ValueError("GOOGLE_API_KEY or GEMINI_API_KEY environment variable is required")
-        
-        os.environ["GOOGLE_API_KEY"] = settings.google_api_key
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            task_type="retrieval_document"
-        )
+    def __init__(self, embeddings=None):
+        if embeddings is None:
+            from config.settings import settings
+            if not settings.google_api_key:
+                raise ValueError("GOOGLE_API_KEY or GEMINI_API_KEY environment variable is required")
+
+            os.environ["GOOGLE_API_KEY"] = settings.google_api_key
+            embeddings = GoogleGenerativeAIEmbeddings(
+                model="models/embedding-001",
+                task_type="retrieval_document"
+            )
+        # embeddings có thể là fake provider local (aembed_documents / aembed_query)
+        self.embeddings = embeddings
+        self.scheduler = EmbeddingScheduler(self.embeddings)
+        self.cache = embedding_cache
+        self.model_name = getattr(embeddings, "model", type(embeddings).__name__)
+        self.task_type = getattr(embeddings, "task_type", None) or "retrieval_document"
+        # Câu hỏi giống nhau đến cùng lúc chỉ gọi provider một lần
+        self._pending_queries: Dict[str, asyncio.Future] = {}
 
     async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings cho list texts"""
         try:
-            embeddings = await self.embeddings.aembed_documents(texts)
+            keys = [self.cache.make_key(self.model_name, self.task_type, text) for text in texts]
+            embeddings = await self.cache.get_many(keys)
+            
+            # Chỉ gửi cache misses (mỗi text khác nhau một lần) tới provider
+            missing = {}
+            for i, embedding in enumerate(embeddings):
+                if embedding is None:
+                    missing.setdefault(keys[i], texts[i])
+            
+            if missing:
+                new_embeddings = dict(zip(missing, await self.scheduler.embed_documents(list(missing.values()))))
+                await self.cache.set_many(new_embeddings)
+                embeddings = [
+                    embedding if embedding is not None else new_embeddings[key]
+                    for key, embedding in zip(keys, embeddings)
+                ]
+            
+            logger.info(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} texts served from cache")
             return embeddings
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
 
     async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding cho single text"""
+        """Generate embedding cho câu hỏi - cache theo câu hỏi đã chuẩn hóa và model"""
+        key = self.cache.make_key(self.model_name, QUERY_TASK_TYPE, normalize_question(text))
+        pending = self._pending_queries.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # Request đang embed câu hỏi này bị huỷ - tự embed thay vì nhận CancelledError của nó
+                return await self.generate_embedding(text)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending_queries[key] = future
         try:
-            embedding = await self.embeddings.aembed_query(text)
+            embedding = (await self.cache.get_many([key]))[0]
+            if embedding is None:
+                embedding = await self.embeddings.aembed_query(text)
+                await self.cache.set_many({key: embedding})
+            future.set_result(embedding)
             return embedding
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
-            raise 
\ No newline at end of file
+            future.set_exception(e)
+            # Exception đã được raise cho caller này - tránh "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                # Cancelled (client disconnect / timeout) - release callers waiting on this future
+                future.cancel()
+            del self._pending_queries[key]
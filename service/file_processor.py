@@ -1,7 +1,7 @@
 import os
-import aiofiles
 import asyncio
-from typing import List, Dict, Any
+import aiofiles
+from typing import List, Dict, Any, Iterator
 from uuid import UUID, uuid4
 import logging
 from datetime import datetime
@@ -9,8 +9,11 @@ from datetime import datetime
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
-from model.models import Document, FileStatus
+from model.models import Document, DocumentChunk, FileStatus
+from config.settings import settings
 from dbconnection.database import db_manager
+from utils.file_utils import compute_text_hash
+from .corpus_version import corpus_version
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +32,16 @@ class FileProcessingService:
             chunk_overlap=self.chunk_overlap,
             length_function=len,
         )
+        
+        # Embedding service dùng chung cho mọi document (batches chạy dưới global semaphore)
+        self._embedding_service = None
+
+    @property
+    def embedding_service(self):
+        if self._embedding_service is None:
+            from .embedding_service import EmbeddingService
+            self._embedding_service = EmbeddingService()
+        return self._embedding_service
 
     async def validate_file(self, filename: str, file_size: int) -> tuple[bool, str]:
         """Validate file upload"""
@@ -51,126 +64,250 @@ class FileProcessingService:
             return content
 
     async def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text từ PDF file"""
+        """Extract text từ PDF file trong process pool (không block event loop)"""
         try:
-            from pypdf import PdfReader
-            
-            # Read PDF file
-            reader = PdfReader(file_path)
-            text_content = []
-            
-            # Extract text from each page
-            for page_num, page in enumerate(reader.pages):
-                page_text = page.extract_text()
-                if page_text.strip():  # Only add non-empty pages
-                    text_content.append(f"--- Page {page_num + 1} ---\n{page_text}")
-            
-            # Join all pages
-            full_text = "\n\n".join(text_content)
-            
-            if not full_text.strip():
-                raise ValueError("No text content found in PDF")
-            
-            logger.info(f"Extracted text from PDF with {len(reader.pages)} pages")
-            return full_text
+            from .pdf_extractor import extract_pdf_text
+            return await extract_pdf_text(file_path)
             
         except Exception as e:
             logger.error(f"Error extracting PDF text: {e}")
             raise ValueError(f"Failed to extract text from PDF: {str(e)}")
 
-    async def process_file(self, file_path: str, filename: str, file_size: int) -> Document:
-        """Process file và tạo document"""
-        # Get file extension
-        file_ext = os.path.splitext(filename)[1].lower()
-        
-        # Read file content
-        content = await self.read_file_content(file_path, file_ext)
-        
-        # Create document
+    def _build_metadata(self, file_path: str, filename: str) -> Dict[str, Any]:
+        return {
+            "upload_time": datetime.utcnow().isoformat(),
+            "file_path": file_path,
+            "file_type": os.path.splitext(filename)[1].lower(),
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap
+        }
+
+    async def process_file(self, file_path: str, filename: str, file_size: int,
+                           content_hash: str = None) -> Document:
+        """Đăng ký document và đưa vào ingestion queue - nội dung được xử lý bởi worker"""
+        # Create document (content được extract bởi worker)
         doc_id = uuid4()
         document = Document(
             id=doc_id,
             filename=filename,
-            content=content,
+            content="",
             file_size=file_size,
-            metadata={
-                "upload_time": datetime.utcnow().isoformat(),
-                "file_path": file_path,
-                "file_type": file_ext,
-                "chunk_size": self.chunk_size,
-                "chunk_overlap": self.chunk_overlap
-            },
-            status=FileStatus.PROCESSING
+            metadata=self._build_metadata(file_path, filename),
+            status=FileStatus.PENDING,
+            content_hash=content_hash
         )
         
         # Save to database
         await db_manager.insert_document(document)
         
-        # Process in background
-        asyncio.create_task(self._process_document_async(document))
+        # Enqueue for worker processes
+        await self.enqueue_document(document)
         
         return document
 
-    async def _process_document_async(self, document: Document):
-        """Process document trong background"""
+    async def link_duplicate(self, existing: Document, file_path: str, filename: str,
+                             file_size: int) -> Document:
+        """Tạo document mới dùng chung chunks với document đã có - không chunk/embed lại"""
+        document = Document(
+            id=uuid4(),
+            filename=filename,
+            content=existing.content,
+            file_size=file_size,
+            metadata={
+                **self._build_metadata(file_path, filename),
+                "total_chunks": existing.metadata.get("total_chunks")
+            },
+            status=FileStatus.COMPLETED,
+            content_hash=existing.content_hash,
+            duplicate_of=existing.id
+        )
+        await db_manager.insert_document(document)
+        logger.info(f"Linked document {document.id} to existing document {existing.id}")
+        return document
+
+    async def enqueue_document(self, document: Document):
+        """Đưa document vào ingestion queue"""
         try:
-            logger.info(f"Starting to process document {document.id}")
-            
-            # Update status to processing
-            await db_manager.update_document(document.id, metadata={
-                **document.metadata,
-                "processing_started": datetime.utcnow().isoformat()
-            })
-            
-            # Split text into chunks
-            chunks = self.text_splitter.split_text(document.content)
-            logger.info(f"Split document into {len(chunks)} chunks")
-            
-            # Generate embeddings for chunks
-            from .embedding_service import EmbeddingService
-            embeddings_service = EmbeddingService()
-            embeddings = await embeddings_service.generate_embeddings(chunks)
-            logger.info(f"Generated {len(embeddings)} embeddings")
-            
-            # Store chunks as separate documents
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                chunk_doc = Document(
-                    id=uuid4(),
-                    filename=f"{document.filename}_chunk_{i}",
-                    content=chunk,
-                    file_size=len(chunk.encode('utf-8')),
-                    embedding=embedding,
-                    metadata={
-                        **document.metadata,
-                        "parent_document_id": str(document.id),
-                        "chunk_index": i,
-                        "total_chunks": len(chunks)
-                    },
-                    status=FileStatus.COMPLETED
-                )
-                await db_manager.insert_document(chunk_doc)
-                logger.info(f"Stored chunk {i} for document {document.id}")
-            
-            # Update original document status to completed
-            await db_manager.update_document(document.id, metadata={
-                **document.metadata,
-                "processing_completed": datetime.utcnow().isoformat(),
-                "total_chunks": len(chunks)
-            })
-            
-            # Update status field to completed
-            await db_manager.update_document_status(document.id, FileStatus.COMPLETED)
-            
-            logger.info(f"Document {document.id} processed successfully with {len(chunks)} chunks")
-            
+            await db_manager.enqueue_job(document.id, settings.ingestion_max_attempts)
+            logger.info(f"Enqueued document {document.id} for ingestion")
         except Exception as e:
-            logger.error(f"Error processing document {document.id}: {e}")
-            await db_manager.update_document(document.id, metadata={
-                **document.metadata,
-                "processing_error": str(e),
-                "processing_failed": datetime.utcnow().isoformat()
-            })
-            await db_manager.update_document_status(document.id, FileStatus.FAILED)
+            await self.mark_document_failed(document, e)
+            raise
 
+    async def process_document(self, document: Document):
+        """Extract, chunk, embed và lưu chunks của document - raise nếu lỗi"""
+        logger.info(f"Starting to process document {document.id}")
+        
+        # Update status to processing
+        document.metadata = {
+            **document.metadata,
+            "processing_started": datetime.utcnow().isoformat()
+        }
+        await db_manager.update_document(document.id, metadata=document.metadata)
+        await db_manager.update_document_status(document.id, FileStatus.PROCESSING)
+        
+        # Extract content from the uploaded file
+        if not document.content:
+            document.content = await self.read_file_content(
+                document.metadata["file_path"], document.metadata.get("file_type", "")
+            )
+            await db_manager.update_document(document.id, content=document.content)
+        
+        # Remove chunks left over from a previous attempt
+        if await db_manager.delete_document_chunks(document.id):
+            await corpus_version.bump()
+        
+        # Split → embed → store pipeline; chunks become searchable batch by batch
+        try:
+            total_chunks = await self._run_pipeline(document)
+        except Exception:
+            # Không để lại document được index một phần
+            await db_manager.delete_document_chunks(document.id)
+            await corpus_version.bump()
+            raise
+        
+        # Update original document status to completed
+        document.metadata = {
+            **document.metadata,
+            "processing_completed": datetime.utcnow().isoformat(),
+            "total_chunks": total_chunks
+        }
+        await db_manager.update_document(document.id, metadata=document.metadata)
+        
+        # Update status field to completed
+        await db_manager.update_document_status(document.id, FileStatus.COMPLETED)
+        
+        logger.info(f"Document {document.id} processed successfully with {total_chunks} chunks")
+
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        """Split text theo từng segment (cắt ở ranh giới đoạn văn) thay vì tạo toàn bộ list chunks một lần"""
+        segment_size = settings.pipeline_segment_size
+        start = 0
+        while start < len(text):
+            end = min(start + segment_size, len(text))
+            if end < len(text):
+                cut = text.rfind("\n\n", start + segment_size // 2, end)
+                if cut != -1:
+                    end = cut
+            yield from self.text_splitter.split_text(text[start:end])
+            start = end
+
+    async def _run_pipeline(self, document: Document) -> int:
+        """Chạy các stage split / embed / store nối với nhau bằng bounded queues - trả về số chunks"""
+        split_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.pipeline_queue_size)
+        store_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.pipeline_queue_size)
+        embed_workers = settings.pipeline_embed_workers
+        
+        async def split_stage():
+            batch, index = [], 0
+            for chunk in self.iter_chunks(document.content):
+                batch.append(chunk)
+                if len(batch) == settings.pipeline_batch_size:
+                    await split_queue.put((index, batch))
+                    index += len(batch)
+                    batch = []
+            if batch:
+                await split_queue.put((index, batch))
+            for _ in range(embed_workers):
+                await split_queue.put(None)
+        
+        async def embed_stage():
+            while (item := await split_queue.get()) is not None:
+                start, texts = item
+                embeddings = await self.embedding_service.generate_embeddings(texts)
+                await store_queue.put([
+                    self._build_chunk(document, start + i, chunk, embedding)
+                    for i, (chunk, embedding) in enumerate(zip(texts, embeddings))
+                ])
+            await store_queue.put(None)
+        
+        async def store_stage() -> int:
+            stored, finished = 0, 0
+            while finished < embed_workers:
+                chunks = await store_queue.get()
+                if chunks is None:
+                    finished += 1
+                    continue
+                await db_manager.insert_chunks_bulk(chunks)
+                # Search / response caches của corpus cũ không còn đúng
+                await corpus_version.bump()
+                stored += len(chunks)
+                logger.info(f"Stored {stored} chunks for document {document.id}")
+            return stored
+        
+        tasks = [
+            asyncio.create_task(split_stage()),
+            *(asyncio.create_task(embed_stage()) for _ in range(embed_workers)),
+            asyncio.create_task(store_stage())
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return results[-1]
+
+    @staticmethod
+    def _build_chunk(document: Document, index: int, chunk: str, embedding) -> DocumentChunk:
+        return DocumentChunk(
+            id=uuid4(),
+            document_id=document.id,
+            chunk_index=index,
+            content=chunk,
+            embedding=embedding,
+            content_hash=compute_text_hash(chunk)
+        )
+
+    async def reindex_document(self, document: Document, content: str, metadata: Dict = None) -> bool:
+        """Cập nhật content và chỉ embed lại các chunks mới/thay đổi (so sánh theo content hash)"""
+        chunks = list(self.iter_chunks(content))
+        
+        # Bản link hoặc document gốc có bản link: chunks cũ thuộc về document khác sau update
+        shares_chunks = document.duplicate_of is not None or await db_manager.has_duplicates(document.id)
+        existing = [] if shares_chunks else await db_manager.get_chunk_hashes(document.id)
+        
+        # Ghép chunk mới với chunk cũ cùng hash (giữ nguyên embedding)
+        available: Dict[str, List[UUID]] = {}
+        for chunk_id, chunk_hash in existing:
+            available.setdefault(chunk_hash, []).append(chunk_id)
+        
+        kept: Dict[UUID, int] = {}
+        added_indexes = []
+        for i, chunk in enumerate(chunks):
+            candidates = available.get(compute_text_hash(chunk))
+            if candidates:
+                kept[candidates.pop(0)] = i
+            else:
+                added_indexes.append(i)
+        removed = [chunk_id for ids in available.values() for chunk_id in ids]
+        
+        document.metadata = {
+            **(document.metadata if metadata is None else metadata),
+            "total_chunks": len(chunks),
+            "reindexed_at": datetime.utcnow().isoformat()
+        }
+        
+        embeddings = await self.embedding_service.generate_embeddings([chunks[i] for i in added_indexes])
+        added = [
+            self._build_chunk(document, i, chunks[i], embedding)
+            for i, embedding in zip(added_indexes, embeddings)
+        ]
+        
+        updated = await db_manager.apply_chunk_diff(
+            document.id, content, document.metadata, added, kept, removed
+        )
+        await corpus_version.bump()
+        return updated
 
- 
\ No newline at end of file
+    async def mark_document_failed(self, document: Document, error: Exception):
+        """Đánh dấu document xử lý thất bại và xoá chunks còn lại của lần xử lý dở"""
+        # A stalled worker may have stored some batches before its job was marked failed
+        if await db_manager.delete_document_chunks(document.id):
+            await corpus_version.bump()
+        await db_manager.update_document(document.id, metadata={
+            **document.metadata,
+            "processing_error": str(error),
+            "processing_failed": datetime.utcnow().isoformat()
+        })
+        await db_manager.update_document_status(document.id, FileStatus.FAILED)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import socket
+from typing import Optional
+from uuid import uuid4
+
+from config.settings import settings
+from dbconnection.database import db_manager
+from model.models import FileStatus, IngestionJob, JobStatus
+from .file_processor import FileProcessingService
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionWorker:
+    """Claim ingestion jobs từ Postgres queue, heartbeat trong lúc xử lý, requeue jobs bị treo"""
+
+    def __init__(self, file_processor: FileProcessingService = None, worker_id: str = None):
+        self.file_processor = file_processor or FileProcessingService()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.concurrency = settings.worker_concurrency
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Dừng nhận job mới - các job đang chạy được xử lý xong"""
+        logger.info(f"Worker {self.worker_id} stopping")
+        self._stopping.set()
+
+    async def run(self):
+        """Chạy worker loops cho tới khi stop() được gọi"""
+        logger.info(f"Worker {self.worker_id} started with concurrency {self.concurrency}")
+        await asyncio.gather(
+            self._requeue_loop(),
+            *(self._job_loop() for _ in range(self.concurrency))
+        )
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _job_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = await db_manager.claim_job(self.worker_id)
+            except Exception as e:
+                logger.error(f"Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                await self._sleep(settings.worker_poll_interval)
+                continue
+
+            try:
+                await self.run_job(job)
+            except Exception as e:
+                # Job sẽ được requeue khi heartbeat hết hạn
+                logger.error(f"Unexpected error running job {job.id}: {e}")
+
+    async def _requeue_loop(self):
+        while not self._stopping.is_set():
+            try:
+                for job in await db_manager.requeue_stalled_jobs(settings.worker_stall_timeout):
+                    logger.warning(f"Job {job.id} for document {job.document_id} stalled, now {job.status.value}")
+                    if job.status == JobStatus.FAILED:
+                        document = await db_manager.get_document(job.document_id)
+                        if document:
+                            await self.file_processor.mark_document_failed(document, job.last_error)
+            except Exception as e:
+                logger.error(f"Error requeueing stalled jobs: {e}")
+            await self._sleep(settings.worker_stall_timeout / 2)
+
+    async def run_job(self, job: IngestionJob):
+        """Xử lý một job với heartbeat chạy song song"""
+        logger.info(f"Worker {self.worker_id} claimed job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+        document = await db_manager.get_document(job.document_id)
+        if not document:
+            logger.warning(f"Document {job.document_id} no longer exists, dropping job {job.id}")
+            await db_manager.complete_job(job.id, self.worker_id)
+            return
+
+        processing = asyncio.create_task(self.file_processor.process_document(document))
+        heartbeat = asyncio.create_task(self._heartbeat(job, processing))
+        try:
+            await processing
+        except asyncio.CancelledError:
+            if not (heartbeat.done() and not heartbeat.cancelled() and heartbeat.result() is False):
+                raise
+            # Job đã bị requeue cho worker khác - không cập nhật trạng thái
+            logger.warning(f"Job {job.id} lost its lease, abandoned by worker {self.worker_id}")
+            return
+        except Exception as e:
+            await self._fail_job(job, document, e)
+            return
+        finally:
+            heartbeat.cancel()
+
+        await db_manager.complete_job(job.id, self.worker_id)
+
+    async def _heartbeat(self, job: IngestionJob, processing: asyncio.Task) -> bool:
+        """Heartbeat định kỳ - huỷ processing và trả về False nếu mất lease"""
+        while True:
+            await asyncio.sleep(settings.worker_heartbeat_interval)
+            try:
+                still_owned = await db_manager.heartbeat_job(job.id, self.worker_id)
+            except Exception as e:
+                logger.error(f"Heartbeat failed for job {job.id}: {e}")
+                continue
+            if not still_owned:
+                processing.cancel()
+                return False
+
+    async def _fail_job(self, job: IngestionJob, document, error: Exception):
+        logger.error(f"Error processing document {document.id} (job {job.id}): {error}")
+        status: Optional[JobStatus] = await db_manager.fail_job(
+            job.id, self.worker_id, str(error), settings.ingestion_retry_delay
+        )
+        if status == JobStatus.QUEUED:
+            logger.info(f"Job {job.id} requeued, retry in {settings.ingestion_retry_delay}s")
+            await db_manager.update_document_status(document.id, FileStatus.PENDING)
+        else:
+            await self.file_processor.mark_document_failed(document, error)
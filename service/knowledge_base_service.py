@@ -1,66 +1,152 @@
 import os
+import asyncio
 from typing import List, Dict, Any, Optional
 from uuid import UUID
 import logging
 from datetime import datetime
 
-from model.models import Document, AuditLog
+from model.models import Document, AuditLog, CountMode, DedupMode, FileStatus
+from config.settings import settings
 from dbconnection.database import db_manager
 from .file_processor import FileProcessingService
 from .ai_service import AIService
+from .corpus_version import corpus_version
 
 logger = logging.getLogger(__name__)
 
 
+class DocumentStateError(Exception):
+    """Thao tác không hợp lệ với trạng thái hiện tại của document - API trả về 409"""
+
+
 class KnowledgeBaseService:
     def __init__(self):
         self.file_processor = FileProcessingService()
         self.ai_service = AIService()
 
-    async def upload_file(self, file_path: str, filename: str, file_size: int) -> Document:
-        """Upload và process file"""
+    async def upload_file(self, file_path: str, filename: str, file_size: int, content_hash: str = None,
+                          dedup_mode: str = None) -> tuple[Document, Optional[UUID]]:
+        """Upload và process file - trả về (document, id của document trùng nếu có)"""
         is_valid, message = await self.file_processor.validate_file(filename, file_size)
         if not is_valid:
             raise ValueError(message)
         
-        document = await self.file_processor.process_file(file_path, filename, file_size)
+        try:
+            mode = DedupMode(dedup_mode or settings.upload_dedup_mode)
+        except ValueError:
+            raise ValueError(f"Invalid dedup mode. Supported: {', '.join(m.value for m in DedupMode)}")
+        
+        if content_hash and mode != DedupMode.OFF:
+            existing = await db_manager.find_document_by_hash(content_hash)
+            if existing:
+                if mode == DedupMode.REUSE:
+                    # File đã được index - bỏ bản vừa upload
+                    from utils.file_utils import delete_file_safely
+                    if existing.metadata.get("file_path") != file_path:
+                        delete_file_safely(file_path)
+                    logger.info(f"Upload of {filename} matches existing document {existing.id}")
+                    return existing, existing.id
+                
+                document = await self.file_processor.link_duplicate(existing, file_path, filename, file_size)
+                return document, existing.id
+        
+        document = await self.file_processor.process_file(file_path, filename, file_size, content_hash)
+        return document, None
+
+    async def retry_document_processing(self, doc_id: UUID) -> Optional[Document]:
+        """Đưa document bị lỗi vào lại ingestion queue"""
+        document = await self.get_document(doc_id)
+        if not document:
+            return None
+        
+        if document.duplicate_of is not None:
+            # Linked duplicate shares the original's chunks; indexing it would return every chunk twice
+            raise DocumentStateError("Document is linked to an existing document and has no processing of its own")
+        if document.status != FileStatus.FAILED:
+            raise DocumentStateError(f"Only failed documents can be retried (status: {document.status.value})")
+        
+        await db_manager.update_document_status(doc_id, FileStatus.PENDING)
+        await self.file_processor.enqueue_document(document)
         return document
 
-    async def get_documents(self, page: int = 1, size: int = 10) -> tuple[List[Document], int]:
-        """Lấy danh sách documents"""
-        return await db_manager.get_all_documents(page, size)
+    async def get_documents(self, size: int = 10, cursor: str = None, fields: str = None,
+                            count: str = None, page: int = None) -> Dict[str, Any]:
+        """Lấy danh sách documents theo cursor - chỉ trả về các trường trong fields"""
+        from dbconnection.document_repository import DocumentRepository
+        from utils.pagination import encode_cursor, decode_cursor
+        
+        if size < 1 or size > 100:
+            raise ValueError("size must be between 1 and 100")
+        if page is not None and page < 1:
+            raise ValueError("page must be >= 1")
+        
+        if fields:
+            selected = [field.strip() for field in fields.split(",") if field.strip()]
+            unknown = [field for field in selected if field not in DocumentRepository.LIST_FIELDS]
+            if unknown:
+                raise ValueError(
+                    f"Unknown fields: {', '.join(unknown)}. Supported: {', '.join(DocumentRepository.LIST_FIELDS)}"
+                )
+        else:
+            selected = [field for field in DocumentRepository.LIST_FIELDS if field != "content"]
+        
+        try:
+            count_mode = CountMode(count or CountMode.ESTIMATE.value)
+        except ValueError:
+            raise ValueError(f"Invalid count mode. Supported: {', '.join(m.value for m in CountMode)}")
+        
+        after = decode_cursor(cursor) if cursor else None
+        offset = (page - 1) * size if page and not cursor else None
+        
+        # Lấy thêm một row để biết còn trang tiếp theo hay không
+        rows, total, total_is_estimate = await db_manager.get_all_documents(
+            size + 1, selected, after, offset, count_mode
+        )
+        next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        
+        return {
+            "documents": [{field: row[field] for field in selected} for row in rows],
+            "total": total,
+            "total_is_estimate": total_is_estimate,
+            "next_cursor": next_cursor
+        }
 
     async def get_document(self, doc_id: UUID) -> Optional[Document]:
         """Lấy document theo ID"""
         return await db_manager.get_document(doc_id)
 
     async def update_document(self, doc_id: UUID, content: str = None, metadata: Dict = None) -> bool:
-        """Cập nhật document"""
-        return await db_manager.update_document(doc_id, content, metadata)
-
-    async def delete_document(self, doc_id: UUID) -> bool:
-        """Xóa document và file trong file system"""
-        # Get document info first
+        """Cập nhật document - content mới được re-chunk và re-embed incrementally"""
+        if content is None:
+            return await db_manager.update_document(doc_id, content, metadata)
+        
         document = await self.get_document(doc_id)
         if not document:
             return False
         
-        # Delete from database (including chunks)
-        success = await db_manager.delete_document(doc_id)
+        if document.status != FileStatus.COMPLETED:
+            # Document chưa được index - worker sẽ chunk content mới
+            return await db_manager.update_document(doc_id, content, metadata)
         
-        if success:
-            # Delete file from file system
-            from utils.file_utils import delete_file_safely
-            file_path = document.metadata.get("file_path")
-            if file_path:
-                delete_file_safely(file_path)
-            else:
-                logger.warning(f"No file_path found in metadata for document {doc_id}")
+        return await self.file_processor.reindex_document(document, content, metadata)
+
+    async def delete_document(self, doc_id: UUID) -> bool:
+        """Xóa document và file trong file system"""
+        # Route truyền doc_id dạng str - keys của `deleted` là UUID
+        doc_id = UUID(str(doc_id))
+        deleted = await db_manager.delete_documents([doc_id])
+        if doc_id not in deleted:
+            return False
         
-        return success
+        await corpus_version.bump()
+        await self._delete_files(deleted)
+        return True
 
     async def delete_multiple_documents(self, doc_ids: List[UUID]) -> Dict[str, Any]:
-        """Xóa nhiều documents cùng lúc"""
+        """Xóa nhiều documents bằng một set-based delete, sau đó xóa files song song"""
         results = {
             "successful": [],
             "failed": [],
@@ -69,23 +155,48 @@ class KnowledgeBaseService:
             "total_failed": 0
         }
         
+        # So sánh với keys UUID của `deleted`; id không hợp lệ được báo failed
+        parsed = {}
         for doc_id in doc_ids:
             try:
-                success = await self.delete_document(doc_id)
-                if success:
-                    results["successful"].append(str(doc_id))
-                    results["total_successful"] += 1
-                else:
-                    results["failed"].append(str(doc_id))
-                    results["total_failed"] += 1
-            except Exception as e:
-                logger.error(f"Error deleting document {doc_id}: {e}")
+                parsed[doc_id] = UUID(str(doc_id))
+            except ValueError:
+                parsed[doc_id] = None
+        valid_ids = [doc_uuid for doc_uuid in parsed.values() if doc_uuid is not None]
+        
+        try:
+            deleted = await db_manager.delete_documents(valid_ids)
+        except Exception as e:
+            logger.error(f"Error deleting documents {[str(doc_id) for doc_id in doc_ids]}: {e}")
+            deleted = {}
+        if deleted:
+            await corpus_version.bump()
+        
+        for doc_id in doc_ids:
+            if parsed[doc_id] in deleted:
+                results["successful"].append(str(doc_id))
+                results["total_successful"] += 1
+            else:
                 results["failed"].append(str(doc_id))
                 results["total_failed"] += 1
         
+        await self._delete_files(deleted)
         return results
 
-    async def chat(self, question: str) -> tuple[str, List[Document], int, UUID]:
+    async def _delete_files(self, deleted: Dict[UUID, Optional[str]]):
+        """Xóa files của các documents đã xóa - chạy song song ngoài event loop"""
+        from utils.file_utils import delete_file_safely
+        
+        for doc_id, file_path in deleted.items():
+            if not file_path:
+                logger.warning(f"No file_path found in metadata for document {doc_id}")
+        await asyncio.gather(*(
+            asyncio.to_thread(delete_file_safely, file_path)
+            for file_path in deleted.values() if file_path
+        ))
+
+    async def chat(self, question: str, ef_search: int = None,
+                   search_mode: str = None) -> tuple[str, List[Document], int, UUID]:
         """Chat với knowledge base - optimized version"""
         import time
         from uuid import uuid4
@@ -93,7 +204,9 @@ class KnowledgeBaseService:
         start_time = time.time()
         
         # Search relevant documents
-        relevant_docs = await self.ai_service.search_relevant_documents(question)
+        relevant_docs = await self.ai_service.search_relevant_documents(
+            question, ef_search=ef_search, search_mode=search_mode
+        )
         
         # Generate response
         response = await self.ai_service.generate_response(question, relevant_docs)
@@ -105,8 +218,8 @@ class KnowledgeBaseService:
         return response, relevant_docs, latency_ms, chat_id
 
     async def store_audit_log(self, chat_id: UUID, question: str, response: str, 
-                             retrieved_docs: List[Document], latency_ms: int):
-        """Store audit log với performance metrics"""
+                             retrieved_docs: List[Dict[str, Any]], latency_ms: int, cache_source: str = None):
+        """Store audit log với performance metrics - retrieved_docs là [{"id", "filename"}]"""
         try:
             from model.models import AuditLog
             
@@ -114,11 +227,14 @@ class KnowledgeBaseService:
                 chat_id=chat_id,
                 question=question,
                 response=response,
-                retrieved_docs=[{"id": str(doc.id), "filename": doc.filename} for doc in retrieved_docs],
-                latency_ms=latency_ms
+                retrieved_docs=retrieved_docs,
+                latency_ms=latency_ms,
+                cache_source=cache_source
             )
             
-            await db_manager.insert_audit_log(audit_log)
+            # Buffered - flushed in batches by the background audit writer
+            from .audit_writer import audit_writer
+            await audit_writer.submit(audit_log)
             
         except Exception as e:
             logger.error(f"Error storing audit log: {e}")
@@ -130,4 +246,34 @@ class KnowledgeBaseService:
 
     async def get_audit_log(self, chat_id: UUID) -> Optional[AuditLog]:
         """Lấy audit log theo chat_id"""
-        return await db_manager.get_audit_log(chat_id) 
\ No newline at end of file
+        return await db_manager.get_audit_log(chat_id)
+
+    async def get_audit_rollups(self, start: datetime = None, end: datetime = None) -> List[Any]:
+        """Lấy hourly latency / volume rollups (mặc định 24 giờ gần nhất)"""
+        from datetime import timedelta, timezone
+        # audit_logs lưu naive UTC timestamps
+        start, end = (
+            value.astimezone(timezone.utc).replace(tzinfo=None) if value and value.tzinfo else value
+            for value in (start, end)
+        )
+        end = end or datetime.utcnow()
+        start = start or end - timedelta(hours=24)
+        if start >= end:
+            raise ValueError("start must be before end")
+        return await db_manager.get_audit_rollups(start, end)
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Lấy performance metrics của process"""
+        from .embedding_scheduler import embedding_stats
+        from .embedding_cache import embedding_cache
+        from .audit_writer import audit_writer
+        from .local_vector_index import local_vector_index
+        from .semantic_cache import semantic_cache
+        return {
+            "embeddings": embedding_stats.snapshot(),
+            "embedding_cache": embedding_cache.stats(),
+            "audit_writer": audit_writer.stats(),
+            "local_vector_index": local_vector_index.stats(),
+            "corpus_version": corpus_version.stats(),
+            "semantic_cache": semantic_cache.stats()
+        }
@@ -0,0 +1,310 @@
+import asyncio
+import copy
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from config.settings import settings
+from dbconnection.database import db_manager
+from dbconnection.document_repository import DocumentRepository
+from model.models import Document
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "snapshot.lock"
+# Không compact liên tục khi snapshot còn nhỏ
+COMPACT_MIN_CHANGES = 1000
+# Files của snapshot cũ được giữ lại một lúc cho processes vừa đọc manifest
+STALE_FILE_GRACE = 600
+
+CHUNK_FIELDS = ("id", "document_id", "chunk_index", "content", "metadata", "status", "filename")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes của k scores lớn nhất (bỏ qua -inf)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.isfinite(scores[top])]
+
+
+class _IndexState:
+    """Snapshot (memory-mapped) + delta trong memory - không sửa sau khi tạo, search đọc từ thread khác"""
+
+    def __init__(self, xmin: str, vectors: np.ndarray, chunks: List[Dict[str, Any]], vectors_file: str = None,
+                 alive: np.ndarray = None, delta: Dict[UUID, Tuple[np.ndarray, Dict[str, Any]]] = None,
+                 positions: Dict[UUID, int] = None):
+        self.xmin = xmin
+        self.vectors = vectors
+        self.chunks = chunks
+        self.vectors_file = vectors_file
+        self.positions = positions if positions is not None else {chunk["id"]: i for i, chunk in enumerate(chunks)}
+        self.alive = alive if alive is not None else np.ones(len(chunks), dtype=bool)
+        self.delta = delta or {}
+        self.delta_chunks = [chunk for _, chunk in self.delta.values()]
+        self.delta_vectors = (
+            np.stack([vector for vector, _ in self.delta.values()]) if self.delta
+            else np.empty((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+        )
+
+    @property
+    def size(self) -> int:
+        return int(self.alive.sum()) + len(self.delta)
+
+    @property
+    def changed(self) -> int:
+        return int(len(self.alive) - self.alive.sum()) + len(self.delta)
+
+    def apply(self, xmin: str, chunk_ids: Sequence[UUID], rows: Sequence[Any]) -> "_IndexState":
+        if not chunk_ids:
+            # No changes since the last poll: keep the delta arrays, only advance xmin
+            state = copy.copy(self)
+            state.xmin = xmin
+            return state
+        alive = self.alive.copy()
+        delta = dict(self.delta)
+        for chunk_id in chunk_ids:
+            position = self.positions.get(chunk_id)
+            if position is not None:
+                alive[position] = False
+            delta.pop(chunk_id, None)
+        for row in rows:
+            delta[row['id']] = (_normalize(row['embedding']), {field: row[field] for field in CHUNK_FIELDS})
+        return _IndexState(xmin, self.vectors, self.chunks, self.vectors_file, alive, delta, self.positions)
+
+    def search(self, query: np.ndarray, limit: int) -> List[Tuple[float, Dict[str, Any]]]:
+        hits = []
+        if len(self.chunks):
+            scores = self.vectors @ query
+            scores[~self.alive] = -np.inf
+            hits.extend((float(scores[i]), self.chunks[i]) for i in _top_k(scores, limit))
+        if self.delta:
+            scores = self.delta_vectors @ query
+            hits.extend((float(scores[i]), self.delta_chunks[i]) for i in _top_k(scores, limit))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        # Cosine distance, cùng thang với `embedding <=> $1`
+        return [(1.0 - score, chunk) for score, chunk in hits[:limit]]
+
+
+class LocalVectorIndex:
+    """Exact cosine top-k trong process trên float32 matrix của chunk embeddings.
+
+    Snapshot (vectors .npy + chunks .json) được mmap nên các app processes dùng chung page cache;
+    thay đổi sau snapshot được đọc từ document_chunk_changes và giữ trong delta cho tới lần compact kế tiếp.
+    """
+
+    def __init__(self, directory: str = None, poll_interval: float = None, max_staleness: float = None,
+                 compact_ratio: float = None):
+        self.directory = directory or settings.local_index_dir
+        self.poll_interval = poll_interval or settings.local_index_poll_interval
+        self.max_staleness = max_staleness or settings.local_index_max_staleness
+        self.compact_ratio = compact_ratio or settings.local_index_compact_ratio
+        self._state: Optional[_IndexState] = None
+        self._synced_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+        self.searches = 0
+        self.fallbacks = 0
+        self.snapshots_written = 0
+
+    @property
+    def ready(self) -> bool:
+        """Chỉ dùng index khi đã sync gần đây - nếu không search đi qua database"""
+        return self._state is not None and time.monotonic() - self._synced_at < self.max_staleness
+
+    async def start(self):
+        """Load snapshot (hoặc build từ database) rồi poll change log trong background"""
+        if self._task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            await self._load()
+        except Exception as e:
+            # Search vẫn chạy qua database; polling loop sẽ thử load lại
+            logger.error(f"Local vector index load failed: {e}")
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def search_similar_documents(self, embedding: Sequence[float], limit: int = 5,
+                                       ef_search: int = None) -> List[Document]:
+        """Cùng interface với db_manager.search_similar_documents - search exact nên ef_search không dùng tới"""
+        state = self._state
+        if state is None:
+            raise RuntimeError("Local vector index is not loaded")
+        query = _normalize(embedding)
+        # Matrix-vector product giải phóng GIL - không chặn event loop với corpus lớn
+        hits = await asyncio.to_thread(state.search, query, limit)
+        self.searches += 1
+        return [
+            DocumentRepository._row_to_chunk_document(chunk, {"similarity_score": distance})
+            for distance, chunk in hits
+        ]
+
+    async def refresh(self):
+        """Đổi sang snapshot mới hơn nếu process khác đã ghi, áp dụng change log, compact khi delta lớn"""
+        manifest = self._read_manifest()
+        if self._state is None or (manifest and manifest["vectors"] != self._state.vectors_file
+                                   and int(manifest["xmin"]) > int(self._state.xmin)):
+            await self._load()
+            return
+
+        chunk_ids, rows, xmin = await db_manager.get_chunk_changes(self._state.xmin)
+        self._state = self._state.apply(xmin, chunk_ids, rows)
+        self._synced_at = time.monotonic()
+        if chunk_ids:
+            logger.debug(f"Local vector index applied {len(chunk_ids)} chunk changes")
+
+        if self._state.changed >= max(COMPACT_MIN_CHANGES, self.compact_ratio * len(self._state.chunks)):
+            await self._compact()
+
+    def stats(self) -> Dict[str, Any]:
+        state = self._state
+        return {
+            "ready": self.ready,
+            "chunks": state.size if state else 0,
+            "delta": len(state.delta) if state else 0,
+            "lag_seconds": round(time.monotonic() - self._synced_at, 1) if state else None,
+            "searches": self.searches,
+            "fallbacks": self.fallbacks,
+            "snapshots_written": self.snapshots_written
+        }
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Local vector index refresh failed: {e}")
+
+    async def _load(self):
+        manifest = self._read_manifest()
+        retention = timedelta(days=settings.chunk_change_retention_days)
+        if manifest and datetime.utcnow() - datetime.fromisoformat(manifest["created_at"]) < retention:
+            try:
+                state = await asyncio.to_thread(self._open_snapshot, manifest)
+            except FileNotFoundError:
+                # Manifest vừa được thay thế và files cũ đã bị dọn
+                state = None
+        else:
+            # Change log đã bị prune qua xmin của snapshot - không replay được
+            state = None
+
+        if state is None:
+            rows, xmin = await db_manager.get_searchable_chunks()
+            vectors = _normalize(np.stack([row['embedding'] for row in rows])) if rows else np.empty((0, 768), np.float32)
+            chunks = [{field: row[field] for field in CHUNK_FIELDS} for row in rows]
+            state = await self._write_snapshot(xmin, vectors, chunks) or _IndexState(xmin, vectors, chunks)
+            logger.info(f"Local vector index built from database: {len(chunks)} chunks")
+        else:
+            logger.info(f"Local vector index loaded snapshot {state.vectors_file}: {len(state.chunks)} chunks")
+
+        # Replay changes committed after the snapshot
+        chunk_ids, rows, xmin = await db_manager.get_chunk_changes(state.xmin)
+        self._state = state.apply(xmin, chunk_ids, rows)
+        self._synced_at = time.monotonic()
+
+    async def _compact(self):
+        state = self._state
+        vectors = np.concatenate([np.asarray(state.vectors[state.alive]), state.delta_vectors])
+        chunks = [chunk for chunk, alive in zip(state.chunks, state.alive) if alive] + state.delta_chunks
+        compacted = await self._write_snapshot(state.xmin, vectors, chunks)
+        if compacted is not None:
+            self._state = compacted
+
+    async def _write_snapshot(self, xmin: str, vectors: np.ndarray, chunks: List[Dict[str, Any]]) -> Optional[_IndexState]:
+        """Ghi snapshot mới rồi mmap lại - None nếu process khác đang ghi"""
+        try:
+            manifest = await asyncio.to_thread(self._write_files, xmin, vectors, chunks)
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            logger.error(f"Could not write local vector index snapshot: {e}")
+            return None
+        self.snapshots_written += 1
+        logger.info(f"Local vector index snapshot {manifest['vectors']} written: {len(chunks)} chunks")
+        return await asyncio.to_thread(self._open_snapshot, manifest)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(MANIFEST_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable local index manifest: {e}")
+            return None
+
+    def _open_snapshot(self, manifest: Dict[str, Any]) -> _IndexState:
+        vectors = np.load(self._path(manifest["vectors"]), mmap_mode="r")
+        with open(self._path(manifest["chunks"])) as f:
+            chunks = json.load(f)
+        for chunk in chunks:
+            chunk["id"] = UUID(chunk["id"])
+            chunk["document_id"] = UUID(chunk["document_id"])
+        return _IndexState(manifest["xmin"], vectors, chunks, manifest["vectors"])
+
+    def _write_files(self, xmin: str, vectors: np.ndarray, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        with open(self._path(LOCK_FILE), "w") as lock:
+            # Một process ghi tại một thời điểm; process khác sẽ nhận snapshot qua manifest
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            stamp = f"{xmin}-{os.getpid()}"
+            manifest = {
+                "vectors": f"vectors-{stamp}.npy",
+                "chunks": f"chunks-{stamp}.json",
+                "xmin": xmin,
+                "count": len(chunks),
+                "created_at": datetime.utcnow().isoformat()
+            }
+            np.save(self._path(manifest["vectors"]), np.ascontiguousarray(vectors, dtype=np.float32))
+            with open(self._path(manifest["chunks"]), "w") as f:
+                json.dump(chunks, f, default=str)
+            tmp = self._path(f"{MANIFEST_FILE}.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp, self._path(MANIFEST_FILE))
+            self._remove_stale_files(manifest)
+        return manifest
+
+    def _remove_stale_files(self, manifest: Dict[str, Any]):
+        # Mmap đang mở vẫn đọc được file đã unlink
+        keep = {manifest["vectors"], manifest["chunks"]}
+        cutoff = time.time() - STALE_FILE_GRACE
+        for path in glob.glob(self._path("vectors-*.npy")) + glob.glob(self._path("chunks-*.json")):
+            if os.path.basename(path) not in keep and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+
+# Global local vector index instance
+local_vector_index = LocalVectorIndex()
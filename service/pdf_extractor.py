@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Extractions đang chạy trên mỗi pool, và các pool đã bị thay thế sau timeout
+_active: Dict[ProcessPoolExecutor, int] = {}
+_retired: Set[ProcessPoolExecutor] = set()
+
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """Process pool dùng chung cho PDF extraction (spawn để không fork event loop / threads)"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.pdf_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def _terminate_executor(executor: ProcessPoolExecutor):
+    """Huỷ pool - các task đang chạy không cancel được nên phải terminate worker processes"""
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _retire_executor(executor: ProcessPoolExecutor):
+    """Thay pool có task bị treo bằng pool mới; pool cũ bị terminate khi các extractions khác trên nó xong"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    _retired.add(executor)
+
+
+def _release_executor(executor: ProcessPoolExecutor):
+    _active[executor] -= 1
+    if _active[executor] == 0:
+        del _active[executor]
+        if executor in _retired:
+            _retired.discard(executor)
+            _terminate_executor(executor)
+
+
+def shutdown_pdf_executor():
+    """Đóng process pool khi process thoát"""
+    global _executor
+    executor, _executor = _executor, None
+    for retired in list(_retired):
+        _terminate_executor(retired)
+    _retired.clear()
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _count_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def _extract_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Chạy trong worker process: extract text của pages [start, end)"""
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [(page_num, reader.pages[page_num].extract_text() or "") for page_num in range(start, end)]
+
+
+def _page_ranges(page_count: int) -> List[Tuple[int, int]]:
+    if page_count < settings.pdf_parallel_min_pages or settings.pdf_workers <= 1:
+        return [(0, page_count)]
+    step = math.ceil(page_count / settings.pdf_workers)
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
+async def extract_pdf_text(file_path: str, timeout: float = None) -> str:
+    """Extract text từ PDF trong process pool, chia pages cho nhiều workers với file lớn"""
+    timeout = timeout or settings.pdf_extraction_timeout
+    loop = asyncio.get_running_loop()
+    executor = get_pdf_executor()
+    _active[executor] = _active.get(executor, 0) + 1
+
+    async def _extract() -> Tuple[int, List[Tuple[int, str]]]:
+        page_count = await loop.run_in_executor(executor, _count_pages, file_path)
+        ranges = _page_ranges(page_count)
+        results = await asyncio.gather(*(
+            loop.run_in_executor(executor, _extract_pages, file_path, start, end)
+            for start, end in ranges
+        ))
+        return page_count, [page for pages in results for page in pages]
+
+    try:
+        page_count, pages = await asyncio.wait_for(_extract(), timeout)
+    except asyncio.TimeoutError:
+        # Chỉ document này thất bại - extractions khác trên pool cũ vẫn chạy tiếp
+        _retire_executor(executor)
+        raise ValueError(f"PDF extraction timed out after {timeout}s")
+    finally:
+        _release_executor(executor)
+
+    # Only add non-empty pages
+    text_content = [
+        f"--- Page {page_num + 1} ---\n{page_text}"
+        for page_num, page_text in pages
+        if page_text.strip()
+    ]
+    full_text = "\n\n".join(text_content)
+
+    if not full_text.strip():
+        raise ValueError("No text content found in PDF")
+
+    logger.info(f"Extracted text from PDF with {page_count} pages")
+    return full_text
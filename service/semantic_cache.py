@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import redis.asyncio as redis
+
+from config.settings import settings
+from .corpus_version import corpus_version
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "semcache"
+_HEADER = struct.Struct("<I")
+
+
+def _pack(embedding: np.ndarray, payload: Dict[str, Any]) -> bytes:
+    """[dims: uint32][float32 embedding][JSON payload]"""
+    return _HEADER.pack(len(embedding)) + embedding.tobytes() + json.dumps(payload).encode("utf-8")
+
+
+def _unpack(value: bytes):
+    (dims,) = _HEADER.unpack_from(value)
+    end = _HEADER.size + dims * 4
+    embedding = np.frombuffer(value, dtype=np.float32, count=dims, offset=_HEADER.size)
+    return embedding, json.loads(value[end:].decode("utf-8"))
+
+
+class SemanticCache:
+    """Answer cache theo độ tương tự của question embeddings, tách theo corpus version.
+
+    Entries nằm trong một Redis list mỗi corpus version (dùng chung giữa processes); mỗi process giữ bản sao
+    dạng float32 matrix và chỉ đọc thêm các entries mới, lookup là một matrix-vector product.
+    Mỗi entry ghi lại retrieval settings của câu trả lời - lookup chỉ so với entries cùng settings.
+    """
+
+    def __init__(self, threshold: float = None, max_entries: int = None, ttl: int = None, redis_client=None):
+        self.enabled = settings.semantic_cache_enabled
+        self.threshold = threshold or settings.semantic_cache_threshold
+        self.max_entries = max_entries or settings.semantic_cache_max_entries
+        self.ttl = ttl or settings.semantic_cache_ttl
+        self.redis_client = redis_client or redis.Redis(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            password=settings.redis_password,
+            decode_responses=False
+        )
+        self._version: Optional[str] = None
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._payloads: List[Dict[str, Any]] = []
+        # Retrieval settings -> rows trong matrix
+        self._rows: Dict[str, List[int]] = {}
+        self._lock = asyncio.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+        self.errors = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def lookup(self, embedding: Sequence[float], retrieval: str) -> Optional[Dict[str, Any]]:
+        """Câu trả lời đã cache (cùng retrieval settings) của câu hỏi gần nhất nếu similarity >= threshold"""
+        if not self.enabled:
+            return None
+        self.lookups += 1
+        try:
+            version = await corpus_version.get()
+            if version is None:
+                return None
+            await self._sync(version)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None
+
+        rows = self._rows.get(retrieval)
+        if not rows:
+            return None
+        query = self._normalize(embedding)
+        if query.shape[0] != self._vectors.shape[1]:
+            return None
+        scores = self._vectors[rows] @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        self.hits += 1
+        return {**self._payloads[rows[best]], "similarity": float(scores[best])}
+
+    async def store(self, embedding: Sequence[float], retrieval: str, question: str, answer: str,
+                    retrieved_docs: List[Dict[str, Any]]):
+        """Lưu câu trả lời cho corpus version hiện tại (bỏ qua khi list đã đủ max_entries)"""
+        if not self.enabled:
+            return
+        try:
+            version = await corpus_version.get()
+            if version is None:
+                return
+            key = f"{KEY_PREFIX}:v{version}"
+            value = _pack(self._normalize(embedding), {
+                "question": question, "answer": answer, "retrieved_docs": retrieved_docs, "retrieval": retrieval
+            })
+            if await self.redis_client.llen(key) >= self.max_entries:
+                return
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.rpush(key, value)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            self.stores += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Semantic cache store failed: {e}")
+
+    async def _sync(self, version: str):
+        """Đọc các entries mới của version hiện tại vào matrix trong process"""
+        async with self._lock:
+            if version != self._version:
+                # Corpus đã thay đổi - entries của version cũ không còn dùng
+                self._version = version
+                self._vectors = np.empty((0, 0), dtype=np.float32)
+                self._payloads = []
+                self._rows = {}
+
+            key = f"{KEY_PREFIX}:v{version}"
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.llen(key)
+                pipe.lrange(key, len(self._payloads), -1)
+                length, values = await pipe.execute()
+            if length < len(self._payloads):
+                # List đã hết TTL và được tạo lại
+                self._vectors = np.empty((0, 0), dtype=np.float32)
+                self._payloads = []
+                self._rows = {}
+                values = await self.redis_client.lrange(key, 0, -1)
+            if values:
+                self._append([_unpack(value) for value in values])
+
+    def _append(self, entries):
+        count = len(self._payloads)
+        dims = entries[0][0].shape[0]
+        if self._vectors.shape[1] != dims:
+            self._vectors = np.empty((0, dims), dtype=np.float32)
+            self._payloads, self._rows, count = [], {}, 0
+        needed = count + len(entries)
+        if needed > self._vectors.shape[0]:
+            # Tăng capacity gấp đôi để append không copy cả matrix mỗi lần
+            grown = np.empty((max(needed, 2 * self._vectors.shape[0], 64), dims), dtype=np.float32)
+            grown[:count] = self._vectors[:count]
+            self._vectors = grown
+        for i, (embedding, payload) in enumerate(entries):
+            self._vectors[count + i] = embedding
+            self._payloads.append(payload)
+            self._rows.setdefault(payload.get("retrieval"), []).append(count + i)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_ratio": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "stores": self.stores,
+            "errors": self.errors,
+            "entries": len(self._payloads)
+        }
+
+
+# Global semantic cache instance
+semantic_cache = SemanticCache()
@@ -0,0 +1,39 @@
+import asyncio
+
+import dbconnection.database as database
+from dbconnection.database import DatabaseManager
+
+
+class _Repo:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def get_document_chunks(self, doc_id):
+        return [self.pool]
+
+
+class _SlowReplicaConnection:
+    """Gán pool rồi mới yield - giống asyncpg.create_pool trong DatabaseConnection.connect"""
+    pool = None
+
+    async def connect(self):
+        self.pool = "replica"
+        await asyncio.sleep(0.05)
+
+
+def test_reads_during_lazy_replica_connect_wait_for_repositories(monkeypatch):
+    monkeypatch.setattr(database, "DocumentRepository", _Repo)
+    monkeypatch.setattr(database, "AuditRepository", _Repo)
+
+    async def scenario():
+        manager = DatabaseManager()
+        manager.document_repo = _Repo("primary")
+        manager.read_connection = _SlowReplicaConnection()
+        first = asyncio.create_task(manager._read("document_repo", "get_document_chunks", 1))
+        await asyncio.sleep(0.01)
+        # Pool đã được gán nhưng connect chưa xong
+        assert manager.read_connection.pool == "replica"
+        second = asyncio.create_task(manager._read("document_repo", "get_document_chunks", 1))
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(scenario()) == [["replica"], ["replica"]]
@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from dbconnection.document_repository import DocumentRepository
+from model.models import CountMode
+
+
+class _FakeConn:
+    def __init__(self, reltuples, count):
+        self.values = {"reltuples": reltuples, "COUNT(*)": count}
+
+    async def fetchval(self, query):
+        return next(value for marker, value in self.values.items() if marker in query)
+
+
+@pytest.mark.parametrize("mode, reltuples, expected", [
+    (CountMode.ESTIMATE, 1200, (1200, True)),
+    # Bảng chưa từng được analyze - fallback về COUNT(*) chính xác
+    (CountMode.ESTIMATE, -1, (42, False)),
+    (CountMode.EXACT, 1200, (42, False)),
+    (CountMode.NONE, 1200, (None, False)),
+])
+def test_count_reports_whether_total_is_estimated(mode, reltuples, expected):
+    conn = _FakeConn(reltuples, 42)
+    assert asyncio.run(DocumentRepository._count_documents(conn, mode)) == expected
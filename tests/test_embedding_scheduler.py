@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+from langchain_google_genai._common import GoogleGenerativeAIError
+
+from service.embedding_scheduler import EmbeddingScheduler, EmbeddingStats, is_retryable_error
+
+
+def _wrapped(error: Exception) -> Exception:
+    """Giống GoogleGenerativeAIEmbeddings._embed: raise GoogleGenerativeAIError(...) from e"""
+    try:
+        try:
+            raise error
+        except Exception as e:
+            raise GoogleGenerativeAIError(f"Error embedding content: {e}") from e
+    except GoogleGenerativeAIError as wrapper:
+        return wrapper
+
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.TooManyRequests("quota"),
+    google_exceptions.ServiceUnavailable("down"),
+    google_exceptions.InternalServerError("boom"),
+    ConnectionError("reset"),
+])
+def test_wrapped_transient_errors_are_retryable(error):
+    assert is_retryable_error(error)
+    assert is_retryable_error(_wrapped(error))
+
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.InvalidArgument("bad request"),
+    google_exceptions.PermissionDenied("api key"),
+    ValueError("bad input"),
+])
+def test_wrapped_client_errors_are_not_retryable(error):
+    assert not is_retryable_error(error)
+    assert not is_retryable_error(_wrapped(error))
+
+
+def test_implicit_context_is_followed():
+    try:
+        try:
+            raise google_exceptions.TooManyRequests("quota")
+        except Exception:
+            raise RuntimeError("while embedding")
+    except RuntimeError as error:
+        assert is_retryable_error(error)
+
+
+class _Provider:
+    """Batch có text "fail" lỗi ngay (không retry), các batch khác mất `latency` giây"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.finished = 0
+
+    async def aembed_documents(self, texts):
+        if "fail" in texts:
+            raise ValueError("bad input")
+        await asyncio.sleep(self.latency)
+        self.finished += 1
+        return [[1.0] for _ in texts]
+
+
+def test_throughput_uses_wall_time_across_concurrent_calls():
+    stats = EmbeddingStats()
+    scheduler = EmbeddingScheduler(_Provider(0.1), batch_size=10, semaphore=asyncio.Semaphore(8), stats=stats)
+
+    async def scenario():
+        start = time.perf_counter()
+        await asyncio.gather(*(scheduler.embed_documents(["text"] * 20) for _ in range(4)))
+        return time.perf_counter() - start
+
+    wall = asyncio.run(scenario())
+    snapshot = stats.snapshot()
+    assert snapshot["embeddings"] == 80
+    # Cộng dồn thời gian của 4 lần gọi song song sẽ cho ~1/4 throughput thật
+    assert snapshot["embeddings_per_second"] >= 0.8 * 80 / wall
+
+
+def test_failed_batch_cancels_and_awaits_sibling_batches():
+    stats = EmbeddingStats()
+    provider = _Provider(10)
+    scheduler = EmbeddingScheduler(provider, batch_size=1, semaphore=asyncio.Semaphore(8), stats=stats)
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await scheduler.embed_documents(["a", "fail", "b"])
+        # Batch còn lại đã kết thúc (bị huỷ) trước khi lỗi được raise
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return pending
+
+    assert asyncio.run(scenario()) == []
+    assert provider.finished == 0
+    assert stats.snapshot()["embeddings"] == 0
+    assert stats._active == 0
@@ -0,0 +1,62 @@
+import asyncio
+
+from service.embedding_cache import EmbeddingCache
+from service.embedding_service import EmbeddingService
+
+
+class _SlowEmbeddings:
+    model = "fake"
+    task_type = "retrieval_document"
+
+    def __init__(self):
+        self.calls = 0
+        self.started = asyncio.Event()
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        self.started.set()
+        await asyncio.sleep(0.05)
+        return [1.0, 0.0]
+
+    async def aembed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+
+def _service(embeddings) -> EmbeddingService:
+    service = EmbeddingService(embeddings)
+    service.cache = EmbeddingCache(redis_client=object())
+    service.cache.enabled = False
+    return service
+
+
+def test_waiter_recovers_when_leader_is_cancelled():
+    """Request đầu bị huỷ trong lúc request thứ hai đang chờ cùng câu hỏi"""
+    async def scenario():
+        embeddings = _SlowEmbeddings()
+        service = _service(embeddings)
+        leader = asyncio.create_task(service.generate_embedding("What is RAG?"))
+        await embeddings.started.wait()
+        waiter = asyncio.create_task(service.generate_embedding("what is  rag?"))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        embedding = await asyncio.wait_for(waiter, timeout=1)
+        assert leader.cancelled()
+        return embedding, embeddings.calls, service._pending_queries
+
+    embedding, calls, pending = asyncio.run(scenario())
+    assert embedding == [1.0, 0.0]
+    assert calls == 2
+    assert pending == {}
+
+
+def test_concurrent_identical_questions_share_one_call():
+    async def scenario():
+        embeddings = _SlowEmbeddings()
+        service = _service(embeddings)
+        results = await asyncio.gather(*(service.generate_embedding("What is RAG?") for _ in range(3)))
+        return results, embeddings.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == [[1.0, 0.0]] * 3
+    assert calls == 1
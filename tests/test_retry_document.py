@@ -0,0 +1,60 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from model.models import Document, FileStatus
+from service import knowledge_base_service as kb_module
+from service.knowledge_base_service import DocumentStateError, KnowledgeBaseService
+
+
+class _FakeDb:
+    def __init__(self):
+        self.statuses = []
+
+    async def update_document_status(self, doc_id, status):
+        self.statuses.append(status)
+
+
+def _service(monkeypatch, document):
+    service = KnowledgeBaseService()
+    enqueued = []
+
+    async def get_document(doc_id):
+        return document
+
+    async def enqueue_document(doc):
+        enqueued.append(doc.id)
+
+    monkeypatch.setattr(service, "get_document", get_document)
+    monkeypatch.setattr(service.file_processor, "enqueue_document", enqueue_document)
+    monkeypatch.setattr(kb_module, "db_manager", _FakeDb())
+    return service, enqueued
+
+
+@pytest.mark.parametrize("status", [FileStatus.COMPLETED, FileStatus.PENDING, FileStatus.PROCESSING])
+def test_retry_rejects_documents_that_have_not_failed(monkeypatch, status):
+    document = Document(id=uuid4(), filename="a.txt", content="", file_size=1, status=status)
+    service, enqueued = _service(monkeypatch, document)
+
+    with pytest.raises(DocumentStateError):
+        asyncio.run(service.retry_document_processing(document.id))
+    assert enqueued == []
+
+
+def test_retry_rejects_linked_duplicates(monkeypatch):
+    document = Document(id=uuid4(), filename="a.txt", content="", file_size=1, status=FileStatus.FAILED,
+                        duplicate_of=uuid4())
+    service, enqueued = _service(monkeypatch, document)
+
+    with pytest.raises(DocumentStateError):
+        asyncio.run(service.retry_document_processing(document.id))
+    assert enqueued == []
+
+
+def test_retry_requeues_failed_document(monkeypatch):
+    document = Document(id=uuid4(), filename="a.txt", content="", file_size=1, status=FileStatus.FAILED)
+    service, enqueued = _service(monkeypatch, document)
+
+    assert asyncio.run(service.retry_document_processing(document.id)) is document
+    assert enqueued == [document.id]
@@ -0,0 +1,66 @@
+import asyncio
+
+from service import semantic_cache as semantic_cache_module
+from service.semantic_cache import SemanticCache
+
+
+class _FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    async def execute(self):
+        return [await getattr(self.redis_client, name)(*args) for name, args in self.calls]
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.lists = {}
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    async def lrange(self, key, start, end):
+        values = self.lists.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    async def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    async def expire(self, key, ttl):
+        return True
+
+
+def test_lookup_only_matches_entries_with_same_retrieval_settings(monkeypatch):
+    async def version():
+        return "1"
+
+    monkeypatch.setattr(semantic_cache_module.corpus_version, "get", version)
+
+    async def scenario():
+        cache = SemanticCache(threshold=0.9, max_entries=100, ttl=60, redis_client=_FakeRedis())
+        cache.enabled = True
+        await cache.store([1.0, 0.0], "vector:40", "q", "vector answer", [])
+        await cache.store([1.0, 0.0], "hybrid:40:1.0:1.0", "q", "hybrid answer", [])
+        return (
+            await cache.lookup([1.0, 0.01], "vector:40"),
+            await cache.lookup([1.0, 0.01], "hybrid:40:1.0:1.0"),
+            await cache.lookup([1.0, 0.01], "vector:200")
+        )
+
+    vector_hit, hybrid_hit, miss = asyncio.run(scenario())
+    assert vector_hit["answer"] == "vector answer"
+    assert hybrid_hit["answer"] == "hybrid answer"
+    assert miss is None
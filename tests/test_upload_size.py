@@ -0,0 +1,30 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from api.routes import APIRoutes
+from config.settings import settings
+
+
+class _FileProcessor:
+    async def validate_file(self, filename, file_size):
+        return True, "File is valid"
+
+
+def test_streamed_oversize_upload_returns_413(tmp_path, monkeypatch):
+    """Upload không có Content-Length vượt limit khi stream - cùng 413 như middleware"""
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "max_file_size", 1024)
+    monkeypatch.setattr(settings, "upload_chunk_size", 256)
+    routes = APIRoutes(SimpleNamespace(file_processor=_FileProcessor()))
+    upload = UploadFile(io.BytesIO(b"x" * 4096), filename="big.txt")
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(routes.upload_file(None, upload))
+
+    assert exc_info.value.status_code == 413
+    # File ghi dở đã bị xóa
+    assert list(tmp_path.iterdir()) == []
@@ -1,17 +1,28 @@
 from .file_utils import (
+    FileTooLargeError,
     create_upload_directory,
     generate_safe_filename,
+    compute_text_hash,
+    normalize_question,
     get_file_path,
     delete_file_safely,
     validate_file_extension,
-    validate_file_size
+    validate_file_size,
+    save_upload_file
 )
+from .pagination import encode_cursor, decode_cursor
 
 __all__ = [
+    'FileTooLargeError',
     'create_upload_directory',
     'generate_safe_filename',
+    'compute_text_hash',
+    'normalize_question',
     'get_file_path',
     'delete_file_safely',
     'validate_file_extension',
-    'validate_file_size'
+    'validate_file_size',
+    'save_upload_file',
+    'encode_cursor',
+    'decode_cursor'
 ] 
\ No newline at end of file
@@ -1,11 +1,19 @@
 import os
+import hashlib
 import logging
 from datetime import datetime
 from typing import Optional
+from uuid import uuid4
+
+import aiofiles
 
 logger = logging.getLogger(__name__)
 
 
+class FileTooLargeError(ValueError):
+    """Upload vượt quá max_file_size - API trả về 413"""
+
+
 def create_upload_directory(upload_dir: str) -> None:
     """Tạo thư mục upload nếu chưa tồn tại"""
     try:
@@ -20,7 +28,18 @@ def generate_safe_filename(original_filename: str) -> str:
     """Tạo tên file an toàn"""
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     safe_filename = "".join(c for c in original_filename if c.isalnum() or c in ('.-_')).rstrip()
-    return f"{timestamp}_{safe_filename}"
+    # Random suffix: cùng tên file upload song song trong cùng một giây không ghi đè nhau
+    return f"{timestamp}_{uuid4().hex[:8]}_{safe_filename}"
+
+
+def compute_text_hash(text: str) -> str:
+    """SHA-256 của text (UTF-8)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """Chuẩn hóa câu hỏi cho cache keys: gộp whitespace, không phân biệt hoa/thường"""
+    return " ".join(question.split()).casefold()
 
 
 def get_file_path(upload_dir: str, filename: str) -> str:
@@ -51,4 +70,27 @@ def validate_file_extension(filename: str, supported_extensions: set) -> bool:
 
 def validate_file_size(file_size: int, max_size: int) -> bool:
     """Validate file size"""
-    return file_size <= max_size 
\ No newline at end of file
+    return file_size <= max_size
+
+
+async def save_upload_file(upload_file, file_path: str, max_size: int,
+                           chunk_size: int = 1024 * 1024) -> tuple[int, str]:
+    """Stream upload xuống disk theo chunks, trả về (file_size, sha256) - FileTooLargeError nếu vượt max_size"""
+    sha256 = hashlib.sha256()
+    file_size = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as f:
+            while True:
+                chunk = await upload_file.read(chunk_size)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise FileTooLargeError(f"File size exceeds limit of {max_size} bytes")
+                sha256.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        # Không để lại file ghi dở
+        delete_file_safely(file_path)
+        raise
+    return file_size, sha256.hexdigest()
@@ -0,0 +1,72 @@
+"""
+Ingestion worker entry point.
+
+    python worker.py                 # một worker process
+    python worker.py --processes 4   # 4 worker processes độc lập
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run_worker():
+    """Kết nối database và chạy worker cho tới khi nhận SIGINT/SIGTERM"""
+    from dbconnection.database import db_manager
+    from service.audit_maintenance import AuditMaintenance
+    from service.ingestion_worker import IngestionWorker
+    from service.pdf_extractor import shutdown_pdf_executor
+
+    await db_manager.connect()
+    worker = IngestionWorker()
+    # Audit partitions / rollups; an advisory lock keeps it to one process at a time
+    maintenance = AuditMaintenance()
+
+    def stop():
+        worker.stop()
+        maintenance.stop()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+
+    try:
+        await asyncio.gather(worker.run(), maintenance.run())
+    finally:
+        shutdown_pdf_executor()
+        await db_manager.disconnect()
+
+
+def main_process():
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Knowledge base ingestion worker")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        main_process()
+    else:
+        processes = [
+            multiprocessing.Process(target=main_process, name=f"ingestion-worker-{i}")
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        # Forward SIGTERM để các worker dừng gracefully
+        signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+        logger.info(f"Started {len(processes)} worker processes")
+        for process in processes:
+            process.join()